@@ -2,10 +2,17 @@ from __future__ import annotations
 from dataclasses import dataclass, field
 from typing import List, Tuple, Optional, Dict
 from math import log, sqrt
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+import argparse
 import random
 import time
 
-from Evaluate_Vivado import Evaluate_main
+import numpy as np
+
+from array_tree import ROOT, ArrayTree
+from snapshot import DEFAULT_EVERY, DEFAULT_PATH, Snapshotter
+from surrogate import SKIP, Decision, Surrogate
+from valuate_Vivado import Evaluate_cached, Evaluate_racing
 
 class VivadoOptimizationActions:
     def __init__(self):
@@ -79,7 +86,7 @@ class Node:
     action: Optional[Tuple[int, int]] = None  
     children: Dict[Tuple[int, int], "Node"] = field(default_factory=dict)
     untried: List[Tuple[int, int]] = field(default_factory=list)
-    visits: int = 0
+    visits: float = 0
     value_sum: float = 0.0
 
     def q(self) -> float:
@@ -104,6 +111,10 @@ class Rewarder:
         else:
             self._Tavg = self.ema_beta * self._Tavg + (1 - self.ema_beta) * T
 
+    def elapsed_weight(self) -> float:
+        """每多一秒评估耗时，奖励最多下降多少（首次评估前惩罚恒为 0）"""
+        return self.lam / max(self._Tavg, 1e-3) if self._init else 0.0
+
     def penalty(self, T: float) -> float:
         return max(0.0, T / max(self._Tavg, 1e-3) - 1.0)
 
@@ -114,7 +125,9 @@ class Rewarder:
 class MCTS:
     def __init__(self, actions: VivadoOptimizationActions,
                  exploration: float = 1.414, iteration_budget: int = 200,
-                 time_budget: Optional[float] = None, rng: Optional[random.Random] = None):
+                 time_budget: Optional[float] = None, rng: Optional[random.Random] = None,
+                 concurrency: int = 1, virtual_loss: float = 1.0, racing: bool = False, reuse_tree: bool = False,
+                 surrogate=None, evaluator=None):
         assert iteration_budget or time_budget
         self.A = actions
         self.c = exploration
@@ -122,14 +135,41 @@ class MCTS:
         self.time_budget = time_budget
         self.rng = rng or random.Random()
         self.rewarder = Rewarder()
-        self.cache: Dict[Tuple[int, ...], Tuple[int, int]] = {}  # indices tuple -> (faults, timeouts)
+        self.cache: Dict[Tuple[int, ...], Tuple[int, int, float]] = {}  # indices tuple -> (faults, timeouts, elapsed)
+        # concurrency > 1: 同时保持多个 rollout 在评估中，选择路径上施加 virtual loss
+        self.concurrency = concurrency
+        self.virtual_loss = virtual_loss
+        # racing: 先在分层小子集上评估，乐观估计也进不了 top-k 的候选提前淘汰；
+        # 回传时按保真度（已评估样例比例）加权
+        self.racing = racing
+        # reuse_tree: 各 episode 沿用同一棵树（默认每个 episode 新建根节点）
+        self.reuse_tree = reuse_tree
+        self.root = None
+        # 检查点：snapshot.Snapshotter，每 every 次迭代原子保存一次完整状态（含未完成 search 的进度）
+        self.snapshot: Optional[Snapshotter] = None
+        self.progress: Optional[dict] = None
+        # surrogate: 在线代理模型（surrogate.Surrogate；True 用默认参数，dict 为其参数），
+        # 对同一叶节点的多个随机补全打分，只把有希望进 top-k 或不确定的送去真实评估
+        self.move_index = {m: i for i, m in enumerate(self.A.all_moves)}
+        # evaluator: 提供 Evaluate_cached / Evaluate_racing 的对象（如 replay.Replay），默认 valuate_Vivado
+        self.evaluator = evaluator
+        self.surrogate: Optional[Surrogate] = None
+        if surrogate:
+            self.surrogate = Surrogate(1 + len(self.A.all_moves), rng=self.rng,
+                                       **(surrogate if isinstance(surrogate, dict) else {}))
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["snapshot"] = None
+        state["evaluator"] = None
+        return state
 
     def search(self, episode: int, k_best: int = 5) -> List[Tuple[float, str]]:
-        root = Node(indices=[None] * self.A.sequence_len())
-        root.untried = self._gen_untried(root.indices)
-        start = time.perf_counter()
-        it = 0
-        top: List[Tuple[float, str]] = []  
+        if self.concurrency > 1:
+            return self._search_parallel(episode, k_best)
+
+        root, it, top, elapsed = self._begin(episode)
+        start = time.perf_counter() - elapsed
 
         while True:
             if self.iteration_budget and it >= self.iteration_budget:
@@ -138,47 +178,233 @@ class MCTS:
                 break
             it += 1
 
-            node = root
-            indices = list(node.indices)
-
-            # Selection
-            node, indices = self._select(node, indices)
-            # Expansion
-            if (not self._is_terminal(indices)) and (not node.is_fully_expanded()):
-                node, indices = self._expand(node, indices)
-
-
-            full_indices = self._rollout(indices)
+            node, full_indices = self._descend(root)
+            decision = None
+            if self.surrogate is not None:
+                full_indices, decision = self._screen(node, full_indices, self._bar(top, k_best))
             key = tuple(x for x in full_indices)
 
-            t0 = time.perf_counter()
+            if key not in self.cache and decision is not None and decision.verdict == SKIP:
+                # 代理模型判定进不了 top-k：以预测值（降低权重）回传，不做真实评估
+                self._backprop(node, self.surrogate.skip(decision), self.surrogate.weight)
+                self._checkpoint(episode, it, top, start)
+                continue
+
+            # 内存缓存 -> 持久化缓存 -> 完整评估；命中时沿用记录的耗时，不更新 T 均值
             if key in self.cache:
-                faults, timeouts = self.cache[key]
+                faults, timeouts, elapsed = self.cache[key]
+                fidelity = 1.0
             else:
                 tcl_cmd = self.A.tokens_to_tcl(full_indices)
-
-                faults, timeouts = Evaluate_main(episode, tcl_cmd)
-                self.cache[key] = (faults, timeouts)
-            elapsed = time.perf_counter() - t0
-            self.rewarder.update_T(elapsed)
+                result, seconds = self._evaluate_timed(episode, tcl_cmd, top, k_best)
+                faults, timeouts, elapsed, fidelity = self._store(key, result)
+                self._observe(key, faults, timeouts, elapsed, fidelity, decision, seconds)
             reward = self.rewarder.to_reward(faults, timeouts, elapsed)
 
             # Backprop
-            self._backprop(node, reward)
+            self._backprop(node, reward, fidelity)
 
-            # 维护 top-k
-            tcl_cmd = self.A.tokens_to_tcl(full_indices)
-            if len(top) < k_best:
-                top.append((reward, tcl_cmd))
-                top.sort(key=lambda x: x[0], reverse=True)
-            else:
-                if reward > top[-1][0]:
-                    top[-1] = (reward, tcl_cmd)
-                    top.sort(key=lambda x: x[0], reverse=True)
+            # 维护 top-k（只收完整评估的候选）
+            if fidelity >= 1.0:
+                self._update_top(top, reward, full_indices, k_best)
+            self._checkpoint(episode, it, top, start)
+
+        return top
+
+    def _search_parallel(self, episode: int, k_best: int) -> List[Tuple[float, str]]:
+        root, it, top, elapsed = self._begin(episode)
+        start = time.perf_counter() - elapsed
+        pending: Dict[Future, List[Tuple[Node, List[int]]]] = {}
+        inflight: Dict[Tuple[int, ...], Future] = {}  # 相同序列只评估一次
+        screened: Dict[Future, Optional[Decision]] = {}  # 代理模型的判定
+
+        def budget_left() -> bool:
+            if self.iteration_budget and it >= self.iteration_budget:
+                return False
+            if self.time_budget and (time.perf_counter() - start) >= self.time_budget:
+                return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while pending or budget_left():
+                while budget_left() and len(pending) < self.concurrency:
+                    it += 1
+                    node, full_indices = self._descend(root)
+                    decision = None
+                    if self.surrogate is not None:
+                        full_indices, decision = self._screen(node, full_indices, self._bar(top, k_best))
+                    key = tuple(full_indices)
+                    if key not in self.cache and key not in inflight and \
+                            decision is not None and decision.verdict == SKIP:
+                        self._backprop(node, self.surrogate.skip(decision), self.surrogate.weight)
+                        self._checkpoint(episode, it, top, start, pending)
+                        continue
+                    if key in self.cache:
+                        faults, timeouts, elapsed = self.cache[key]
+                        reward = self.rewarder.to_reward(faults, timeouts, elapsed)
+                        self._backprop(node, reward)
+                        self._update_top(top, reward, full_indices, k_best)
+                        self._checkpoint(episode, it, top, start, pending)
+                        continue
+                    self._apply_virtual_loss(node)
+                    if key in inflight:
+                        pending[inflight[key]].append((node, full_indices))
+                        continue
+                    fut = pool.submit(self._evaluate_timed, episode, self.A.tokens_to_tcl(full_indices), top, k_best)
+                    inflight[key] = fut
+                    pending[fut] = [(node, full_indices)]
+                    screened[fut] = decision
+
+                if not pending:
+                    continue
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    waiters = pending.pop(fut)
+                    key = tuple(waiters[0][1])
+                    inflight.pop(key, None)
+                    result, seconds = fut.result()
+                    faults, timeouts, elapsed, fidelity = self._store(key, result)
+                    self._observe(key, faults, timeouts, elapsed, fidelity, screened.pop(fut), seconds)
+                    reward = self.rewarder.to_reward(faults, timeouts, elapsed)
+                    for node, full_indices in waiters:
+                        self._revert_virtual_loss(node)
+                        self._backprop(node, reward, fidelity)
+                        if fidelity >= 1.0:
+                            self._update_top(top, reward, full_indices, k_best)
+                        self._checkpoint(episode, it, top, start, pending)
 
         return top
 
     # ---- 内部方法 ----
+    def _begin(self, episode: int) -> Tuple[Node, int, List[Tuple[float, str]], float]:
+        """(root, it, top, elapsed)：从快照记录的中断处继续，否则开始新的 search"""
+        p, self.progress = self.progress, None
+        if p is not None and p["episode"] == episode:
+            # 快照时仍在评估中的 rollout 未回传，撤销其 virtual loss 后重新计入预算
+            for node in p["inflight"]:
+                self._revert_virtual_loss(node)
+            return self.root, p["it"], p["top"], p["elapsed"]
+        if not self.reuse_tree or self.root is None:
+            self.root = self._new_root()
+        return self.root, 0, [], 0.0
+
+    def _checkpoint(self, episode: int, it: int, top: List[Tuple[float, str]], start: float,
+                    pending: Optional[Dict[Future, List[Tuple[Node, List[int]]]]] = None):
+        if self.snapshot is None or not self.snapshot.tick():
+            return
+        inflight = [node for waiters in (pending or {}).values() for node, _ in waiters]
+        self.progress = {"episode": episode, "it": it - len(inflight), "top": list(top),
+                         "elapsed": time.perf_counter() - start, "inflight": inflight}
+        try:
+            self.snapshot.save(self)
+        finally:
+            self.progress = None
+
+    def _new_root(self) -> Node:
+        root = Node(indices=[None] * self.A.sequence_len())
+        root.untried = self._gen_untried(root.indices)
+        return root
+
+    def _descend(self, root: Node) -> Tuple[Node, List[int]]:
+        node = root
+        indices = list(node.indices)
+
+        # Selection
+        node, indices = self._select(node, indices)
+        # Expansion
+        if (not self._is_terminal(indices)) and (not node.is_fully_expanded()):
+            node, indices = self._expand(node, indices)
+
+        return node, self._rollout(indices)
+
+    def _evaluate(self, episode: int, tcl_cmd: str, top: List[Tuple[float, str]],
+                  k_best: int) -> Tuple[float, float, float, bool, float]:
+        if not self.racing:
+            cached = Evaluate_cached if self.evaluator is None else self.evaluator.Evaluate_cached
+            # 提前结束的上限要覆盖本搜索奖励的耗时惩罚项
+            return cached(episode, tcl_cmd, elapsed_weight=self.rewarder.elapsed_weight()) + (1.0,)
+
+        def promote(faults_upper: float, timeouts_lower: float, elapsed: float) -> bool:
+            # 门槛为当前 top-k 中最差的奖励；耗时取已花费的时间（完整评估只会更长）
+            kept = list(top)    # 评估线程中读取，主线程可能正在排序
+            if len(kept) < k_best:
+                return True
+            return self.rewarder.to_reward(faults_upper, timeouts_lower, elapsed) >= kept[-1][0]
+
+        race = Evaluate_racing if self.evaluator is None else self.evaluator.Evaluate_racing
+        return race(episode, tcl_cmd, promote)
+
+    def _evaluate_timed(self, episode: int, tcl_cmd: str, top: List[Tuple[float, str]],
+                        k_best: int) -> Tuple[Tuple[float, float, float, bool, float], float]:
+        t0 = time.perf_counter()
+        result = self._evaluate(episode, tcl_cmd, top, k_best)
+        return result, time.perf_counter() - t0
+
+    # ---- 代理模型 ----
+    def _bar(self, top: List[Tuple[float, str]], k_best: int) -> Optional[float]:
+        """进入 top-k 需要超过的奖励；top-k 未满时为 None（全部真实评估）"""
+        return top[-1][0] if len(top) >= k_best else None
+
+    def _prefix(self, node: Node) -> List[Optional[int]]:
+        return node.indices
+
+    def _features(self, full_indices: List[int]) -> np.ndarray:
+        """代理模型特征：偏置 + 各阶段参数 one-hot"""
+        x = np.zeros(1 + len(self.A.all_moves))
+        x[0] = 1.0
+        for pos, idx in enumerate(full_indices):
+            x[1 + self.move_index[(pos, idx)]] = 1.0
+        return x
+
+    def _screen(self, node: Node, full_indices: List[int],
+                bar: Optional[float]) -> Tuple[List[int], Decision]:
+        """叶节点的若干随机补全中取上界最高者，并判定是否值得真实评估"""
+        prefix = self._prefix(node)
+        candidates = [full_indices] + [self._rollout(prefix) for _ in range(self.surrogate.candidates - 1)]
+        decision = self.surrogate.decide([self._features(c) for c in candidates], bar)
+        return candidates[decision.index], decision
+
+    def _observe(self, key: Tuple[int, ...], faults: float, timeouts: float, elapsed: float, fidelity: float,
+                 decision: Optional[Decision], seconds: float):
+        if self.surrogate is None or fidelity < 1.0:
+            return
+        reward = self.rewarder.to_reward(faults, timeouts, elapsed)
+        self.surrogate.observe(self._features(list(key)), reward, decision, seconds)
+
+    def _store(self, key: Tuple[int, ...],
+               result: Tuple[float, float, float, bool, float]) -> Tuple[float, float, float, float]:
+        faults, timeouts, elapsed, cached, fidelity = result
+        # 部分评估的结果不进内存缓存，下次选中时再从持久化缓存接着比
+        if fidelity >= 1.0:
+            self.cache[key] = (faults, timeouts, elapsed)
+            if not cached:
+                self.rewarder.update_T(elapsed)
+        return faults, timeouts, elapsed, fidelity
+
+    def _update_top(self, top: List[Tuple[float, str]], reward: float, full_indices: List[int], k_best: int):
+        tcl_cmd = self.A.tokens_to_tcl(full_indices)
+        if len(top) < k_best:
+            top.append((reward, tcl_cmd))
+            top.sort(key=lambda x: x[0], reverse=True)
+        else:
+            if reward > top[-1][0]:
+                top[-1] = (reward, tcl_cmd)
+                top.sort(key=lambda x: x[0], reverse=True)
+
+    def _apply_virtual_loss(self, node: Node):
+        cur = node
+        while cur is not None:
+            cur.visits += 1
+            cur.value_sum -= self.virtual_loss
+            cur = cur.parent
+
+    def _revert_virtual_loss(self, node: Node):
+        cur = node
+        while cur is not None:
+            cur.visits -= 1
+            cur.value_sum += self.virtual_loss
+            cur = cur.parent
+
     def _gen_untried(self, indices: List[Optional[int]]) -> List[Tuple[int, int]]:
         for pos, v in enumerate(indices):
             if v is None:
@@ -219,31 +445,100 @@ class MCTS:
                 filled[pos] = self.rng.randrange(len(self.A.actions[self.A.order[pos]]))
         return [int(x) for x in filled]
 
-    def _backprop(self, node: Node, reward: float):
+    def _backprop(self, node: Node, reward: float, weight: float = 1.0):
         cur = node
         while cur is not None:
-            cur.visits += 1
-            cur.value_sum += reward
+            cur.visits += weight
+            cur.value_sum += weight * reward
             cur = cur.parent
 
     def _is_terminal(self, indices: List[Optional[int]]) -> bool:
         return all(x is not None for x in indices)
 
-# ---------- 4) 入口函数 ----------
-def main_mcts_vivado(episodes: int = 3, iters_per_episode: int = 50, k_best: int = 5):
+class ArrayMCTS(MCTS):
+    """
+    同一搜索流程，树改用 array_tree.ArrayTree（节点为数组下标）：
+    统计量存于预分配的定长类型数组（array.array），未尝试的参数按需生成；
+    每层只有 2-4 个参数，UCT 逐个计算，不经过 NumPy 标量
+    """
+
+    def _new_root(self) -> int:
+        branching = [len(self.A.actions[op]) for op in self.A.order]
+        self.tree = ArrayTree(branching, capacity=(self.iteration_budget or 1023) + 1)
+        return ROOT
+
+    def _descend(self, root: int) -> Tuple[int, List[int]]:
+        t = self.tree
+        node = root
+        while not t.terminal(node) and t.fully_expanded(node):
+            node = t.select_uct(node, self.c)
+        if not t.fully_expanded(node):
+            node = t.expand(node, self.rng)
+        return node, self._rollout(self._prefix(node))
+
+    def _prefix(self, node: int) -> List[Optional[int]]:
+        indices: List[Optional[int]] = [None] * self.A.sequence_len()
+        for pos, idx in enumerate(self.tree.path(node)):
+            indices[pos] = idx
+        return indices
 
-    A = VivadoOptimizationActions()
-    mcts = MCTS(A, iteration_budget=iters_per_episode, exploration=1.414)
+    def _apply_virtual_loss(self, node: int):
+        self.tree.update(node, 1, -self.virtual_loss)
+
+    def _revert_virtual_loss(self, node: int):
+        self.tree.update(node, -1, self.virtual_loss)
 
-    all_results: List[Tuple[float, str]] = []
-    for ep in range(episodes):
+    def _backprop(self, node: int, reward: float, weight: float = 1.0):
+        self.tree.update(node, weight, weight * reward)
+
+
+# ---------- 4) 入口函数 ----------
+def main_mcts_vivado(episodes: int = 3, iters_per_episode: int = 50, k_best: int = 5,
+                     concurrency: int = 1, virtual_loss: float = 1.0, racing: bool = False,
+                     engine: str = "object", reuse_tree: bool = False,
+                     snapshot_path: Optional[str] = None, snapshot_every: int = DEFAULT_EVERY, resume: bool = False,
+                     surrogate=None, evaluator=None):
+    """
+    engine: "object"（Node 树）或 "array"（ArrayMCTS，数组树）
+    reuse_tree: 各 episode 共用一棵树，继承之前 episode 的统计
+    snapshot_path: 每 snapshot_every 次迭代及每个 episode 结束时原子保存完整搜索状态；
+    resume: 从 snapshot_path 的快照继续（episode、树、RNG、奖励 EMA、缓存、top-k 及搜索参数均取自快照），
+            快照不存在时从头开始
+    surrogate: 代理模型预筛 rollout（True 或 surrogate.Surrogate 的参数 dict）
+    evaluator: 替代 valuate_Vivado 的评估接口（如 replay.Replay 离线回放）
+    """
+    A = VivadoOptimizationActions()
+    snap = Snapshotter(snapshot_path, snapshot_every, module="MapTset_Vivado_main") if snapshot_path else None
+    mcts = snap.load() if snap is not None and resume else None
+    if mcts is not None:
+        print(f"[SNAPSHOT] resumed {snapshot_path} at episode {snap.driver['episode'] + 1}")
+    else:
+        if resume:
+            print(f"[SNAPSHOT] no snapshot at {snapshot_path}, starting fresh")
+        engine_cls = ArrayMCTS if engine == "array" else MCTS
+        mcts = engine_cls(A, iteration_budget=iters_per_episode, exploration=1.414,
+                    concurrency=concurrency, virtual_loss=virtual_loss, racing=racing, reuse_tree=reuse_tree,
+                    surrogate=surrogate)
+        mcts.snapshot = snap
+    mcts.evaluator = evaluator
+    driver = snap.driver if snap is not None else {}
+    driver.setdefault("episode", 0)
+    driver.setdefault("results", [])
+
+    all_results: List[Tuple[float, str]] = driver["results"]
+    for ep in range(driver["episode"], episodes):
+        driver["episode"] = ep
         print("=" * 70)
         print(f"[MCTS Vivado] Episode {ep + 1}/{episodes}")
         topk = mcts.search(episode=ep+1, k_best=k_best)
         for rank, (rw, tcl) in enumerate(topk, 1):
             print(f"  #{rank} reward={rw:.4f}\n----- TCL -----\n{tcl.strip()}\n--------------\n")
+        if mcts.surrogate is not None:
+            print(mcts.surrogate.report())
         all_results.extend(topk)
-
+        driver["episode"] = ep + 1
+        if snap is not None:
+            snap.save(mcts)
 
     uniq = {}
     for rw, tcl in all_results:
@@ -262,7 +557,22 @@ def main_mcts_vivado(episodes: int = 3, iters_per_episode: int = 50, k_best: int
 
 if __name__ == "__main__":
 
-    best_cmds = main_mcts_vivado(episodes=1, iters_per_episode=20, k_best=3)
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--episodes", type=int, default=1)
+    ap.add_argument("--iters", type=int, default=20)
+    ap.add_argument("--k-best", type=int, default=3)
+    ap.add_argument("--engine", choices=("object", "array"), default="object")
+    ap.add_argument("--reuse-tree", action="store_true", help="keep the tree across episodes")
+    ap.add_argument("--surrogate", action="store_true", help="pre-screen rollouts with an online reward model")
+    ap.add_argument("--snapshot", default=DEFAULT_PATH, help="snapshot file ('' disables snapshots)")
+    ap.add_argument("--snapshot-every", type=int, default=DEFAULT_EVERY)
+    ap.add_argument("--resume", action="store_true", help="continue from the snapshot")
+    args = ap.parse_args()
+
+    best_cmds = main_mcts_vivado(episodes=args.episodes, iters_per_episode=args.iters, k_best=args.k_best,
+                                 engine=args.engine, reuse_tree=args.reuse_tree, surrogate=args.surrogate,
+                                 snapshot_path=args.snapshot or None,
+                                 snapshot_every=args.snapshot_every, resume=args.resume)
     print("[BEST CMDS]")
     for c in best_cmds:
         print(c)
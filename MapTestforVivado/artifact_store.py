@@ -0,0 +1,310 @@
+"""
+Content-addressed, compressed store for the cases collected on a fault,
+timeout or diff.
+
+The flows used to copytree the whole case directory into
+fault_collection_* / timeout_collection_* / check_collection_* every time a
+case failed, so a case failing under hundreds of configurations was stored
+hundreds of times, mostly identical (rtl.v, testbench, baseline netlist and
+trace).  Instead every file is stored once under its SHA-256, gzip
+compressed, and a failure is one line of failures.jsonl holding references:
+
+    <root>/blobs/<aa>/<sha256>[.gz]   file contents (already compressed
+                                      formats are kept as they are)
+    <root>/trees/<aa>/<sha256>.json   manifest of one case directory
+                                      [{"path", "sha256", "size", "mode"}]
+    <root>/failures.jsonl             one record per collected failure:
+
+    {"id": "3f9c0e1a2b4d5e6f", "kind": "fault", "case": "case17", "collection": "fault_collection_yosys/3",
+     "config": "9a1b2c3d4e5f6a7b", "command": "opt; abc -lut 4;", "stage": "yosys",
+     "error": "Command '...' returned non-zero exit status 134.", "tail": ["..."],
+     "tree": "<sha256>", "files": 12, "bytes": 48213, "time": 1718000000.0}
+
+Files are hashed in place (linked workspace inputs are hashed once per
+process, by inode), and only contents the store has not seen are compressed
+and written, so collecting a failure costs about one read of the changed
+outputs and disk use stays flat over long campaigns.  A failure is turned
+back into a directory on demand:
+
+    python artifact_store.py artifacts_yosys list --kind fault
+    python artifact_store.py artifacts_yosys materialize 3f9c0e1a [--to DIR]
+    python artifact_store.py artifacts_yosys materialize --collection fault_collection_yosys/3
+    python artifact_store.py artifacts_yosys stats
+
+Without --to a failure is written to <collection>/<case>, where copytree
+used to put it.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+import uuid
+
+from eval_cache import normalize_command
+
+
+RECORDS = "failures.jsonl"
+TAIL_LINES = 20
+# 本身已压缩的格式不再压缩
+STORED_AS_IS = (".gz", ".zst", ".zip", ".dcp", ".fst")
+_CHUNK = 1 << 20
+_MEMO_MAX = 200000
+
+
+def failure_stage(e):
+    """Tool a failure came from (first word of the failing command), or None."""
+    cmd = getattr(e, "cmd", None)
+    if isinstance(cmd, (list, tuple)):
+        cmd = cmd[0] if cmd else None
+    if not cmd:
+        return None
+    word = str(cmd).split()[0]
+    return os.path.basename(word).rstrip(":")
+
+
+def failure_tail(e, lines=TAIL_LINES):
+    """Last lines of the tool output carried by a subprocess exception."""
+    text = ""
+    for part in (getattr(e, "output", None), getattr(e, "stderr", None)):
+        if part:
+            text += part.decode(errors="replace") if isinstance(part, bytes) else part
+            text += "\n"
+    return [ln for ln in text.splitlines() if ln.strip()][-lines:]
+
+
+class ArtifactStore:
+
+    def __init__(self, root, compresslevel=6):
+        self.root = os.path.abspath(root)
+        self.compresslevel = compresslevel
+        os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "trees"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._memo = {}         # (dev, inode, size, mtime) -> sha256
+        self._ids = None
+        self.written = 0        # 新写入的文件内容（字节，未压缩）
+        self.reused = 0         # 已有内容，未写入
+
+    # ---- 内容 ----
+    def blob_path(self, digest, name=""):
+        suffix = "" if name.endswith(STORED_AS_IS) else ".gz"
+        return os.path.join(self.root, "blobs", digest[:2], digest + suffix)
+
+    def _find_blob(self, digest):
+        for suffix in (".gz", ""):
+            path = os.path.join(self.root, "blobs", digest[:2], digest + suffix)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _digest(self, path, st):
+        memo_key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        digest = self._memo.get(memo_key)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(_CHUNK), b""):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            with self._lock:
+                if len(self._memo) >= _MEMO_MAX:
+                    self._memo.clear()
+                self._memo[memo_key] = digest
+        return digest
+
+    def put_file(self, path):
+        """Store one file (following links); returns (sha256, size)."""
+        st = os.stat(path)
+        digest = self._digest(path, st)
+        if self._find_blob(digest) is not None:
+            with self._lock:
+                self.reused += st.st_size
+            return digest, st.st_size
+        dst = self.blob_path(digest, path)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.tmp-{uuid.uuid4().hex}"
+        try:
+            with open(path, "rb") as src:
+                out = gzip.open(tmp, "wb", compresslevel=self.compresslevel) if dst.endswith(".gz") \
+                    else open(tmp, "wb")
+                with out:
+                    shutil.copyfileobj(src, out, _CHUNK)
+            os.replace(tmp, dst)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self._lock:
+            self.written += st.st_size
+        return digest, st.st_size
+
+    def put_tree(self, src):
+        """Store every file below src; returns (tree sha256, files, bytes)."""
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(src, followlinks=True):
+            dirnames.sort()
+            for fn in sorted(filenames):
+                path = os.path.join(dirpath, fn)
+                try:
+                    digest, size = self.put_file(path)
+                    mode = stat.S_IMODE(os.stat(path).st_mode)
+                except FileNotFoundError:
+                    continue        # 悬空链接
+                entries.append({"path": os.path.relpath(path, src), "sha256": digest, "size": size, "mode": mode})
+        data = json.dumps(entries, sort_keys=True).encode()
+        digest = hashlib.sha256(data).hexdigest()
+        dst = self._tree_path(digest)
+        if not os.path.exists(dst):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            tmp = f"{dst}.tmp-{uuid.uuid4().hex}"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, dst)
+        return digest, len(entries), sum(e["size"] for e in entries)
+
+    def _tree_path(self, digest):
+        return os.path.join(self.root, "trees", digest[:2], digest + ".json")
+
+    def tree(self, digest):
+        with open(self._tree_path(digest)) as f:
+            return json.load(f)
+
+    # ---- 失败记录 ----
+    def add(self, kind, case, src, collection=None, command=None, error=None, **info):
+        """Store the case directory src and record the failure; returns the record."""
+        tree, files, size = self.put_tree(src)
+        config = hashlib.sha256(normalize_command(command).encode()).hexdigest()[:16] if command else None
+        rid = hashlib.sha256("\0".join(map(str, (kind, case, collection, config, tree))).encode()).hexdigest()[:16]
+        record = {"id": rid, "kind": kind, "case": case, "collection": collection, "config": config,
+                  "command": command}
+        if isinstance(error, BaseException):
+            record.update(stage=failure_stage(error), error=str(error), tail=failure_tail(error))
+        elif error is not None:
+            record["error"] = str(error)
+        record.update(info)
+        record.update(tree=tree, files=files, bytes=size, time=round(time.time(), 3))
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._ids is None:
+                self._ids = {r["id"] for r in self.records()}
+            if rid in self._ids:
+                return record       # 同一配置下同一样例的相同结果已记录
+            self._ids.add(rid)
+            # 单次 O_APPEND 写入，多进程共用同一记录文件也不会交错
+            fd = os.open(os.path.join(self.root, RECORDS), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode())
+            finally:
+                os.close(fd)
+        return record
+
+    def records(self, kind=None, case=None, collection=None):
+        path = os.path.join(self.root, RECORDS)
+        if not os.path.exists(path):
+            return []
+        out = []
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                r = json.loads(line)
+                if (kind is None or r["kind"] == kind) and (case is None or r["case"] == case) \
+                        and (collection is None or r.get("collection") == collection):
+                    out.append(r)
+        return out
+
+    def get(self, rid):
+        """Record by id or unique id prefix."""
+        found = [r for r in self.records() if r["id"].startswith(rid)]
+        if len(found) != 1:
+            raise KeyError(f"artifact store: {len(found)} records match {rid!r}")
+        return found[0]
+
+    def materialize(self, record, dst=None):
+        """Recreate the case directory of a record (or id) at dst (default <collection>/<case>)."""
+        if isinstance(record, str):
+            record = self.get(record)
+        if dst is None:
+            dst = os.path.join(record.get("collection") or ".", record["case"])
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+        os.makedirs(dst)
+        for e in self.tree(record["tree"]):
+            blob = self._find_blob(e["sha256"])
+            if blob is None:
+                raise FileNotFoundError(f"artifact store: missing blob {e['sha256']} for {e['path']}")
+            path = os.path.join(dst, e["path"])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with (gzip.open(blob, "rb") if blob.endswith(".gz") else open(blob, "rb")) as src, \
+                    open(path, "wb") as out:
+                shutil.copyfileobj(src, out, _CHUNK)
+            os.chmod(path, e["mode"])
+        return dst
+
+    def stats(self):
+        records = self.records()
+        logical = sum(r.get("bytes", 0) for r in records)
+        stored = 0
+        blobs = 0
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "blobs")):
+            for fn in filenames:
+                stored += os.path.getsize(os.path.join(dirpath, fn))
+                blobs += 1
+        return {"records": len(records), "blobs": blobs, "logical_bytes": logical, "stored_bytes": stored}
+
+    def report(self):
+        return (f"[ARTIFACTS] {self.root}: wrote {self.written / 1e6:.1f}MB new content, "
+                f"reused {self.reused / 1e6:.1f}MB")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("root", help="store directory, e.g. artifacts_yosys")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ls = sub.add_parser("list")
+    ls.add_argument("--kind", choices=("fault", "timeout", "diff"))
+    ls.add_argument("--case")
+    ls.add_argument("--collection")
+    show = sub.add_parser("show")
+    show.add_argument("id")
+    mat = sub.add_parser("materialize")
+    mat.add_argument("ids", nargs="*")
+    mat.add_argument("--collection", help="every failure recorded for this collection folder")
+    mat.add_argument("--to", help="target directory (one id) or parent directory (several)")
+    sub.add_parser("stats")
+    args = ap.parse_args()
+
+    store = ArtifactStore(args.root)
+    if args.cmd == "list":
+        for r in store.records(args.kind, args.case, args.collection):
+            print(f"{r['id']}  {r['kind']:<7} {r['case']:<24} {r.get('stage') or '-':<9} "
+                  f"{r.get('collection') or '-'}  {(r.get('error') or '')[:80]}")
+    elif args.cmd == "show":
+        r = store.get(args.id)
+        print(json.dumps(r, indent=1))
+        for e in store.tree(r["tree"]):
+            print(f"  {e['size']:>10}  {e['sha256'][:12]}  {e['path']}")
+    elif args.cmd == "materialize":
+        records = [store.get(i) for i in args.ids]
+        if args.collection:
+            records += store.records(collection=args.collection)
+        if not records:
+            ap.error("materialize: no ids and no records for --collection")
+        for r in records:
+            dst = None
+            if args.to:
+                dst = args.to if len(records) == 1 else os.path.join(args.to, f"{r['case']}-{r['id'][:8]}")
+            print(f"[ARTIFACTS] {r['id']} {r['kind']} {r['case']} -> {store.materialize(r, dst)}")
+    else:
+        s = store.stats()
+        ratio = s["logical_bytes"] / s["stored_bytes"] if s["stored_bytes"] else 0.0
+        print(f"[ARTIFACTS] {s['records']} failures, {s['blobs']} blobs, "
+              f"{s['logical_bytes'] / 1e6:.1f}MB as copies, {s['stored_bytes'] / 1e6:.1f}MB stored ({ratio:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Baseline store shared by the Yosys and Vivado harnesses.
+
+The baseline flow (default synthesis + iverilog + vvp) of a test case only
+depends on rtl.v, the testbench and the tools used, so its outputs are cached
+under a key built from (rtl.v hash, testbench hash, tool binaries + versions)
+and reused by every later evaluation of the same case.
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+
+
+_TOOL_IDS = {}
+_TOOL_LOCK = threading.Lock()
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def tool_identity(binary, version_args=("-V",)):
+    """
+    "<resolved binary path>|<first line of the version output>", looked up
+    once per process. Unknown or missing tools still get a stable identity.
+    """
+    path = shutil.which(binary) or binary
+    key = (path, tuple(version_args))
+    with _TOOL_LOCK:
+        if key in _TOOL_IDS:
+            return _TOOL_IDS[key]
+    try:
+        r = subprocess.run([path, *version_args], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                           text=True, timeout=300)
+        lines = [ln.strip() for ln in r.stdout.splitlines() if ln.strip()]
+        version = lines[0] if lines else "unknown"
+    except (OSError, subprocess.SubprocessError):
+        version = "unknown"
+    ident = f"{path}|{version}"
+    with _TOOL_LOCK:
+        _TOOL_IDS[key] = ident
+    return ident
+
+
+class BaselineStore:
+    """
+    One directory per key:
+
+        <root>/<key>/<netlist>      baseline netlist (old_syn_*.v)
+        <root>/<key>/file1.txt      baseline vvp trace
+        <root>/<key>/meta.json      inputs the key was derived from
+        <root>/<key>/verdicts/<fp>  recorded simulation verdict per candidate
+                                    netlist fingerprint
+
+    Entries are written to a temporary directory and renamed into place, so
+    concurrent evaluations never see a half-written baseline.
+    """
+
+    def __init__(self, root, tools, files):
+        self.root = os.path.abspath(root)
+        self.tools = list(tools)
+        self.files = list(files)
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, rtl_path, testbench_path):
+        h = hashlib.sha256()
+        h.update(file_digest(rtl_path).encode())
+        h.update(b"\0")
+        h.update(file_digest(testbench_path).encode())
+        for t in self.tools:
+            h.update(b"\0")
+            h.update(t.encode())
+        return h.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.root, key)
+
+    def fetch(self, key, folder_path):
+        """Copy a cached baseline into folder_path; False on a miss."""
+        src = self.entry(key)
+        if not all(os.path.isfile(os.path.join(src, fn)) for fn in self.files):
+            return False
+        for fn in self.files:
+            shutil.copyfile(os.path.join(src, fn), os.path.join(folder_path, fn))
+        return True
+
+    def meta(self, key):
+        try:
+            with open(os.path.join(self.entry(key), "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def store(self, key, folder_path, **meta):
+        dst = self.entry(key)
+        if os.path.isdir(dst):
+            return dst
+        tmp = os.path.join(self.root, f".tmp-{key}-{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        try:
+            for fn in self.files:
+                shutil.copyfile(os.path.join(folder_path, fn), os.path.join(tmp, fn))
+            meta = dict(meta, tools=self.tools, created=time.time())
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump(meta, f, indent=1)
+            os.rename(tmp, dst)
+        except OSError:
+            # another evaluation stored the same baseline first
+            shutil.rmtree(tmp, ignore_errors=True)
+        return dst
+
+    def verdict(self, key, fingerprint):
+        """Recorded {"verdict": "pass" | "diff", ...} or None."""
+        try:
+            with open(os.path.join(self.entry(key), "verdicts", fingerprint)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def record_verdict(self, key, fingerprint, verdict, **info):
+        folder = os.path.join(self.entry(key), "verdicts")
+        if not os.path.isdir(self.entry(key)):
+            return
+        os.makedirs(folder, exist_ok=True)
+        tmp = os.path.join(folder, f".tmp-{uuid.uuid4().hex}")
+        with open(tmp, "w") as f:
+            json.dump(dict(info, verdict=verdict, created=time.time()), f)
+        os.replace(tmp, os.path.join(folder, fingerprint))
@@ -0,0 +1,68 @@
+"""
+Benchmark: MCTS (Node dataclasses) vs ArrayMCTS (array_tree) on a synthetic
+reward, without running Vivado.  Reports search time and peak traced
+memory (tracemalloc, separate run so tracing does not skew the timing)
+per iteration budget.
+
+    python bench_array_tree.py --iters 1000 5000 20000
+"""
+import argparse
+import hashlib
+import random
+import time
+import tracemalloc
+from typing import Tuple
+
+from MapTset_Vivado_main import MCTS, ArrayMCTS, VivadoOptimizationActions
+
+
+class SyntheticEval:
+    """Deterministic pseudo-result per Tcl command (stands in for Evaluate_cached)."""
+
+    def _evaluate(self, episode, tcl_cmd, top, k_best) -> Tuple[int, int, float, bool, float]:
+        h = hashlib.blake2b(tcl_cmd.encode(), digest_size=4).digest()
+        faults, timeouts = h[0] % 5, h[1] % 3
+        return faults, timeouts, 1.0 + h[2] / 255.0, False, 1.0
+
+
+class SyntheticMCTS(SyntheticEval, MCTS):
+    pass
+
+
+class SyntheticArrayMCTS(SyntheticEval, ArrayMCTS):
+    pass
+
+
+def run(engine_cls, iters: int, seed: int):
+
+    def search():
+        mcts = engine_cls(VivadoOptimizationActions(), iteration_budget=iters, rng=random.Random(seed))
+        top = mcts.search(episode=0, k_best=1)
+        return top[0][0] if top else float("nan")
+
+    t0 = time.perf_counter()
+    best = search()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    search()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iters", type=int, nargs="+", default=[1000, 5000, 20000])
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    print(f"{'engine':<8} {'iters':>7} {'seconds':>9} {'us/iter':>9} {'peak MB':>9} {'best':>7}")
+    for iters in args.iters:
+        for name, cls in (("object", SyntheticMCTS), ("array", SyntheticArrayMCTS)):
+            elapsed, peak, best = run(cls, iters, args.seed)
+            print(f"{name:<8} {iters:>7} {elapsed:>9.2f} {1e6 * elapsed / iters:>9.1f} "
+                  f"{peak / 2 ** 20:>9.2f} {best:>7.4f}")
+
+
+if __name__ == "__main__":
+    main()
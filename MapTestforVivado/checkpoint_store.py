@@ -0,0 +1,141 @@
+"""
+Stage-prefix checkpoint (DCP) store for Vivado candidate flows.
+
+A candidate flow is a list of stages (synth_design ..., opt_design ..., ...).
+After every stage the flow writes a checkpoint keyed by (case key, stage
+prefix), so a later candidate that shares the first k stages opens the
+checkpoint of the longest cached prefix and only runs the remaining stages.
+
+Checkpoints are written by Vivado itself to a temporary name and renamed into
+place with `file rename` once complete, so a killed or failing flow never
+leaves a truncated DCP behind.  The store is bounded by a disk budget; the
+least recently used checkpoints (by mtime, refreshed on every resume) are
+evicted first, except those pinned by a running flow of this process.
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Sequence
+
+from eval_cache import normalize_command
+
+
+DEFAULT_BUDGET_BYTES = 20 * (1 << 30)
+SUFFIX = ".dcp"
+TMP_MARK = ".tmp-"
+
+
+def split_stages(command: str) -> List[str]:
+    """One stage per non-empty line, whitespace-normalized."""
+    return [ln for ln in normalize_command(command).splitlines() if not ln.startswith("#")]
+
+
+class CheckpointStore:
+
+    def __init__(self, root: str, budget_bytes: int = DEFAULT_BUDGET_BYTES):
+        self.root = os.path.abspath(root)
+        self.budget_bytes = budget_bytes
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pinned: Dict[str, int] = {}
+        self.lookups = 0
+        self.stages_total = 0
+        self.stages_reused = 0
+        self.evicted = 0
+
+    @staticmethod
+    def prefix_keys(case_key: str, stages: Sequence[str]) -> List[str]:
+        """Key of every prefix stages[:1], stages[:2], ..."""
+        h = hashlib.sha256(case_key.encode())
+        keys = []
+        for stage in stages:
+            h.update(b"\0")
+            h.update(stage.encode())
+            keys.append(h.copy().hexdigest())
+        return keys
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key + SUFFIX)
+
+    def tmp_path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}{TMP_MARK}{uuid.uuid4().hex}{SUFFIX}")
+
+    @contextmanager
+    def resume(self, keys: Sequence[str]):
+        """
+        Yield (number of stages covered, checkpoint path) of the longest
+        cached prefix, (0, None) if none.  The hit is touched for LRU and
+        pinned against eviction until the block exits.
+        """
+        n, hit = 0, None
+        with self._lock:
+            for i in range(len(keys), 0, -1):
+                p = self.path(keys[i - 1])
+                try:
+                    os.utime(p)
+                except OSError:
+                    continue
+                n, hit = i, p
+                break
+            if hit:
+                self._pinned[hit] = self._pinned.get(hit, 0) + 1
+            self.lookups += 1
+            self.stages_total += len(keys)
+            self.stages_reused += n
+        try:
+            yield n, hit
+        finally:
+            if hit:
+                with self._lock:
+                    self._pinned[hit] -= 1
+                    if not self._pinned[hit]:
+                        del self._pinned[hit]
+
+    def discard(self, paths: Sequence[str]):
+        for p in paths:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def evict(self):
+        """Drop least recently used checkpoints until under budget."""
+        entries = []
+        total = 0
+        for fn in os.listdir(self.root):
+            p = os.path.join(self.root, fn)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            total += st.st_size
+            if TMP_MARK in fn:
+                # 其他进程遗留的临时文件，一天后清理
+                if time.time() - st.st_mtime > 24 * 3600:
+                    entries.append((0.0, st.st_size, p))
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        if total <= self.budget_bytes:
+            return
+        entries.sort()
+        for _, size, p in entries:
+            if total <= self.budget_bytes:
+                break
+            with self._lock:
+                if p in self._pinned:
+                    continue
+                try:
+                    os.remove(p)
+                except OSError:
+                    continue
+                self.evicted += 1
+            total -= size
+
+    def report(self) -> str:
+        with self._lock:
+            ratio = self.stages_reused / self.stages_total if self.stages_total else 0.0
+            return (f"[CHECKPOINT] {self.lookups} flows, reused {self.stages_reused}/{self.stages_total} "
+                    f"stages ({ratio:.0%}), evicted {self.evicted}")
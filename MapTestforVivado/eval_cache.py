@@ -0,0 +1,110 @@
+"""
+Persistent cross-run cache of Evaluate_main results.
+
+Entries are keyed by (normalized command sequence, corpus fingerprint, tool)
+and hold faults / timeouts / diffs / elapsed.  tool covers everything else
+that changes the counts: the tool versions, the comparison mode (miter or
+trace; they count diffs differently) and the timeout policy (StageBudget
+parameters, stage ceiling, rlimits; tool_runner.policy), so changing
+MAPTEST_MITER, MAPTEST_TIMEOUT_*, MAPTEST_STALL_* or MAPTEST_RLIMIT_* starts
+from fresh entries instead of reusing counts from another setting.  The cache is a SQLite
+database in WAL mode with one connection per thread, so several searches (or
+several processes) can read and write it at the same time.  Old entries are
+evicted by age and the least recently used ones by count.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_MAX_AGE_SEC = 30 * 24 * 3600
+EVICT_EVERY = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS evals (
+    key       TEXT PRIMARY KEY,
+    command   TEXT NOT NULL,
+    corpus    TEXT NOT NULL,
+    tool      TEXT NOT NULL,
+    faults    INTEGER NOT NULL,
+    timeouts  INTEGER NOT NULL,
+    diffs     INTEGER NOT NULL,
+    elapsed   REAL NOT NULL,
+    created   REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS evals_last_used ON evals(last_used);
+"""
+
+
+def normalize_command(command):
+    """Whitespace-insensitive form of a Yosys script or a Tcl snippet."""
+    lines = [" ".join(ln.split()) for ln in command.splitlines()]
+    return "\n".join(ln for ln in lines if ln)
+
+
+class EvalCache:
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, max_age_sec=DEFAULT_MAX_AGE_SEC):
+        self.path = os.path.abspath(path)
+        self.max_entries = max_entries
+        self.max_age_sec = max_age_sec
+        self._local = threading.local()
+        self._puts = 0
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+        self.evict()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(command, corpus, tool):
+        h = hashlib.sha256()
+        for part in (normalize_command(command), corpus, tool):
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, key):
+        """(faults, timeouts, diffs, elapsed) or None."""
+        with self._conn() as conn:
+            row = conn.execute("SELECT faults, timeouts, diffs, elapsed, created FROM evals WHERE key = ?",
+                               (key,)).fetchone()
+            if row is None:
+                return None
+            if self.max_age_sec and time.time() - row[4] > self.max_age_sec:
+                conn.execute("DELETE FROM evals WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE evals SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0], row[1], row[2], row[3]
+
+    def put(self, key, command, corpus, tool, faults, timeouts, diffs, elapsed):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO evals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (key, normalize_command(command), corpus, tool,
+                          int(faults), int(timeouts), int(diffs), float(elapsed), now, now))
+        self._puts += 1
+        if self._puts % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        with self._conn() as conn:
+            if self.max_age_sec:
+                conn.execute("DELETE FROM evals WHERE created < ?", (time.time() - self.max_age_sec,))
+            if self.max_entries:
+                conn.execute("DELETE FROM evals WHERE key IN (SELECT key FROM evals ORDER BY last_used DESC "
+                             "LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM evals").fetchone()[0]
@@ -0,0 +1,70 @@
+"""
+Parallel per-case evaluation for diff_check / diff_check_vivado.
+
+Every case of one evaluation runs in its own scratch directory, so
+concurrent tool runs never share syn_*.v / wave_* / file*.txt, and the cases
+are fanned out over a thread pool (the work itself is done by the tool
+subprocesses, so threads are enough to keep every core busy).
+"""
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def default_workers():
+    env = os.environ.get("MAPTEST_WORKERS")
+    if env:
+        return max(1, int(env))
+    return os.cpu_count() or 1
+
+
+def stage_workers(stage, fallback):
+    """Pool size of one pipeline stage: MAPTEST_<STAGE>_WORKERS, else fallback."""
+    env = os.environ.get(f"MAPTEST_{stage.upper()}_WORKERS")
+    if env:
+        return max(1, int(env))
+    return max(1, fallback)
+
+
+def new_scratch(scratch_root, prefix):
+    os.makedirs(scratch_root, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=scratch_root)
+
+
+def run_cases(fn, cases, workers, stop=None):
+    """
+    Call fn(case) for every case and yield (case, result) as they finish.
+    workers <= 1 keeps the old strictly serial behaviour.  Cases start in
+    the given order; once stop() returns True the cases not yet started are
+    cancelled and only those already running are still yielded.
+    """
+    if workers <= 1:
+        for case in cases:
+            if stop is not None and stop():
+                return
+            yield case, fn(case)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fn, case): case for case in cases}
+        stopped = False
+        for fut in as_completed(futures):
+            if fut.cancelled():
+                continue
+            yield futures[fut], fut.result()
+            if not stopped and stop is not None and stop():
+                stopped = True
+                for f in futures:
+                    f.cancel()
+
+
+class CaseLog:
+    """print()-compatible buffer so the lines of one case stay together."""
+
+    def __init__(self):
+        self.lines = []
+
+    def __call__(self, *args):
+        self.lines.append(" ".join(str(a) for a in args))
+
+    def text(self):
+        return "\n".join(self.lines)
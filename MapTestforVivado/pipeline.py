@@ -0,0 +1,172 @@
+"""
+Two-stage evaluation pipeline: synthesis pool -> bounded queue -> simulation pool.
+
+Synthesis (Yosys / Vivado) is slow, memory-hungry and, for Vivado, bound by
+licenses; iverilog + vvp + compare is cheap.  Running both back to back per
+case sizes the two steps together.  Here every case first goes through
+first(case) on one of synth_workers threads.  When that returns Next(fn),
+fn is queued for one of sim_workers threads; otherwise the returned value is
+the case's final result (skip, synthesis fault / timeout).
+
+The queue between the pools holds at most depth cases, so synthesis cannot
+run arbitrarily far ahead of simulation (scratch directories of synthesized
+but not yet simulated cases pile up otherwise); a synthesis worker blocks
+until there is room.  Synthesis of case N+1 overlaps with simulation of
+case N.
+
+PipelineStats reports per-pool utilisation (busy time / (workers * wall)),
+the time synthesis spent blocked on a full queue, and the queue depth
+(mean over time and maximum), which is what the split is tuned by:
+
+    [PIPELINE] synth 4x util 97%, sim 8x util 31%, queue avg 0.4 max 3/16, synth blocked 0.0s
+"""
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+
+@dataclass
+class Next:
+    """Returned by the synthesis step: run fn() on the simulation pool."""
+    fn: Callable[[], Any]
+
+
+class PipelineStats:
+
+    def __init__(self, synth_workers, sim_workers, depth):
+        self._lock = threading.Lock()
+        self.synth_workers = synth_workers
+        self.sim_workers = sim_workers
+        self.depth = depth
+        self.synth_busy = 0.0
+        self.sim_busy = 0.0
+        self.blocked = 0.0
+        self.max_depth = 0
+        self._depth_area = 0.0
+        self._depth = 0
+        self._changed = self.start = time.monotonic()
+        self.end = None
+
+    def busy(self, stage, seconds):
+        with self._lock:
+            setattr(self, stage, getattr(self, stage) + seconds)
+
+    def queued(self, delta):
+        with self._lock:
+            now = time.monotonic()
+            self._depth_area += self._depth * (now - self._changed)
+            self._changed = now
+            self._depth += delta
+            self.max_depth = max(self.max_depth, self._depth)
+
+    def finish(self):
+        self.queued(0)
+        self.end = time.monotonic()
+
+    def report(self):
+        with self._lock:
+            wall = max((self.end or time.monotonic()) - self.start, 1e-9)
+            synth = self.synth_busy / (self.synth_workers * wall)
+            sim = self.sim_busy / (self.sim_workers * wall)
+            return (f"[PIPELINE] synth {self.synth_workers}x util {synth:.0%}, "
+                    f"sim {self.sim_workers}x util {sim:.0%}, "
+                    f"queue avg {self._depth_area / wall:.1f} max {self.max_depth}/{self.depth}, "
+                    f"synth blocked {self.blocked:.1f}s")
+
+
+def run(first, cases, synth_workers, sim_workers, depth=None, stop=None, stats=None):
+    """
+    Yield (case, result, seconds) as cases finish; seconds is the time the
+    case spent in either pool (queue waits excluded).  Cases start in the
+    given order; once stop() returns True no further case starts synthesis,
+    those already started are still finished and yielded.
+    """
+    synth_workers = max(1, synth_workers)
+    sim_workers = max(1, sim_workers)
+    if depth is None:
+        depth = 2 * sim_workers
+    if stats is None:
+        stats = PipelineStats(synth_workers, sim_workers, depth)
+
+    todo = iter(list(cases))
+    todo_lock = threading.Lock()
+    handoff = queue.Queue(maxsize=max(1, depth))
+    results = queue.Queue()
+    stopped = threading.Event()
+
+    def take():
+        with todo_lock:
+            if stopped.is_set():
+                return None
+            return next(todo, None)
+
+    def synth_worker():
+        while True:
+            case = take()
+            if case is None:
+                return
+            t0 = time.monotonic()
+            try:
+                r = first(case)
+            except BaseException as e:     # 交给调用方抛出
+                results.put((case, e, 0.0))
+                continue
+            spent = time.monotonic() - t0
+            stats.busy("synth_busy", spent)
+            if isinstance(r, Next):
+                t1 = time.monotonic()
+                handoff.put((case, r.fn, spent))
+                stats.busy("blocked", time.monotonic() - t1)
+                stats.queued(+1)
+            else:
+                results.put((case, r, spent))
+
+    def sim_worker():
+        while True:
+            item = handoff.get()
+            if item is None:
+                return
+            stats.queued(-1)
+            case, fn, spent = item
+            t0 = time.monotonic()
+            try:
+                r = fn()
+            except BaseException as e:
+                r = e
+            elapsed = time.monotonic() - t0
+            stats.busy("sim_busy", elapsed)
+            results.put((case, r, spent + elapsed))
+
+    synth = [threading.Thread(target=synth_worker, daemon=True) for _ in range(synth_workers)]
+    sim = [threading.Thread(target=sim_worker, daemon=True) for _ in range(sim_workers)]
+    done = object()
+
+    def finisher():
+        for t in synth:
+            t.join()
+        for _ in sim:
+            handoff.put(None)
+        for t in sim:
+            t.join()
+        stats.finish()
+        results.put(done)
+
+    for t in synth + sim:
+        t.start()
+    threading.Thread(target=finisher, daemon=True).start()
+
+    try:
+        while True:
+            item = results.get()
+            if item is done:
+                return
+            case, r, seconds = item
+            if isinstance(r, BaseException):
+                raise r
+            yield case, r, seconds
+            if stop is not None and not stopped.is_set() and stop():
+                stopped.set()
+    finally:
+        stopped.set()
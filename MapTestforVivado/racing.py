@@ -0,0 +1,112 @@
+"""
+Multi-fidelity (racing) evaluation of one candidate over the test corpus.
+
+The corpus is put in a fixed stratified order: cases are sorted by rtl.v
+size, cut into strata and interleaved round-robin, so every prefix of the
+order covers small and large designs alike.  Rungs are growing prefixes of
+that order (by default 10%, 30% and 100% of the corpus).
+
+A candidate is evaluated rung by rung, each rung only on the cases it adds.
+After every rung a Hoeffding bound extrapolates the partial fault / timeout
+counts to the full corpus; if even the optimistic bound (most faults, fewest
+timeouts) cannot reach the caller's threshold, the race stops there and the
+candidate is reported with its fidelity, the fraction of the corpus seen.
+"""
+import math
+import os
+import random
+from dataclasses import dataclass
+
+
+DEFAULT_RUNGS = (0.1, 0.3, 1.0)
+DEFAULT_DELTA = 0.05
+DEFAULT_STRATA = 4
+
+
+def stratified_order(base_dir, subdir, strata=DEFAULT_STRATA, seed=0):
+    """Case folders (with <subdir>/rtl.v) in stratified, reproducible order."""
+    sized = []
+    for folder in sorted(os.listdir(base_dir)):
+        rtl = os.path.join(base_dir, folder, subdir, "rtl.v")
+        if os.path.isfile(rtl):
+            sized.append((os.path.getsize(rtl), folder))
+    sized.sort()
+    strata = max(1, min(strata, len(sized)))
+    rng = random.Random(seed)
+    groups = []
+    for i in range(strata):
+        group = [folder for _, folder in sized[i * len(sized) // strata:(i + 1) * len(sized) // strata]]
+        rng.shuffle(group)
+        groups.append(group)
+    order = []
+    for i in range(max((len(g) for g in groups), default=0)):
+        order.extend(g[i] for g in groups if i < len(g))
+    return order
+
+
+def rung_sizes(total, fractions=DEFAULT_RUNGS):
+    sizes = []
+    for frac in fractions:
+        n = min(total, max(1, math.ceil(frac * total)))
+        if not sizes or n > sizes[-1]:
+            sizes.append(n)
+    if total and (not sizes or sizes[-1] < total):
+        sizes.append(total)
+    return sizes
+
+
+def hoeffding_bounds(count, seen, total, delta=DEFAULT_DELTA):
+    """(lower, upper) bound of the full-corpus count from `count` in `seen` cases."""
+    if seen >= total:
+        return float(count), float(count)
+    if seen == 0:
+        return float(count), float(count + total)
+    eps = math.sqrt(math.log(1.0 / delta) / (2.0 * seen))
+    rate = count / seen
+    rest = total - seen
+    return count + rest * max(0.0, rate - eps), count + rest * min(1.0, rate + eps)
+
+
+@dataclass
+class RaceResult:
+    faults: int = 0             # raw counts on the cases seen
+    timeouts: int = 0
+    diffs: int = 0
+    seen: int = 0
+    total: int = 0
+    elapsed: float = 0.0
+    cached: bool = True         # every rung came from the cache
+
+    @property
+    def fidelity(self):
+        return self.seen / self.total if self.total else 1.0
+
+    def estimate(self):
+        """(faults, timeouts) extrapolated to the full corpus."""
+        if self.seen >= self.total or self.seen == 0:
+            return self.faults, self.timeouts
+        scale = self.total / self.seen
+        return self.faults * scale, self.timeouts * scale
+
+
+def race(order, evaluate_rung, promote=None, fractions=DEFAULT_RUNGS, delta=DEFAULT_DELTA):
+    """
+    evaluate_rung(rung_index, cases) -> (faults, timeouts, diffs, elapsed, cached)
+    promote(faults_upper, timeouts_lower, elapsed_so_far) -> bool; None runs all rungs.
+    """
+    result = RaceResult(total=len(order))
+    start = 0
+    for i, size in enumerate(rung_sizes(len(order), fractions)):
+        f, t, d, elapsed, cached = evaluate_rung(i, order[start:size])
+        result.faults += f
+        result.timeouts += t
+        result.diffs += d
+        result.elapsed += elapsed
+        result.cached = result.cached and cached
+        result.seen = start = size
+        if size < len(order) and promote is not None:
+            _, f_up = hoeffding_bounds(result.faults, size, len(order), delta)
+            t_low, _ = hoeffding_bounds(result.timeouts, size, len(order), delta)
+            if not promote(f_up, t_low, result.elapsed):
+                break
+    return result
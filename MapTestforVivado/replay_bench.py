@@ -0,0 +1,78 @@
+"""
+Benchmark search policies offline against recorded evaluations (replay.Replay),
+without running Vivado.  Every combination of policy / exploration /
+iterations / Rewarder (theta, lam) is run for several seeds; reported are the
+mean real evaluations, simulated wall time and distinct faults found after
+25%, 50% and 100% of the real evaluations of the budget.
+
+    python replay_bench.py eval_cache_vivado.sqlite --policy mcts array random --uct-c 0.7 1.414 --seeds 10
+    python replay_bench.py recorded.jsonl --lam 0 0.2 0.5 --iters 50 200
+"""
+import argparse
+import contextlib
+import os
+import random
+import time
+from typing import List, Tuple
+
+from MapTset_Vivado_main import MCTS, ArrayMCTS, Rewarder, VivadoOptimizationActions
+from replay import Replay
+
+
+def random_search(replay: Replay, actions: VivadoOptimizationActions, iters: int, rng: random.Random):
+    for _ in range(iters):
+        indices = [rng.randrange(len(actions.actions[op])) for op in actions.order]
+        replay.Evaluate_cached(1, actions.tokens_to_tcl(indices))
+
+
+def run(replay: Replay, policy: str, uct_c: float, iters: int, theta: float, lam: float,
+        seed: int) -> Tuple[List[Tuple[float, int]], int]:
+    actions = VivadoOptimizationActions()
+    rng = random.Random(seed)
+    replay.reset()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if policy == "random":
+            random_search(replay, actions, iters, rng)
+        else:
+            engine_cls = ArrayMCTS if policy == "array" else MCTS
+            mcts = engine_cls(actions, exploration=uct_c, iteration_budget=iters, rng=rng, evaluator=replay)
+            mcts.rewarder = Rewarder(theta=theta, lam=lam)
+            mcts.search(episode=1, k_best=5)
+    return [replay.at(max(1, iters * q // 4)) for q in (1, 2, 4)], replay.evals
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("records", help="eval_cache SQLite file or .jsonl recordings")
+    ap.add_argument("--fallback", default="nearest", choices=("nearest", "sample", "zero"))
+    ap.add_argument("--policy", nargs="+", default=["mcts", "random"], choices=("mcts", "array", "random"))
+    ap.add_argument("--uct-c", type=float, nargs="+", default=[1.414])
+    ap.add_argument("--iters", type=int, nargs="+", default=[50])
+    ap.add_argument("--theta", type=float, nargs="+", default=[0.7])
+    ap.add_argument("--lam", type=float, nargs="+", default=[0.2])
+    ap.add_argument("--seeds", type=int, default=5)
+    args = ap.parse_args()
+
+    replay = Replay.load(args.records, args.fallback)
+    print(f"[REPLAY] {len(replay.records)} recorded sequences from {args.records}, fallback {args.fallback}")
+    print(f"{'policy':<7} {'uct_c':>6} {'iters':>6} {'theta':>6} {'lam':>5} {'evals':>7} {'sim h':>7} "
+          f"{'faults@25%':>10} {'@50%':>6} {'@100%':>6} {'runs/min':>9}")
+    for policy in args.policy:
+        tuned = policy != "random"
+        for uct_c in (args.uct_c if tuned else [float("nan")]):
+            for iters in args.iters:
+                for theta in (args.theta if tuned else [float("nan")]):
+                    for lam in (args.lam if tuned else [float("nan")]):
+                        t0 = time.perf_counter()
+                        runs = [run(replay, policy, uct_c, iters, theta, lam, seed) for seed in range(args.seeds)]
+                        per_min = 60 * len(runs) / (time.perf_counter() - t0)
+                        evals = sum(n for _, n in runs) / len(runs)
+                        wall = sum(points[-1][0] for points, _ in runs) / len(runs)
+                        found = [sum(points[i][1] for points, _ in runs) / len(runs) for i in range(3)]
+                        print(f"{policy:<7} {uct_c:>6.3f} {iters:>6} {theta:>6.2f} {lam:>5.2f} {evals:>7.1f} "
+                              f"{wall / 3600:>7.1f} {found[0]:>10.1f} {found[1]:>6.1f} {found[2]:>6.1f} "
+                              f"{per_min:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
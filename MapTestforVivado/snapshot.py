@@ -0,0 +1,98 @@
+"""
+Atomic snapshots of a search campaign (checkpoint / resume).
+
+A snapshot is one pickle holding the driver state (episode, accumulated
+results) and the MCTS object itself: tree, RNG, rewarder EMA, in-memory
+cache, top-k and the progress of an unfinished search().  It is written to
+a temporary file in the same directory, fsynced and renamed over the
+previous one, so the file on disk is always a complete snapshot; a crash
+loses at most `every` iterations.
+
+Evaluation results already live in the persistent caches on disk and are not
+part of the snapshot.  Classes pickled from a script run as __main__ are
+looked up in `module` when the snapshot is loaded from elsewhere.
+
+    MAPTEST_SNAPSHOT        snapshot path (default mcts_snapshot.pkl)
+    MAPTEST_SNAPSHOT_EVERY  iterations between snapshots (default 25, 0: episode ends only)
+"""
+import os
+import pickle
+import sys
+import time
+import uuid
+
+
+DEFAULT_PATH = os.environ.get("MAPTEST_SNAPSHOT", "mcts_snapshot.pkl")
+DEFAULT_EVERY = int(os.environ.get("MAPTEST_SNAPSHOT_EVERY", "25"))
+
+
+class _Unpickler(pickle.Unpickler):
+
+    def __init__(self, f, module):
+        super().__init__(f)
+        self.module = module
+
+    def find_class(self, module, name):
+        main = sys.modules.get("__main__")
+        if module == "__main__" and not hasattr(main, name) and self.module:
+            module = self.module
+        return super().find_class(module, name)
+
+
+def save(path, state):
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{uuid.uuid4().hex}"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load(path, module=None):
+    """The saved state, or None if there is no snapshot at path."""
+    try:
+        with open(path, "rb") as f:
+            return _Unpickler(f, module).load()
+    except FileNotFoundError:
+        return None
+
+
+class Snapshotter:
+    """Saves {"driver": driver, "mcts": mcts}; driver is a dict owned by the entry function."""
+
+    def __init__(self, path=DEFAULT_PATH, every=DEFAULT_EVERY, module=None):
+        self.path = path
+        self.every = every
+        self.module = module
+        self.driver = {}
+        self._count = 0
+
+    def tick(self):
+        """Count one finished iteration; True every `every` iterations."""
+        if not self.every:
+            return False
+        self._count += 1
+        if self._count < self.every:
+            return False
+        self._count = 0
+        return True
+
+    def save(self, mcts):
+        t0 = time.monotonic()
+        save(self.path, {"driver": self.driver, "mcts": mcts})
+        print(f"[SNAPSHOT] {self.path} episode={self.driver.get('episode')} "
+              f"({os.path.getsize(self.path) / 2 ** 20:.1f} MB, {time.monotonic() - t0:.2f}s)")
+
+    def load(self):
+        state = load(self.path, self.module)
+        if state is None:
+            return None
+        self.driver = state["driver"]
+        state["mcts"].snapshot = self
+        return state["mcts"]
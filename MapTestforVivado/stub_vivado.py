@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Scriptable stand-in for `vivado` (batch mode, Tcl mode and -version).
+
+It understands just enough Tcl to drive the MapTest flows: read_verilog,
+write_verilog, open_checkpoint / write_checkpoint, file rename, puts, cd,
+source, the maptest_job protocol of vivado_pool.py and exit.  Every other command is
+accepted and ignored.  The netlist it writes is the RTL it read.
+
+Behaviour is scripted through the environment, each variable being a regex
+matched against every command line executed:
+
+    STUB_VIVADO_CRASH   kill the whole process (like a Vivado crash)
+    STUB_VIVADO_ERROR   raise a Tcl error (the command fails)
+    STUB_VIVADO_HANG    sleep forever
+    STUB_VIVADO_DELAY   seconds to sleep per command (float)
+
+Use it by putting a `vivado` wrapper script on PATH, or by passing
+[sys.executable, "stub_vivado.py"] as vivado_cmd to vivado_pool.VivadoPool.
+"""
+import os
+import re
+import sys
+import time
+
+
+VERSION = "Vivado v2025.1 (stub)"
+
+
+class TclError(Exception):
+    pass
+
+
+class StubVivado:
+
+    def __init__(self):
+        self.design = None
+        self.crash = os.environ.get("STUB_VIVADO_CRASH")
+        self.error = os.environ.get("STUB_VIVADO_ERROR")
+        self.hang = os.environ.get("STUB_VIVADO_HANG")
+        self.delay = float(os.environ.get("STUB_VIVADO_DELAY", "0") or 0)
+
+    def source(self, path):
+        with open(path) as f:
+            for line in f:
+                self.command(line.strip())
+
+    def command(self, line):
+        if not line or line.startswith("#"):
+            return
+        if self.delay:
+            time.sleep(self.delay)
+        if self.crash and re.search(self.crash, line):
+            print(f"Abnormal program termination (stub) in: {line}", flush=True)
+            os._exit(139)
+        if self.hang and re.search(self.hang, line):
+            while True:
+                time.sleep(3600)
+        if self.error and re.search(self.error, line):
+            raise TclError(f"ERROR: [Stub 1-1] {line}")
+
+        words = line.split()
+        cmd, args = words[0], [w.strip("{}") for w in words[1:] if not w.startswith("-")]
+        if cmd == "read_verilog":
+            with open(args[-1]) as f:
+                self.design = f.read()
+        elif cmd == "open_checkpoint":
+            with open(args[-1]) as f:
+                self.design = f.read()
+        elif cmd in ("write_verilog", "write_checkpoint"):
+            if self.design is None:
+                raise TclError(f"ERROR: [Common 17-53] no open design for {cmd}")
+            with open(args[-1], "w") as f:
+                f.write(f"// {VERSION}\n" + self.design)
+        elif cmd == "close_design":
+            if self.design is None:
+                raise TclError("ERROR: no open design")
+            self.design = None
+        elif cmd == "cd":
+            os.chdir(args[-1])
+        elif cmd == "source":
+            self.source(args[-1])
+        elif cmd == "file" and args[:1] == ["rename"]:
+            os.replace(args[-2], args[-1])
+        elif cmd == "puts":
+            print(line[len("puts"):].strip().strip('"'), flush=True)
+        print(f"INFO: [Stub 0-0] {cmd}", flush=True)
+
+    def job(self, line):
+        # maptest_job <id> {<dir>} {<script>}
+        m = re.match(r"maptest_job (\d+) \{([^}]*)\} \{([^}]*)\}", line)
+        job_id, folder, script = m.group(1), m.group(2), m.group(3)
+        rc = 0
+        try:
+            os.chdir(folder)
+            self.source(script)
+        except (TclError, OSError) as e:
+            rc = 1
+            print(f"__MAPTEST_ERR__ {job_id} {e}", flush=True)
+        self.design = None
+        print(f"__MAPTEST_DONE__ {job_id} {rc}", flush=True)
+
+    def repl(self):
+        sys.stdout.write("Vivado% ")
+        sys.stdout.flush()
+        for line in sys.stdin:
+            line = line.strip()
+            if line == "exit":
+                return 0
+            if line.startswith("proc "):
+                pass
+            elif line.startswith("maptest_job "):
+                self.job(line)
+            else:
+                for part in line.split(";"):
+                    part = part.strip()
+                    if part.startswith("puts"):
+                        print(part[len("puts"):].strip(), flush=True)
+                    elif part and part != "flush stdout":
+                        try:
+                            self.command(part)
+                        except TclError as e:
+                            print(e, flush=True)
+            sys.stdout.write("Vivado% ")
+            sys.stdout.flush()
+        return 0
+
+
+def main(argv):
+    stub = StubVivado()
+    if "-version" in argv:
+        print(VERSION)
+        return 0
+    mode = argv[argv.index("-mode") + 1] if "-mode" in argv else "gui"
+    if mode == "batch":
+        try:
+            stub.source(argv[argv.index("-source") + 1])
+        except TclError as e:
+            print(e, flush=True)
+            return 1
+        return 0
+    return stub.repl()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,417 @@
+"""
+Tool subprocesses with adaptive per-stage timeouts and a stall watchdog.
+
+Every stage of every case used to get the same fixed timeout (600 s for
+Yosys, 900 s for Vivado), so a tool hanging inside one pass held a worker
+for the full limit.  The baseline run of a case records how long each of
+its stages took, and StageBudget derives the candidate limits from that:
+
+    timeout = clamp(TIMEOUT_MULT * baseline_seconds, TIMEOUT_FLOOR, ceiling)
+    stall   = clamp(STALL_MULT * baseline_seconds, STALL_FLOOR, timeout)
+
+with the old fixed timeout as the ceiling (and as the limit of stages
+without a recorded baseline).  run() tails the tool output while waiting;
+when no progress line (e.g. Yosys "3.2. Executing OPT_CLEAN pass.") has
+appeared for the stall window the process is killed and Stalled is raised.
+Stalled is a subprocess.TimeoutExpired, so callers count it as a timeout
+exactly like a run that hit the deadline.
+
+The multipliers and floors can be overridden with MAPTEST_TIMEOUT_MULT,
+MAPTEST_TIMEOUT_FLOOR, MAPTEST_STALL_MULT and MAPTEST_STALL_FLOOR.
+
+Every tool is started in its own session (process group).  On timeout the
+whole group is killed, not just the shell of a shell=True command, and any
+process a finished tool left behind is killed with it, so no orphaned
+Vivado helpers or vvp simulations keep eating cores.  Optional resource
+limits are set in the child between fork and exec (preexec_fn), so the tool
+and every process it forks, including a shell=True shell's children, start
+under them:
+
+    MAPTEST_RLIMIT_AS_GB      address space
+    MAPTEST_RLIMIT_CPU_SEC    CPU time; exceeding it counts as a timeout
+    MAPTEST_RLIMIT_FSIZE_GB   size of any file written (runaway traces)
+
+(0 / unset = unlimited).  Peak RSS and CPU time of every stage are taken
+from wait4() and summed per stage in USAGE.  Runs without rusage (jobs on a
+persistent Vivado session) are added with cpu_sec=None: they count in n and
+wall time, but the CPU total covers only the measured runs.
+
+Tool output is never held in memory as a whole.  Both streams are copied,
+undecoded, to a per-stage log in the tool's working directory (yosys.log.gz,
+vvp.log.gz, ...; every run of the stage appends one compressed member headed
+by its command line), and only the last TAIL_LINES lines are kept for error
+reports.  A stdout that is itself a result, like the vvp trace, goes
+straight from the tool into its file.  MAPTEST_TOOL_LOG selects the log
+format: gz (default), zst (needs the zstandard package, else gz), plain or off.
+"""
+import contextlib
+import functools
+import gzip
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Pattern
+
+import spans
+
+try:
+    import resource
+except ImportError:     # 非 Unix 平台：不设资源上限，不统计 rusage
+    resource = None
+
+try:
+    import zstandard
+except ImportError:     # 未安装时 zst 日志退回 gzip
+    zstandard = None
+
+
+TIMEOUT_MULT = float(os.environ.get("MAPTEST_TIMEOUT_MULT", "10"))
+TIMEOUT_FLOOR = float(os.environ.get("MAPTEST_TIMEOUT_FLOOR", "60"))
+STALL_MULT = float(os.environ.get("MAPTEST_STALL_MULT", "5"))
+STALL_FLOOR = float(os.environ.get("MAPTEST_STALL_FLOOR", "30"))
+TAIL_LINES = 20
+# 工具输出日志：gz（默认）/ zst / plain / off
+TOOL_LOG = os.environ.get("MAPTEST_TOOL_LOG", "gz")
+if TOOL_LOG == "zst" and zstandard is None:
+    TOOL_LOG = "gz"
+_LOG_SUFFIX = {"gz": ".gz", "zst": ".zst"}.get(TOOL_LOG, "")
+RLIMIT_AS_BYTES = int(float(os.environ.get("MAPTEST_RLIMIT_AS_GB", "0")) * (1 << 30))
+RLIMIT_CPU_SEC = int(float(os.environ.get("MAPTEST_RLIMIT_CPU_SEC", "0")))
+RLIMIT_FSIZE_BYTES = int(float(os.environ.get("MAPTEST_RLIMIT_FSIZE_GB", "0")) * (1 << 30))
+_POLL_SEC = 0.05
+
+YOSYS_PROGRESS = re.compile(r"^\s*(?:\d+(?:\.\d+)*\. Executing |-- Running command)")
+VIVADO_PROGRESS = re.compile(r"^\s*(?:INFO|WARNING|CRITICAL WARNING|Phase|Start|Finished|Ending)\b")
+
+
+class CpuLimitExceeded(subprocess.TimeoutExpired):
+    """Killed by SIGXCPU (RLIMIT_CPU); counted as a timeout."""
+
+    def __str__(self):
+        return f"Command '{self.cmd}' exceeded the CPU limit of {self.timeout:.0f} seconds"
+
+
+class Stalled(subprocess.TimeoutExpired):
+    """No progress line within the stall window; counted as a timeout."""
+
+    def __str__(self):
+        return f"Command '{self.cmd}' stalled: no progress for {self.timeout:.0f} seconds"
+
+
+@dataclass
+class StageBudget:
+    ceiling: float
+    durations: Dict[str, float] = field(default_factory=dict)     # 基线各阶段耗时（秒）
+
+    def timeout(self, stage: str, scale: float = 1.0) -> float:
+        base = self.durations.get(stage)
+        if base is None:
+            return self.ceiling
+        return min(self.ceiling, max(TIMEOUT_FLOOR, TIMEOUT_MULT * base * scale))
+
+    def stall(self, stage: str, scale: float = 1.0) -> Optional[float]:
+        base = self.durations.get(stage)
+        if base is None:
+            return None
+        return min(self.timeout(stage, scale), max(STALL_FLOOR, STALL_MULT * base * scale))
+
+    @contextlib.contextmanager
+    def measure(self, stage: str):
+        """Record the duration of a (baseline) stage that completes without error."""
+        start = time.monotonic()
+        yield
+        self.durations[stage] = round(time.monotonic() - start, 3)
+
+    def describe(self, *stages: str) -> str:
+        return ", ".join(f"{s} {self.timeout(s):.0f}s" for s in stages)
+
+
+@dataclass
+class Usage:
+    # None: 未测量（常驻会话中的作业，没有单独的 rusage）
+    cpu_sec: Optional[float] = 0.0        # user + sys, including reaped children
+    peak_rss_mb: Optional[float] = 0.0
+    wall_sec: float = 0.0
+
+
+class UsageStats:
+    """Per-stage totals of tool resource usage across one evaluation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, list] = {}
+
+    def add(self, stage: str, usage: Usage):
+        with self._lock:
+            # [次数, 有 rusage 的次数, CPU 合计, 峰值 RSS, 墙钟合计]
+            s = self._stages.setdefault(stage, [0, 0, 0.0, 0.0, 0.0])
+            s[0] += 1
+            if usage.cpu_sec is not None:
+                s[1] += 1
+                s[2] += usage.cpu_sec
+                s[3] = max(s[3], usage.peak_rss_mb or 0.0)
+            s[4] += usage.wall_sec
+
+    @staticmethod
+    def _line(stage: str, n: int, measured: int, cpu: float, rss: float, wall: float) -> str:
+        if measured == 0:
+            return f"{stage} n={n} cpu=n/a wall={wall:.1f}s peak_rss=n/a"
+        part = "" if measured == n else f" ({measured}/{n} measured)"
+        return f"{stage} n={n} cpu={cpu:.1f}s{part} wall={wall:.1f}s peak_rss={rss:.0f}MB"
+
+    def report(self, reset: bool = True) -> str:
+        with self._lock:
+            parts = [self._line(stage, *s) for stage, s in sorted(self._stages.items())]
+            if reset:
+                self._stages = {}
+        return "[USAGE] " + ("; ".join(parts) if parts else "no tool runs")
+
+
+USAGE = UsageStats()
+
+
+def policy(ceiling: float) -> str:
+    """
+    Everything besides the tool versions that decides whether a run ends as a
+    timeout or a fault: the StageBudget parameters (with the stage ceiling)
+    and the rlimits.  Part of the evaluation cache key.
+    """
+    return (f"timeout={TIMEOUT_MULT:g}x/{TIMEOUT_FLOOR:g}s/{ceiling:g}s,stall={STALL_MULT:g}x/{STALL_FLOOR:g}s,"
+            f"rlimit_as={RLIMIT_AS_BYTES},rlimit_cpu={RLIMIT_CPU_SEC},rlimit_fsize={RLIMIT_FSIZE_BYTES}")
+
+
+def limiter(cpu: bool = True):
+    """
+    preexec_fn setting the configured rlimits in the child before exec
+    (None when no limit is configured or the platform has no rlimits).
+    """
+    if resource is None:
+        return None
+    limits = [(resource.RLIMIT_AS, RLIMIT_AS_BYTES, 0), (resource.RLIMIT_FSIZE, RLIMIT_FSIZE_BYTES, 0)]
+    if cpu:
+        # 软上限先发 SIGXCPU（可识别为超时），硬上限稍高，到达时才是 SIGKILL
+        limits.append((resource.RLIMIT_CPU, RLIMIT_CPU_SEC, 5))
+    limits = [(which, (value, value + grace)) for which, value, grace in limits if value > 0]
+    if not limits:
+        return None
+    setrlimit = resource.setrlimit
+
+    def apply():
+        # fork 与 exec 之间运行：只调用预先取好的 setrlimit，不导入、不加锁
+        for which, pair in limits:
+            try:
+                setrlimit(which, pair)
+            except (OSError, ValueError):
+                pass
+
+    return apply
+
+
+def spawn(cmd, cwd: str, shell: bool = False, **kwargs) -> subprocess.Popen:
+    """Popen in a new session (own process group) with the configured rlimits."""
+    return subprocess.Popen(cmd, cwd=cwd, shell=shell, start_new_session=True, preexec_fn=limiter(), **kwargs)
+
+
+def _killpg(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def kill(proc: subprocess.Popen) -> Usage:
+    """Kill the whole process group of proc and reap the leader."""
+    _killpg(proc)
+    return reap(proc, None)
+
+
+def _exited(proc: subprocess.Popen) -> bool:
+    # WNOWAIT：只查看不回收，组长保持僵尸状态，进程组号不会被复用
+    try:
+        return os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+    except ChildProcessError:
+        return True
+
+
+def reap(proc: subprocess.Popen, timeout: Optional[float]) -> Usage:
+    """
+    Wait for the group leader (up to timeout seconds, None = forever), kill
+    what it left behind in its group, reap it and return its rusage.
+    Raises subprocess.TimeoutExpired without reaping when it is still running.
+    """
+    start = time.monotonic()
+    while not _exited(proc):
+        if timeout is not None and time.monotonic() - start >= timeout:
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        time.sleep(_POLL_SEC)
+    _killpg(proc)
+    try:
+        _, status, ru = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        proc.wait()
+        return Usage()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return Usage(ru.ru_utime + ru.ru_stime, ru.ru_maxrss / 1024.0)
+
+
+class LogSink:
+    """
+    Per-stage tool log, appended to by every run of the stage in a folder (thread-safe).
+    Writes after close() are dropped: a reader thread that outlived _drain must
+    not reopen the file and leave an unterminated compressed member behind.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = None if path is None or TOOL_LOG == "off" else path + _LOG_SUFFIX
+        self._f = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes):
+        if self.path is None:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            if self._f is None:
+                if TOOL_LOG == "zst":
+                    self._f = zstandard.ZstdCompressor(level=3).stream_writer(open(self.path, "ab"))
+                elif TOOL_LOG == "gz":
+                    self._f = gzip.open(self.path, "ab", compresslevel=1)
+                else:
+                    self._f = open(self.path, "ab")
+            self._f.write(data)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+
+def _pump(stream, sink: LogSink, tail: deque, progress, state: dict):
+    for ln in stream:
+        sink.write(ln)
+        tail.append(ln)
+        if progress is None or progress.search(ln):
+            state["last"] = time.monotonic()
+
+
+@functools.lru_cache(maxsize=None)
+def _bytes_pattern(progress: Pattern):
+    # 输出按字节处理，不解码
+    return re.compile(progress.pattern.encode(), progress.flags & ~re.UNICODE)
+
+
+def _drain(pumps, timeout: float = 5.0):
+    # 进程组已结束，管道随即关闭；等读线程写完日志尾部
+    for t in pumps:
+        t.join(timeout)
+
+
+def _tail(chunks) -> str:
+    return b"".join(chunks).decode(errors="replace")
+
+
+def _cpu_killed(rc: int) -> bool:
+    # 被 SIGXCPU 杀死；shell 未 exec 时表现为 128+信号
+    return rc in (-signal.SIGXCPU, 128 + signal.SIGXCPU) if hasattr(signal, "SIGXCPU") else False
+
+
+def run(cmd, cwd: str, timeout: float, stall: Optional[float] = None,
+        progress: Optional[Pattern] = None, shell: bool = False,
+        stage: Optional[str] = None, stdout_path: Optional[str] = None) -> subprocess.CompletedProcess:
+    """
+    Like subprocess.run(..., check=True, text=True), without holding the
+    output in memory: stdout and stderr are streamed to the log of the stage
+    (<cwd>/<stage>.log plus TOOL_LOG suffix) and only the last TAIL_LINES
+    lines are kept, as stdout / stderr of the result and of the exceptions.
+    stdout_path (relative to cwd): the tool writes its stdout straight into
+    that file instead (e.g. the vvp trace).
+    stall: kill the tool when no line matching progress (any line if None)
+    arrived for that many seconds.  stage: name under which the resource
+    usage is added to USAGE and the run is recorded as a span (with exit
+    code and rusage).  Raises CalledProcessError, TimeoutExpired, Stalled or
+    CpuLimitExceeded.
+    """
+    with spans.span(stage or "tool", kind="tool") as sp:
+        sink = LogSink(os.path.join(cwd, stage or "tool") + ".log")
+        try:
+            sink.write(f"$ {cmd if isinstance(cmd, str) else ' '.join(cmd)}\n".encode())
+            return _run(cmd, cwd, timeout, stall, progress, shell, stage, stdout_path, sink, sp)
+        finally:
+            sink.close()
+
+
+def _run(cmd, cwd, timeout, stall, progress, shell, stage, stdout_path, sink, sp):
+    trace = open(os.path.join(cwd, stdout_path), "wb") if stdout_path else None
+    try:
+        proc = spawn(cmd, cwd, shell=shell, stdout=trace or subprocess.PIPE, stderr=subprocess.PIPE)
+    finally:
+        if trace is not None:
+            trace.close()
+    out, err = deque(maxlen=TAIL_LINES), deque(maxlen=TAIL_LINES)
+    start = time.monotonic()
+    state = {"last": start}
+    pattern = None if progress is None else _bytes_pattern(progress)
+    pumps = []
+    for stream, tail in ((proc.stdout, out), (proc.stderr, err)):
+        if stream is not None:
+            pumps.append(threading.Thread(target=_pump, args=(stream, sink, tail, pattern, state), daemon=True))
+            pumps[-1].start()
+
+    def account(usage):
+        usage.wall_sec = time.monotonic() - start
+        sp.set(rc=proc.returncode, cpu_sec=round(usage.cpu_sec, 3), peak_rss_mb=round(usage.peak_rss_mb, 1))
+        if stage is not None:
+            USAGE.add(stage, usage)
+
+    def killed(reason):
+        usage = kill(proc)
+        account(usage)
+        _drain(pumps)
+        sink.write(f"$ killed ({reason}) after {usage.wall_sec:.1f}s\n".encode())
+
+    leader_done, checked = False, start
+    while any(t.is_alive() for t in pumps):
+        now = time.monotonic()
+        if not leader_done and now - checked >= _POLL_SEC:
+            # 工具已退出但留下的后台进程仍占着管道：连同进程组一起杀掉
+            checked = now
+            if _exited(proc):
+                leader_done = True
+                _killpg(proc)
+        if now - start >= timeout:
+            killed("timeout")
+            raise subprocess.TimeoutExpired(cmd, timeout, output=_tail(out), stderr=_tail(err))
+        if stall is not None and now - state["last"] >= stall:
+            killed("stall")
+            raise Stalled(cmd, stall, output=_tail(out), stderr=_tail(err))
+        wait = min(start + timeout - now, _POLL_SEC)
+        if stall is not None:
+            wait = min(wait, state["last"] + stall - now)
+        alive = [t for t in pumps if t.is_alive()]
+        if alive:
+            alive[0].join(max(wait, 0.01))
+
+    try:
+        usage = reap(proc, max(start + timeout - time.monotonic(), 0.01))
+    except subprocess.TimeoutExpired:
+        killed("timeout")
+        raise subprocess.TimeoutExpired(cmd, timeout, output=_tail(out), stderr=_tail(err))
+    account(usage)
+    _drain(pumps)
+    rc = proc.returncode
+    sink.write(f"$ exit {rc} after {usage.wall_sec:.1f}s\n".encode())
+    stdout, stderr = _tail(out), _tail(err)
+    if _cpu_killed(rc):
+        raise CpuLimitExceeded(cmd, RLIMIT_CPU_SEC, output=stdout, stderr=stderr)
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, cmd, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(cmd, rc, stdout, stderr)
@@ -1,28 +1,524 @@
 
+import atexit
+import dataclasses
+import hashlib
 import os
 import shutil
 import subprocess
+import threading
+import time
 from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import artifact_store
+import baseline_cache
+import case_scheduler
+import checkpoint_store
+import eval_cache
+import miter
+import netlist_fingerprint
+import parallel_eval
+import pipeline
+import racing
+import spans
+import tool_runner
+import trace_compare
+import vivado_pool
+import workspace
 
 
 DEFAULT_TOP = "top"                 
 DEFAULT_TB  = "vivado_testbench.v" 
 DEFAULT_TIMEOUT_SEC = 900
+BASELINE_CACHE_DIR = "baseline_cache_vivado"
+BASELINE_FILES = ["old_syn_vivado.v", "file1.txt"]
+SCRATCH_DIR = "scratch_vivado"
+EVAL_CACHE_PATH = "eval_cache_vivado.sqlite"
+# 故障/超时/差异样例：默认按内容去重压缩存入 ARTIFACT_DIR；MAPTEST_ARCHIVE=copy 时照旧整目录复制
+ARTIFACT_DIR = "artifacts_vivado"
+ARCHIVE_MODE = os.environ.get("MAPTEST_ARCHIVE", "store")
+# 同时运行的 Vivado 默认上限：每个实例占一个 license 和数 GB 内存，不随 CPU 核数增长
+DEFAULT_VIVADO_JOBS = 2
+# 常驻 Vivado Tcl 会话数（MAPTEST_VIVADO_POOL 可调大）；0 表示沿用每次 vivado -mode batch 启动
+VIVADO_POOL_SIZE = int(os.environ.get("MAPTEST_VIVADO_POOL", DEFAULT_VIVADO_JOBS))
+VIVADO_POOL_MAX_JOBS = 50
+# 阶段前缀检查点（DCP）缓存及其磁盘预算
+CHECKPOINT_DIR = "checkpoint_cache_vivado"
+CHECKPOINT_BUDGET_BYTES = int(float(os.environ.get("MAPTEST_CKPT_BUDGET_GB", "20")) * (1 << 30))
+# MAPTEST_MITER=1：候选网表与基线网表在同一次仿真中比较（miter），不再生成 file2.txt
+MITER_MODE = os.environ.get("MAPTEST_MITER", "0") == "1"
+# 样例历史统计（决定执行顺序）；奖励变化上限低于 EARLY_EXIT_EPS 时提前结束（0 表示跑完全部样例）
+CASE_STATS_PATH = "case_stats_vivado.json"
+EARLY_EXIT_EPS = float(os.environ.get("MAPTEST_EARLY_EXIT_EPS", "0"))
+# 综合池与仿真池之间队列的长度（0 表示 2 * 仿真池大小）
+PIPELINE_DEPTH = int(os.environ.get("MAPTEST_PIPELINE_DEPTH", "0"))
+PROGRAM_TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "program_test")
+# 流程生成的文件，工作区中私有，其余输入文件以链接方式复用
+CASE_OUTPUTS = ["syn_vivado.v", "old_syn_vivado.v", "wave_1", "wave_2",
+                "file1.txt", "file2.txt", "output.txt", "wave_m", "miter_*.v", "miter_out.txt",
+                "synth_base.tcl", "synth_cand.tcl",
+                "*.vcd", "*.lxt", "*.lxt2", "*.fst", "*.log", "*.log.gz", "*.log.zst", "*.jou", ".Xil"]
+
+_CORPUS_FP = {}
+_CASE_ORDER = {}
+_EVAL_CACHE = None
+_SCHEDULER = None
+_ARTIFACTS = None
+_VIVADO_POOL = None
+_CHECKPOINTS = None
+_LOCK = threading.Lock()
+_ARCHIVE_LOCKS = {}
+
+
+def tool_ids(top_module: str = DEFAULT_TOP):
+    return [baseline_cache.tool_identity("vivado", ("-version",)),
+            baseline_cache.tool_identity("iverilog", ("-V",)),
+            baseline_cache.tool_identity("vvp", ("-V",)),
+            f"top={top_module}"]
+
+
+def cache_tool(top_module: str = DEFAULT_TOP) -> str:
+    """
+    评估缓存键的 tool 部分：工具版本、比较方式（miter / 波形）与超时策略
+    """
+    return "|".join(tool_ids(top_module) + [f"miter={int(MITER_MODE)}", tool_runner.policy(DEFAULT_TIMEOUT_SEC)])
+
+
+def get_scheduler() -> case_scheduler.CaseScheduler:
+    global _SCHEDULER
+    with _LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = case_scheduler.CaseScheduler(CASE_STATS_PATH)
+        return _SCHEDULER
+
+
+def get_artifact_store() -> artifact_store.ArtifactStore:
+    global _ARTIFACTS
+    with _LOCK:
+        if _ARTIFACTS is None:
+            _ARTIFACTS = artifact_store.ArtifactStore(ARTIFACT_DIR)
+        return _ARTIFACTS
 
-def test_file_update():
+
+def get_vivado_pool() -> vivado_pool.VivadoPool | None:
+    global _VIVADO_POOL
+    if VIVADO_POOL_SIZE <= 0:
+        return None
+    with _LOCK:
+        if _VIVADO_POOL is None:
+            _VIVADO_POOL = vivado_pool.VivadoPool(VIVADO_POOL_SIZE, max_jobs=VIVADO_POOL_MAX_JOBS)
+            atexit.register(_VIVADO_POOL.close)
+        return _VIVADO_POOL
+
+
+def run_vivado(folder_path: str, script: str, timeout_sec: float, stage: str, log=print,
+               stall_sec: float | None = None):
     """
-    将 ./program_test 拷贝为 ./action_program_test_vivado
-    （与原逻辑一致；如已有则覆盖）
+    在 folder_path 中执行 Tcl 脚本：优先交给常驻会话池，否则单独启动 vivado -mode batch
+    stall_sec 秒内没有新的 INFO/Phase 等进度输出即视为卡死
+    失败/超时/卡死抛出 CalledProcessError / TimeoutExpired
     """
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    source_dir  = os.path.join(current_dir, "program_test")
-    target_dir  = os.path.join(current_dir, "action_program_test_vivado")
+    pool = get_vivado_pool()
+    if pool is None:
+        vivado_cmd = f"vivado -mode batch -source {script}"
+        log(f"  - Vivado {stage}:", vivado_cmd)
+        tool_runner.run(vivado_cmd, folder_path, timeout_sec, stall=stall_sec,
+                        progress=tool_runner.VIVADO_PROGRESS, shell=True, stage="vivado")
+    else:
+        log(f"  - Vivado {stage} (session): source {script}")
+        # 会话中的作业没有单独的 rusage：记录状态与墙钟时间，CPU/RSS 标为未测量
+        with spans.span("vivado", kind="tool", session=True) as sp:
+            usage = tool_runner.Usage(cpu_sec=None, peak_rss_mb=None)
+            start, rc = time.monotonic(), None
+            try:
+                pool.run(folder_path, script, timeout_sec, stall=stall_sec)
+                rc = 0
+            except subprocess.CalledProcessError as e:
+                rc = e.returncode
+                raise
+            finally:
+                usage.wall_sec = time.monotonic() - start
+                sp.set(rc=rc, wall_sec=round(usage.wall_sec, 3), cpu_sec=None, peak_rss_mb=None)
+                tool_runner.USAGE.add("vivado", usage)
+
+
+def baseline_store(top_module: str = DEFAULT_TOP):
+    return baseline_cache.BaselineStore(BASELINE_CACHE_DIR, tool_ids(top_module), BASELINE_FILES)
 
-    if os.path.exists(target_dir):
-        shutil.rmtree(target_dir)
-    shutil.copytree(source_dir, target_dir)
-    print("[Vivado] copied test set ->", target_dir)
-    return 0
+
+def get_checkpoint_store() -> checkpoint_store.CheckpointStore | None:
+    global _CHECKPOINTS
+    if CHECKPOINT_BUDGET_BYTES <= 0:
+        return None
+    with _LOCK:
+        if _CHECKPOINTS is None:
+            _CHECKPOINTS = checkpoint_store.CheckpointStore(CHECKPOINT_DIR, CHECKPOINT_BUDGET_BYTES)
+        return _CHECKPOINTS
+
+
+def checkpoint_case_key(folder_path: str, top_module: str) -> str:
+    # 检查点只取决于 rtl.v、顶层与 Vivado 版本，与 testbench 无关
+    return "|".join([baseline_cache.file_digest(os.path.join(folder_path, "rtl.v")),
+                     baseline_cache.tool_identity("vivado", ("-version",)), f"top={top_module}"])
+
+
+def write_candidate_tcl(folder_path: str, stages, resume: str | None, skip: int, ckpt_keys, ckpts) -> list:
+    """
+    生成 synth_cand.tcl：从最长已缓存前缀的检查点恢复（否则 read_verilog），
+    之后每个阶段写临时 DCP 并 file rename 到位
+    返回本次写出的临时文件
+    """
+    lines = [f"open_checkpoint {{{resume}}}" if resume else "read_verilog rtl.v"]
+    tmps = []
+    for i in range(skip, len(stages)):
+        lines.append(stages[i])
+        if ckpts is not None:
+            tmp = ckpts.tmp_path(ckpt_keys[i])
+            tmps.append(tmp)
+            lines.append(f"write_checkpoint -force {{{tmp}}}")
+            lines.append(f"file rename -force {{{tmp}}} {{{ckpts.path(ckpt_keys[i])}}}")
+    lines.append("write_verilog -force syn_vivado.v")
+    with open(os.path.join(folder_path, "synth_cand.tcl"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return tmps
+
+
+def corpus_fingerprint(base_dir: str | None = None, testbench: str = DEFAULT_TB) -> str:
+    """
+    测试集指纹：所有样例 rtl.v 与 testbench 的哈希（每个进程只算一次）
+    """
+    base_dir = os.path.abspath(base_dir or PROGRAM_TEST_DIR)
+    with _LOCK:
+        if base_dir in _CORPUS_FP:
+            return _CORPUS_FP[base_dir]
+    h = hashlib.sha256()
+    for folder in sorted(os.listdir(base_dir)):
+        folder_path = os.path.join(base_dir, folder, "equiv_identity_vivado")
+        for fn in ("rtl.v", testbench):
+            fp = os.path.join(folder_path, fn)
+            if os.path.isfile(fp):
+                h.update(f"{folder}/{fn}:{baseline_cache.file_digest(fp)}\n".encode())
+    with _LOCK:
+        _CORPUS_FP[base_dir] = h.hexdigest()
+    return _CORPUS_FP[base_dir]
+
+
+def get_eval_cache() -> eval_cache.EvalCache:
+    global _EVAL_CACHE
+    with _LOCK:
+        if _EVAL_CACHE is None:
+            _EVAL_CACHE = eval_cache.EvalCache(EVAL_CACHE_PATH)
+        return _EVAL_CACHE
+
+
+def run_baseline(folder_path: str, top_module: str, testbench: str, timeout_sec: int,
+                 log=print) -> tool_runner.StageBudget:
+    """
+    默认综合流程 synth_design：生成 old_syn_vivado.v 与 file1.txt
+    返回记录了各阶段耗时的 StageBudget
+    """
+    budget = tool_runner.StageBudget(timeout_sec)
+    tcl_base = f"""\
+read_verilog rtl.v
+synth_design -top {top_module}
+write_verilog -force syn_vivado.v
+"""
+    tcl_base_path = os.path.join(folder_path, "synth_base.tcl")
+    with open(tcl_base_path, "w") as f:
+        f.write(tcl_base)
+
+    with budget.measure("vivado"):
+        run_vivado(folder_path, "synth_base.tcl", timeout_sec, "baseline", log)
+    syn_v = os.path.join(folder_path, "syn_vivado.v")
+    if not os.path.exists(syn_v):
+        raise RuntimeError("Baseline syn_vivado.v not generated")
+
+
+    iverilog_baseline = f"iverilog -o wave_1 syn_vivado.v {testbench}"
+    vvp_baseline      = "vvp -n wave_1 -lxt2"
+    log("  - iverilog baseline:", iverilog_baseline)
+    with budget.measure("iverilog"):
+        tool_runner.run(iverilog_baseline, folder_path, timeout_sec, shell=True, stage="iverilog")
+    with budget.measure("vvp"):
+        tool_runner.run(vvp_baseline, folder_path, timeout_sec, shell=True, stage="vvp", stdout_path="file1.txt")
+
+
+    f1_path = os.path.join(folder_path, "file1.txt")
+    try:
+        with open(f1_path, "r") as fr:
+            txt = fr.read()
+        txt = txt.replace("wave_1", "wave_2")
+        with open(f1_path, "w") as fw:
+            fw.write(txt)
+    except Exception:
+        pass
+
+ 
+    shutil.move(syn_v, os.path.join(folder_path, "old_syn_vivado.v"))
+    return budget
+
+
+def archive_case(case_root: str, dst_folder: str, folder: str, failure: str, command: Optional[str] = None,
+                 error=None):
+    """
+    收集失败样例 (failure: "fault" | "timeout" | "diff")
+    默认只记录引用（样例、Tcl 命令、阶段、输出尾部），文件按内容存入 artifact_store，
+    需要时用 artifact_store.py materialize 还原到 dst_folder/folder
+    """
+    if ARCHIVE_MODE != "copy":
+        with spans.span("archive", case=folder, failure=failure):
+            get_artifact_store().add(failure, folder, case_root, collection=dst_folder, command=command, error=error)
+        return
+    dst = os.path.join(dst_folder, folder)
+    # 并行评估可能同时归档同一样例
+    with _LOCK:
+        lock = _ARCHIVE_LOCKS.setdefault(os.path.abspath(dst), threading.Lock())
+    with lock, spans.span("archive", case=folder, failure=failure):
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+        shutil.copytree(case_root, dst)
+
+
+def prepare_baseline(folder: str, folder_path: str, top_module: str, testbench: str, timeout_sec: int,
+                     store: baseline_cache.BaselineStore,
+                     log=print) -> Tuple[str, str, str, tool_runner.StageBudget]:
+    """
+    从缓存取出或重新生成基线
+    返回 (基线键, 基线波形摘要, 基线网表指纹, 候选各阶段时限 StageBudget)
+    """
+    with spans.span("baseline", case=folder) as sp:
+        key = store.key(os.path.join(folder_path, "rtl.v"), os.path.join(folder_path, testbench))
+        if store.fetch(key, folder_path):
+            log("  - baseline: cached", key[:12])
+            sp.set(cached=True)
+            meta = store.meta(key)
+            netlist_fp = meta.get("netlist_fp") or \
+                netlist_fingerprint.fingerprint(os.path.join(folder_path, "old_syn_vivado.v"))
+            budget = tool_runner.StageBudget(timeout_sec, meta.get("durations", {}))
+            return key, meta.get("trace_digest"), netlist_fp, budget
+        sp.set(cached=False)
+        budget = run_baseline(folder_path, top_module, testbench, timeout_sec, log)
+        trace_digest = trace_compare.trace_digest(os.path.join(folder_path, "file1.txt"))
+        netlist_fp = netlist_fingerprint.fingerprint(os.path.join(folder_path, "old_syn_vivado.v"))
+        store.store(key, folder_path, case=folder, top=top_module, trace_digest=trace_digest, netlist_fp=netlist_fp,
+                    durations=budget.durations)
+        return key, trace_digest, netlist_fp, budget
+
+
+def compile_candidate(folder_path: str, testbench: str, budget: tool_runner.StageBudget, log=print):
+    """
+    用 iverilog 编译 syn_vivado.v（生成 wave_2），编译失败抛出 CalledProcessError
+    """
+    iverilog_cand = f"iverilog -o wave_2 syn_vivado.v {testbench}"
+    log("  - iverilog cand:", iverilog_cand)
+    tool_runner.run(iverilog_cand, folder_path, budget.timeout("iverilog"), shell=True, stage="iverilog")
+
+
+def simulate_candidate(folder_path: str, testbench: str, budget: tool_runner.StageBudget, trace_digest: str | None,
+                       log=print) -> trace_compare.CompareResult:
+    """
+    仿真 syn_vivado.v 并与基线波形比较
+    """
+    compile_candidate(folder_path, testbench, budget, log)
+    vvp_cand = "vvp -n wave_2 -lxt2"
+    tool_runner.run(vvp_cand, folder_path, budget.timeout("vvp"), shell=True, stage="vvp", stdout_path="file2.txt")
+
+    with spans.span("compare"):
+        result = trace_compare.compare_traces(os.path.join(folder_path, "file1.txt"),
+                                              os.path.join(folder_path, "file2.txt"),
+                                              baseline_digest=trace_digest)
+    with open(os.path.join(folder_path, "output.txt"), "w") as of:
+        of.write(result.report() + "\n")
+    return result
+
+
+def simulate_miter(folder_path: str, testbench: str, budget: tool_runner.StageBudget,
+                   log=print) -> miter.MiterResult | None:
+    """
+    miter 模式：基线与候选网表在同一次仿真中并排运行，首次输出不一致即停止
+    网表无法包装或包装编译失败时返回 None（改用波形比较）
+    """
+    try:
+        files = miter.build_miter(folder_path, "old_syn_vivado.v", "syn_vivado.v", testbench)
+    except (miter.MiterError, OSError) as e:
+        log(f"  - miter unavailable ({e}), falling back to trace comparison")
+        return None
+    iverilog_miter = f"iverilog -o wave_m {' '.join(files)} {testbench}"
+    vvp_miter      = "vvp -n wave_m -none"
+    log("  - iverilog miter:", iverilog_miter)
+    # miter 同时编译/仿真两份网表，时限按两倍基线计
+    try:
+        tool_runner.run(iverilog_miter, folder_path, budget.timeout("iverilog", 2), shell=True, stage="iverilog")
+    except subprocess.CalledProcessError as e:
+        # 生成的包装编译/展开失败是 MapTest 自身的问题，不算工具故障；
+        # 候选网表本身编译不过时，波形比较会单独编译它并照常报告
+        log(f"  - miter does not compile (exit {e.returncode}), falling back to trace comparison")
+        return None
+    tool_runner.run(vvp_miter, folder_path, budget.timeout("vvp", 2), shell=True, stage="vvp",
+                    stdout_path="miter_out.txt")
+    with open(os.path.join(folder_path, "miter_out.txt")) as f:
+        result = miter.parse_result(f.read())
+    with open(os.path.join(folder_path, "output.txt"), "w") as of:
+        of.write(result.report() + "\n")
+    return result
+
+
+def judge_candidate(folder_path: str, testbench: str, baseline: Tuple[str, str, str, tool_runner.StageBudget],
+                    store: baseline_cache.BaselineStore, stats: netlist_fingerprint.SkipStats,
+                    log=print) -> trace_compare.CompareResult | miter.MiterResult:
+    """
+    按网表指纹判定 syn_vivado.v：与基线相同直接通过，见过的沿用记录的结论，否则仿真
+    跳过仿真时仍用 iverilog 编译候选网表，编译不过照常按工具故障处理
+    """
+    key, trace_digest, baseline_fp, budget = baseline
+    fp = netlist_fingerprint.fingerprint(os.path.join(folder_path, "syn_vivado.v"))
+    if fp == baseline_fp:
+        compile_candidate(folder_path, testbench, budget, log)
+        stats.add("identical")
+        log("  - netlist identical to baseline, simulation skipped")
+        return trace_compare.CompareResult(True)
+    seen = store.verdict(key, fp)
+    if seen is not None:
+        compile_candidate(folder_path, testbench, budget, log)
+        stats.add("reused")
+        log(f"  - netlist seen before ({fp[:12]}), reusing verdict: {seen['verdict']}")
+        result_type = miter.MiterResult if seen.get("mode") == "miter" else trace_compare.CompareResult
+        result = result_type(**seen["fields"]) if "fields" in seen else \
+            trace_compare.CompareResult(seen["verdict"] == "pass", first_line=seen.get("first_line", -1),
+                                        mismatch_count=seen.get("mismatch_count", 0))
+        with open(os.path.join(folder_path, "output.txt"), "w") as of:
+            of.write(seen.get("report", "") + "\n")
+        return result
+    result = simulate_miter(folder_path, testbench, budget, log) if MITER_MODE else None
+    mode = "miter"
+    if result is None:
+        result = simulate_candidate(folder_path, testbench, budget, trace_digest, log)
+        mode = "trace"
+    stats.add("simulated")
+    store.record_verdict(key, fp, "pass" if result.match else "diff", mode=mode, report=result.report(),
+                         fields=dataclasses.asdict(result))
+    return result
+
+
+def _case_failed(case_root: str, folder: str, fault_folder: str, timeout_folder: str, e: Exception, log,
+                 command: Optional[str] = None):
+    if isinstance(e, subprocess.TimeoutExpired):
+        archive_case(case_root, timeout_folder, folder, "timeout", command, e)
+        log(f"  - TIMEOUT: {e}")
+        return "timeout", log.text()
+    archive_case(case_root, fault_folder, folder, "fault", command, e)
+    if isinstance(e, subprocess.CalledProcessError):
+        log(f"  - FAULT: Vivado/Sim failed\n{e}")
+    else:
+        log(f"  - FAULT: {e}")
+    return "fault", log.text()
+
+
+def synth_case(
+    folder: str,
+    base_dir: str,
+    scratch_dir: str,
+    vivado_command: str,
+    check_folder: str,
+    fault_folder: str,
+    timeout_folder: str,
+    top_module: str,
+    testbench: str,
+    timeout_sec: int,
+    store: baseline_cache.BaselineStore,
+    ws: workspace.Workspace,
+    stats: netlist_fingerprint.SkipStats
+):
+    """
+    流水线第一段：在 scratch_dir 中的私有副本上准备基线并综合候选
+    综合成功返回 pipeline.Next（仿真与比较交给仿真池），
+    否则返回 ("fault" | "timeout" | "skip", 日志)
+    """
+    log = parallel_eval.CaseLog()
+    src_root = os.path.join(base_dir, folder)
+    log(f"[CASE] {os.path.join(src_root, 'equiv_identity_vivado')}")
+
+    if not (os.path.isdir(os.path.join(src_root, "equiv_identity_vivado"))
+            and os.path.exists(os.path.join(src_root, "equiv_identity_vivado", "rtl.v"))):
+        log("  - skipped (no rtl.v)")
+        return "skip", log.text()
+
+    case_root   = os.path.join(scratch_dir, folder)
+    folder_path = os.path.join(case_root, "equiv_identity_vivado")
+
+    try:
+        with spans.span("workspace", case=folder):
+            ws.build(src_root, case_root)
+
+        baseline = prepare_baseline(folder, folder_path, top_module, testbench, timeout_sec, store, log)
+
+        stages = checkpoint_store.split_stages(vivado_command)
+        budget = baseline[3]
+
+        def run_candidate(todo):
+            # 基线只有 synth_design 一个阶段，候选时限按待跑阶段数放大
+            limit = budget.timeout("vivado", max(todo, 1))
+            log(f"  - limits: vivado {limit:.0f}s, {budget.describe('iverilog', 'vvp')}")
+            run_vivado(folder_path, "synth_cand.tcl", limit, "candidate", log,
+                       stall_sec=budget.stall("vivado", max(todo, 1)))
+
+        ckpts = get_checkpoint_store()
+        if ckpts is None:
+            write_candidate_tcl(folder_path, stages, None, 0, [], None)
+            run_candidate(len(stages))
+        else:
+            ckpt_keys = ckpts.prefix_keys(checkpoint_case_key(folder_path, top_module), stages)
+            with ckpts.resume(ckpt_keys) as (skip, resume):
+                if skip:
+                    log(f"  - checkpoint: resume after {skip}/{len(stages)} stages")
+                tmps = write_candidate_tcl(folder_path, stages, resume, skip, ckpt_keys, ckpts)
+                try:
+                    run_candidate(len(stages) - skip)
+                finally:
+                    ckpts.discard(tmps)     # 失败/超时留下的未完成 DCP
+            ckpts.evict()
+        if not os.path.exists(os.path.join(folder_path, "syn_vivado.v")):
+            raise RuntimeError("Candidate syn_vivado.v not generated")
+
+    except Exception as e:
+        try:
+            return _case_failed(case_root, folder, fault_folder, timeout_folder, e, log, vivado_command)
+        finally:
+            shutil.rmtree(case_root, ignore_errors=True)
+
+    def judge() -> Tuple[str, str]:
+        with spans.span("judge_case", case=folder) as sp:
+            outcome, text = judge_case(folder, case_root, testbench, baseline, check_folder, fault_folder,
+                                       timeout_folder, store, stats, log, vivado_command)
+            sp.set(outcome=outcome)
+            return outcome, text
+
+    return pipeline.Next(spans.bind(judge))
+
+
+def judge_case(folder: str, case_root: str, testbench: str, baseline, check_folder: str, fault_folder: str,
+               timeout_folder: str, store: baseline_cache.BaselineStore, stats: netlist_fingerprint.SkipStats,
+               log, vivado_command: Optional[str] = None) -> Tuple[str, str]:
+    """
+    流水线第二段：仿真并比较已综合的候选，之后清理样例副本
+    返回 ("pass" | "diff" | "fault" | "timeout", 日志)
+    """
+    folder_path = os.path.join(case_root, "equiv_identity_vivado")
+    try:
+        result = judge_candidate(folder_path, testbench, baseline, store, stats, log)
+
+        if not result.match:
+            archive_case(case_root, check_folder, folder, "diff", vivado_command, result.summary())
+            log(f"  - DIFF: {result.summary()}, collected in check_folder.")
+            return "diff", log.text()
+        log("  - PASS: outputs equivalent.")
+        return "pass", log.text()
+
+    except Exception as e:
+        return _case_failed(case_root, folder, fault_folder, timeout_folder, e, log, vivado_command)
+
+    finally:
+        shutil.rmtree(case_root, ignore_errors=True)
 
 
 def diff_check_vivado(
@@ -33,12 +529,35 @@ def diff_check_vivado(
     base_dir: str | None = None,
     top_module: str = DEFAULT_TOP,
     testbench: str = DEFAULT_TB,
-    timeout_sec: int = DEFAULT_TIMEOUT_SEC
+    timeout_sec: int = DEFAULT_TIMEOUT_SEC,
+    workers: int | None = None,
+    scratch_root: str = SCRATCH_DIR,
+    cases: List[str] | None = None,
+    epsilon: float | None = None,
+    sim_workers: int | None = None,
+    depth: int | None = None,
+    elapsed_weight: float = 0.0
 ):
+    """
+    返回 case_scheduler.Counts (fault_number, timeout_number, diff_number)，提前结束时 complete 为 False
+    workers: Vivado 综合池大小 (默认 MAPTEST_SYNTH_WORKERS，否则同 Vivado 会话池，批处理模式为 DEFAULT_VIVADO_JOBS)
+    sim_workers: 仿真池大小 (默认 MAPTEST_SIM_WORKERS，否则 MAPTEST_WORKERS 或 CPU 核数)
+    depth: 已综合待仿真的样例上限 (默认 MAPTEST_PIPELINE_DEPTH 或 2 * sim_workers)
+    cases: 只评估这些样例目录 (默认 base_dir 下全部)，按历史收益/耗时排序执行
+    epsilon: 剩余样例对奖励的影响不超过 epsilon 时提前结束 (默认 EARLY_EXIT_EPS)
+    elapsed_weight: 奖励耗时惩罚每多一秒评估的下降量（Rewarder.elapsed_weight()），计入剩余样例的影响
+    """
 
-    cwd = os.getcwd()
     if base_dir is None:
-        base_dir = os.path.join(cwd, "action_program_test_vivado")
+        base_dir = PROGRAM_TEST_DIR
+    if workers is None:
+        # 同时运行的 Vivado 不超过会话池（license）大小
+        workers = parallel_eval.stage_workers(
+            "synth", VIVADO_POOL_SIZE if VIVADO_POOL_SIZE > 0 else DEFAULT_VIVADO_JOBS)
+    if sim_workers is None:
+        sim_workers = parallel_eval.stage_workers("sim", parallel_eval.default_workers())
+    if depth is None:
+        depth = PIPELINE_DEPTH or 2 * sim_workers
 
     fault_number = 0
     timeout_number = 0
@@ -47,161 +566,65 @@ def diff_check_vivado(
     os.makedirs(check_folder, exist_ok=True)
     os.makedirs(fault_folder, exist_ok=True)
     os.makedirs(timeout_folder, exist_ok=True)
-
-    for folder in os.listdir(base_dir):
-        case_root   = os.path.join(base_dir, folder)
-        folder_path = os.path.join(case_root, "equiv_identity_vivado")
-        print(f"[CASE] {folder_path}")
-
-        if not (os.path.isdir(folder_path) and os.path.exists(os.path.join(folder_path, "rtl.v"))):
-            print("  - skipped (no rtl.v)")
-            continue
-
+    store = baseline_store(top_module)
+    ws = workspace.Workspace(CASE_OUTPUTS)
+    stats = netlist_fingerprint.SkipStats()
+    scratch_dir = parallel_eval.new_scratch(scratch_root, "vivado_")
+
+    sched = get_scheduler()
+    if epsilon is None:
+        epsilon = EARLY_EXIT_EPS
+    folders = sched.order(os.listdir(base_dir) if cases is None else list(cases))
+    remaining = set(folders)
+    print(f"[SCHEDULE] {len(folders)} cases: {sched.describe(folders)}")
+
+    def synth_one(folder):
+        with spans.span("synth_case", case=folder) as sp:
+            result = synth_case(folder, base_dir, scratch_dir, vivado_command, check_folder, fault_folder,
+                                timeout_folder, top_module, testbench, timeout_sec, store, ws, stats)
+            if not isinstance(result, pipeline.Next):
+                sp.set(outcome=result[0])
+            return result
+
+    def saturated() -> bool:
+        return epsilon > 0 and sched.headroom(fault_number, timeout_number, remaining, elapsed_weight) < epsilon
+
+    flow = pipeline.PipelineStats(workers, sim_workers, depth)
+    with spans.span("diff_check", tool="vivado", cases=len(folders), workers=workers, sim_workers=sim_workers) as sp:
         try:
-
-            for fn in ["syn_vivado.v", "old_syn_vivado.v", "wave_1", "wave_2",
-                       "file1.txt", "file2.txt", "output.txt", "synth_base.tcl", "synth_cand.tcl"]:
-                fp = os.path.join(folder_path, fn)
-                if os.path.exists(fp):
-                    try:
-                        os.remove(fp)
-                    except IsADirectoryError:
-                        shutil.rmtree(fp, ignore_errors=True)
-
-
-            tcl_base = f"""\
-read_verilog rtl.v
-synth_design -top {top_module}
-write_verilog -force syn_vivado.v
-"""
-            tcl_base_path = os.path.join(folder_path, "synth_base.tcl")
-            with open(tcl_base_path, "w") as f:
-                f.write(tcl_base)
-
-            vivado_base_cmd = "vivado -mode batch -source synth_base.tcl"
-            print("  - Vivado baseline:", vivado_base_cmd)
-            subprocess.run(
-                vivado_base_cmd, shell=True, cwd=folder_path,
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
-                timeout=timeout_sec, check=True
-            )
-            syn_v = os.path.join(folder_path, "syn_vivado.v")
-            if not os.path.exists(syn_v):
-                raise RuntimeError("Baseline syn_vivado.v not generated")
-
-
-            iverilog_baseline = f"iverilog -o wave_1 syn_vivado.v {testbench}"
-            vvp_baseline      = "vvp -n wave_1 -lxt2"
-            print("  - iverilog baseline:", iverilog_baseline)
-            subprocess.run(iverilog_baseline, shell=True, cwd=folder_path,
-                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
-                           timeout=timeout_sec, check=True)
-            with open(os.path.join(folder_path, "file1.txt"), "w") as f1:
-                r = subprocess.run(vvp_baseline, shell=True, cwd=folder_path,
-                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
-                                   timeout=timeout_sec, check=True)
-                f1.write(r.stdout)
-
-
-            f1_path = os.path.join(folder_path, "file1.txt")
-            try:
-                with open(f1_path, "r") as fr:
-                    txt = fr.read()
-                txt = txt.replace("wave_1", "wave_2")
-                with open(f1_path, "w") as fw:
-                    fw.write(txt)
-            except Exception:
-                pass
-
-         
-            shutil.move(syn_v, os.path.join(folder_path, "old_syn_vivado.v"))
-
-            
-            tcl_cand = f"""\
-read_verilog rtl.v
-{vivado_command}
-write_verilog -force syn_vivado.v
-"""
-            tcl_cand_path = os.path.join(folder_path, "synth_cand.tcl")
-            with open(tcl_cand_path, "w") as f:
-                f.write(tcl_cand)
-
-            vivado_cand_cmd = "vivado -mode batch -source synth_cand.tcl"
-            print("  - Vivado candidate:", vivado_cand_cmd)
-            subprocess.run(
-                vivado_cand_cmd, shell=True, cwd=folder_path,
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
-                timeout=timeout_sec, check=True
-            )
-            if not os.path.exists(os.path.join(folder_path, "syn_vivado.v")):
-                raise RuntimeError("Candidate syn_vivado.v not generated")
-
-            
-            iverilog_cand = f"iverilog -o wave_2 syn_vivado.v {testbench}"
-            vvp_cand      = "vvp -n wave_2 -lxt2"
-            print("  - iverilog cand:", iverilog_cand)
-            subprocess.run(iverilog_cand, shell=True, cwd=folder_path,
-                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
-                           timeout=timeout_sec, check=True)
-            with open(os.path.join(folder_path, "file2.txt"), "w") as f2:
-                r = subprocess.run(vvp_cand, shell=True, cwd=folder_path,
-                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
-                                   timeout=timeout_sec, check=True)
-                f2.write(r.stdout)
-
-            
-            output_txt = os.path.join(folder_path, "output.txt")
-            with open(output_txt, "w") as outfp:
-                subprocess.run(
-                    ["python3", "compare.py"],
-                    cwd=folder_path, stdout=outfp, stderr=subprocess.PIPE, text=True,
-                    timeout=timeout_sec, check=False
-                )
-            with open(output_txt, "r") as of:
-                out_str = of.read()
-            has_diff = ("error" in out_str.lower()) or ("fail" in out_str.lower()) or ("number different" in out_str.lower())
-
-            if has_diff:
-                diff_number += 1
-                dst = os.path.join(check_folder, folder)
-                if os.path.exists(dst):
-                    shutil.rmtree(dst)
-                shutil.copytree(case_root, dst)
-                print("  - DIFF: outputs mismatch, copied to check_folder.")
-            else:
-                print("  - PASS: outputs equivalent.")
-
-        except subprocess.TimeoutExpired as te:
-            timeout_number += 1
-            dst = os.path.join(timeout_folder, folder)
-            if os.path.exists(dst):
-                shutil.rmtree(dst)
-            shutil.copytree(case_root, dst)
-            print(f"  - TIMEOUT: {te}")
-
-        except subprocess.CalledProcessError as e:
-            fault_number += 1
-            dst = os.path.join(fault_folder, folder)
-            if os.path.exists(dst):
-                shutil.rmtree(dst)
-            shutil.copytree(case_root, dst)
-            print(f"  - FAULT: Vivado/Sim failed\n{e}")
-
-        except Exception as e:
-            fault_number += 1
-            dst = os.path.join(fault_folder, folder)
-            if os.path.exists(dst):
-                shutil.rmtree(dst)
-            shutil.copytree(case_root, dst)
-            print(f"  - FAULT: {e}")
-
+            for folder, (outcome, text), seconds in pipeline.run(spans.bind(synth_one), folders, workers,
+                                                                 sim_workers, depth, stop=saturated, stats=flow):
+                print(text)
+                sched.record(folder, outcome, seconds)
+                remaining.discard(folder)
+                if outcome == "fault":
+                    fault_number += 1
+                elif outcome == "timeout":
+                    timeout_number += 1
+                elif outcome == "diff":
+                    diff_number += 1
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+            sched.save()
+        sp.set(faults=fault_number, timeouts=timeout_number, diffs=diff_number,
+               evaluated=len(folders) - len(remaining))
+
+    if remaining:
+        print(f"[SCHEDULE] early exit after {len(folders) - len(remaining)}/{len(folders)} cases "
+              f"(reward headroom < {epsilon})")
+    print(ws.report())
+    print(stats.report())
+    if get_checkpoint_store() is not None:
+        print(get_checkpoint_store().report())
+    print(flow.report())
+    print(tool_runner.USAGE.report())
     print(f"[SUMMARY] fault={fault_number}, timeout={timeout_number}, diff={diff_number}")
-    return fault_number, timeout_number, diff_number
+    return case_scheduler.Counts(fault_number, timeout_number, diff_number, complete=not remaining)
 
 
-def Evaluate_main(new_episode: int, vivado_command: str):
+def evaluate_counts(new_episode: int, vivado_command: str, cases: List[str] | None = None,
+                    epsilon: float | None = None, elapsed_weight: float = 0.0) -> case_scheduler.Counts:
 
-    test_file_update()
     print("[Vivado] episode =", new_episode)
     print("[Vivado] command:\n", vivado_command)
 
@@ -213,18 +636,118 @@ def Evaluate_main(new_episode: int, vivado_command: str):
     fault_folder   = f"fault_collection_vivado/{new_episode}"
     check_folder   = f"check_collection_vivado/{new_episode}"
 
-    fault_number, timeout_number, diff_number = diff_check_vivado(
+    counts = diff_check_vivado(
         vivado_command=vivado_command,
         check_folder=check_folder,
         fault_folder=fault_folder,
         timeout_folder=timeout_folder,
-        base_dir=os.path.join(os.getcwd(), "action_program_test_vivado"),
+        base_dir=PROGRAM_TEST_DIR,
         top_module=DEFAULT_TOP,
         testbench=DEFAULT_TB,
-        timeout_sec=DEFAULT_TIMEOUT_SEC
+        timeout_sec=DEFAULT_TIMEOUT_SEC,
+        cases=cases,
+        epsilon=epsilon,
+        elapsed_weight=elapsed_weight
     )
 
+    fault_number, timeout_number, diff_number = counts
     print(f"[Vivado] Fault number: {fault_number}")
     print(f"[Vivado] Timeout number: {timeout_number}")
     print(f"[Vivado] Diff number: {diff_number}")
+    return counts
+
+
+def Evaluate_main(new_episode: int, vivado_command: str):
+    fault_number, timeout_number, _ = evaluate_counts(new_episode, vivado_command)
     return fault_number, timeout_number
+
+
+def Evaluate_cached(new_episode: int, vivado_command: str,
+                    elapsed_weight: float = 0.0) -> Tuple[int, int, float, bool]:
+    """
+    先查持久化缓存，未命中再完整评估并写回
+    elapsed_weight: 调用方奖励的耗时惩罚权重，用于提前结束的上限
+    返回 (fault_number, timeout_number, elapsed, cached)
+    """
+    with spans.span("rollout", episode=new_episode) as sp:
+        cache = get_eval_cache()
+        corpus = corpus_fingerprint()
+        tool = cache_tool()
+        key = cache.key(vivado_command, corpus, tool)
+        hit = cache.get(key)
+        if hit is not None:
+            fault_number, timeout_number, diff_number, elapsed = hit
+            print(f"[Vivado] cache hit: fault={fault_number}, timeout={timeout_number}, "
+                  f"diff={diff_number}, elapsed={elapsed:.1f}s")
+            sp.set(cached=True, faults=fault_number, timeouts=timeout_number, diffs=diff_number)
+            return fault_number, timeout_number, elapsed, True
+
+        t0 = time.perf_counter()
+        counts = evaluate_counts(new_episode, vivado_command, elapsed_weight=elapsed_weight)
+        elapsed = time.perf_counter() - t0
+        fault_number, timeout_number, diff_number = counts
+        # 提前结束时只跑了部分样例，不能当作全集结果写入缓存
+        if counts.complete:
+            cache.put(key, vivado_command, corpus, tool, fault_number, timeout_number, diff_number, elapsed)
+        sp.set(cached=False, faults=fault_number, timeouts=timeout_number, diffs=diff_number)
+        return fault_number, timeout_number, elapsed, False
+
+
+def case_order(base_dir: str | None = None) -> List[str]:
+    """
+    racing 使用的分层样例顺序（按 rtl.v 大小分层后交错，每个进程只算一次）
+    """
+    base_dir = os.path.abspath(base_dir or PROGRAM_TEST_DIR)
+    with _LOCK:
+        if base_dir not in _CASE_ORDER:
+            _CASE_ORDER[base_dir] = racing.stratified_order(base_dir, "equiv_identity_vivado")
+        return _CASE_ORDER[base_dir]
+
+
+def Evaluate_racing(
+    new_episode: int,
+    vivado_command: str,
+    promote: Optional[Callable[[float, float, float], bool]] = None
+) -> Tuple[float, float, float, bool, float]:
+    """
+    多保真度评估：按 racing.DEFAULT_RUNGS 逐级扩大样例子集，
+    promote(faults_upper, timeouts_lower, elapsed) 为 False 时提前停止
+    返回 (fault_number, timeout_number, elapsed, cached, fidelity)
+    未跑完全部样例时 fault/timeout 为按比例外推到全集的估计值
+    """
+    with spans.span("rollout", episode=new_episode, racing=True) as sp:
+        cache = get_eval_cache()
+        corpus = corpus_fingerprint()
+        tool = cache_tool()
+        full_key = cache.key(vivado_command, corpus, tool)
+        hit = cache.get(full_key)
+        if hit is not None:
+            fault_number, timeout_number, diff_number, elapsed = hit
+            print(f"[Vivado] cache hit: fault={fault_number}, timeout={timeout_number}, "
+                  f"diff={diff_number}, elapsed={elapsed:.1f}s")
+            sp.set(cached=True, faults=fault_number, timeouts=timeout_number, fidelity=1.0)
+            return fault_number, timeout_number, elapsed, True, 1.0
+
+        def evaluate_rung(rung: int, cases: List[str]):
+            # 每级只评估新增样例，结果按样例集合单独缓存
+            # 各级不提前结束：headroom 只看本级计数，而奖励取决于累计计数；淘汰交给 racing 的 Hoeffding 界
+            subset = corpus + "|cases:" + hashlib.sha256("\n".join(cases).encode()).hexdigest()
+            key = cache.key(vivado_command, subset, tool)
+            hit = cache.get(key)
+            if hit is not None:
+                return hit[0], hit[1], hit[2], hit[3], True
+            t0 = time.perf_counter()
+            counts = evaluate_counts(new_episode, vivado_command, cases=cases, epsilon=0)
+            elapsed = time.perf_counter() - t0
+            cache.put(key, vivado_command, subset, tool, *counts, elapsed)
+            return (*counts, elapsed, False)
+
+        result = racing.race(case_order(), evaluate_rung, promote)
+        fault_number, timeout_number = result.estimate()
+        print(f"[Vivado] race: {result.seen}/{result.total} cases, fault={result.faults}, timeout={result.timeouts}"
+              + ("" if result.seen == result.total else " (dropped)"))
+        if result.seen == result.total:
+            cache.put(full_key, vivado_command, corpus, tool, result.faults, result.timeouts, result.diffs,
+                      result.elapsed)
+        sp.set(cached=result.cached, faults=result.faults, timeouts=result.timeouts, fidelity=result.fidelity)
+        return fault_number, timeout_number, result.elapsed, result.cached, result.fidelity
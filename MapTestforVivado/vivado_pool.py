@@ -0,0 +1,195 @@
+"""
+Pool of long-lived Vivado Tcl sessions.
+
+Instead of one `vivado -mode batch -source x.tcl` launch per case and stage,
+each session is started once in `-mode tcl` and driven over its stdin/stdout:
+
+    maptest_job <id> {<dir>} {<script>}
+
+cds into <dir>, sources <script>, always runs close_design to reset the
+in-memory project and answers with
+
+    __MAPTEST_DONE__ <id> <rc>
+
+rc is the Tcl catch code (0 = ok).  A session that dies, hangs past the
+timeout (or prints no progress line for the stall window) or has served
+max_jobs jobs is killed and replaced by a fresh one.
+stub_vivado.py speaks the same protocol for machines without Vivado.
+"""
+import os
+import queue
+import re
+import signal
+import subprocess
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import tool_runner
+
+
+DONE = "__MAPTEST_DONE__"
+ERR = "__MAPTEST_ERR__"
+READY = "__MAPTEST_READY__"
+
+_JOB_PROC = (
+    "proc maptest_job {id dir script} { cd $dir; set rc [catch {source $script} err]; "
+    "catch {close_design}; if {$rc} { puts \"" + ERR + " $id [string map {\"\\n\" \" \"} $err]\" }; "
+    "puts \"" + DONE + " $id $rc\"; flush stdout }"
+)
+_DONE_RE = re.compile(DONE + r" (\d+) (\d+)")
+
+
+class SessionDied(RuntimeError):
+    pass
+
+
+class VivadoSession:
+
+    def __init__(self, vivado_cmd: Sequence[str], startup_timeout: float):
+        self.proc = subprocess.Popen(
+            list(vivado_cmd) + ["-mode", "tcl", "-nojournal", "-nolog"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, bufsize=1, start_new_session=True,
+            # 会话常驻，累计 CPU 时间没有意义，只限制内存/文件大小
+            preexec_fn=tool_runner.limiter(cpu=False)
+        )
+        self.lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self.jobs = 0
+        self.next_id = 0
+        try:
+            threading.Thread(target=self._pump, daemon=True).start()
+            self._send(_JOB_PROC)
+            self._send(f"puts {READY}; flush stdout")
+            self._wait_for(lambda ln: READY in ln, startup_timeout)
+        except BaseException:
+            # 启动失败/超时：杀掉已启动的进程，否则它连同 license 一直占着
+            self.close(kill=True)
+            raise
+
+    def _pump(self):
+        for ln in self.proc.stdout:
+            self.lines.put(ln)
+        self.lines.put(None)
+
+    def _send(self, line: str):
+        try:
+            self.proc.stdin.write(line + "\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise SessionDied(f"vivado session stdin closed: {e}")
+
+    def _wait_for(self, pred, timeout: float, stall: Optional[float] = None,
+                  sink: Optional[tool_runner.LogSink] = None) -> Tuple[Optional[str], List[str]]:
+        deadline = time.monotonic() + timeout
+        last = time.monotonic()
+        tail: List[str] = []
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise subprocess.TimeoutExpired("vivado -mode tcl", timeout, output="\n".join(tail))
+            if stall is not None:
+                quiet = time.monotonic() - last
+                if quiet >= stall:
+                    raise tool_runner.Stalled("vivado -mode tcl", stall, output="\n".join(tail))
+                left = min(left, stall - quiet)
+            try:
+                ln = self.lines.get(timeout=left)
+            except queue.Empty:
+                continue
+            if ln is None:
+                raise SessionDied(f"vivado session exited ({self.proc.poll()}): " + " | ".join(tail[-3:]))
+            if sink is not None:
+                sink.write(ln.encode())
+            tail = (tail + [ln.rstrip()])[-50:]
+            if tool_runner.VIVADO_PROGRESS.search(ln):
+                last = time.monotonic()
+            if pred(ln):
+                return ln, tail
+
+    def run(self, folder: str, script: str, timeout: float, stall: Optional[float] = None) -> Tuple[int, List[str]]:
+        job_id = self.next_id
+        self.next_id += 1
+        self.jobs += 1
+        # 作业输出与批处理模式一样写入该目录的 vivado.log(.gz)
+        sink = tool_runner.LogSink(os.path.join(folder, "vivado.log"))
+        try:
+            sink.write(f"$ source {script}\n".encode())
+            self._send(f"maptest_job {job_id} {{{os.path.abspath(folder)}}} {{{script}}}")
+            ln, tail = self._wait_for(lambda l: _DONE_RE.search(l) is not None
+                                      and int(_DONE_RE.search(l).group(1)) == job_id, timeout, stall, sink)
+        finally:
+            sink.close()
+        return int(_DONE_RE.search(ln).group(2)), tail
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def close(self, kill: bool = False):
+        if self.alive() and not kill:
+            try:
+                self._send("exit")
+                self.proc.wait(timeout=30)
+            except (SessionDied, subprocess.TimeoutExpired):
+                kill = True
+        if self.alive() or kill:
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            self.proc.wait()
+
+
+class VivadoPool:
+    """
+    size: number of concurrent sessions; max_jobs: recycle a session after
+    that many jobs (Vivado leaks memory over long runs).
+    """
+
+    def __init__(self, size: int, vivado_cmd: Sequence[str] = ("vivado",), max_jobs: int = 50,
+                 startup_timeout: float = 600):
+        self.vivado_cmd = list(vivado_cmd)
+        self.max_jobs = max_jobs
+        self.startup_timeout = startup_timeout
+        self.idle: "queue.Queue[Optional[VivadoSession]]" = queue.Queue()
+        for _ in range(size):
+            self.idle.put(None)     # 按需启动
+        self.started = 0
+        self.recycled = 0
+
+    def run(self, folder: str, script: str, timeout: float, stall: Optional[float] = None) -> List[str]:
+        """
+        Source script inside folder on a pooled session.  Raises
+        subprocess.TimeoutExpired (tool_runner.Stalled when no progress line
+        arrived for stall seconds) / subprocess.CalledProcessError like the
+        batch launch it replaces; returns the tail of the session output.
+        """
+        session = self.idle.get()
+        keep = False
+        try:
+            if session is None or not session.alive():
+                session = VivadoSession(self.vivado_cmd, self.startup_timeout)
+                self.started += 1
+            try:
+                rc, tail = session.run(folder, script, timeout, stall)
+            except SessionDied as e:
+                raise subprocess.CalledProcessError(-1, f"vivado session: source {script}", output=str(e))
+            if rc != 0:
+                raise subprocess.CalledProcessError(rc, f"vivado session: source {script}", output="\n".join(tail))
+            keep = session.jobs < self.max_jobs
+            return tail
+        finally:
+            if not keep and session is not None:
+                session.close(kill=True)
+                self.recycled += 1
+                session = None
+            self.idle.put(session)
+
+    def close(self):
+        while True:
+            try:
+                session = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            if session is not None:
+                session.close()
@@ -0,0 +1,104 @@
+"""
+Copy-free evaluation workspaces.
+
+A case directory is rebuilt from links to the read-only inputs of the
+pristine test set (rtl.v, testbench, compare.py, ...).  Only the files the
+flow generates are private to the workspace: they are never linked, so a tool
+writing them cannot reach back into the test set.
+"""
+import errno
+import fcntl
+import fnmatch
+import os
+import shutil
+import threading
+import time
+
+
+LINK_MODES = ("hardlink", "reflink", "symlink", "copy")
+FICLONE = 0x40049409
+# errors meaning the file system does not support / allow a link mode (cross
+# device, protected hardlinks, no reflink); anything else (ENOSPC, EMFILE, ...)
+# may be transient and must not downgrade the mode for the whole process
+UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOTTY}
+
+
+def _reflink(src, dst):
+    with open(src, "rb") as fs, open(dst, "wb") as fd:
+        try:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        except OSError:
+            fd.close()
+            os.remove(dst)
+            raise
+
+
+def _link(mode, src, dst):
+    if mode == "hardlink":
+        os.link(src, dst)
+    elif mode == "reflink":
+        _reflink(src, dst)
+    elif mode == "symlink":
+        os.symlink(src, dst)
+    else:
+        shutil.copyfile(src, dst)
+
+
+class Workspace:
+    """
+    private: file / directory names (fnmatch patterns) generated by the flow;
+    they are skipped when building, the flow recreates them.
+    modes: link strategies in order of preference; the first one that works
+    for the file system is remembered.
+    """
+
+    def __init__(self, private=(), modes=LINK_MODES):
+        self.private = list(private)
+        self.modes = list(modes)
+        self.lock = threading.Lock()
+        self.setup_sec = 0.0
+        self.builds = 0
+        self.files = {}
+
+    def build(self, src, dst):
+        """Mirror src into dst with links; returns the seconds spent."""
+        t0 = time.perf_counter()
+        counts = {}
+        src = os.path.abspath(src)
+        for root, dirs, files in os.walk(src):
+            dirs[:] = [d for d in dirs if not self.is_private(d)]
+            out_root = os.path.join(dst, os.path.relpath(root, src))
+            os.makedirs(out_root, exist_ok=True)
+            for fn in files:
+                if self.is_private(fn):
+                    continue
+                mode = self._place(os.path.join(root, fn), os.path.join(out_root, fn))
+                counts[mode] = counts.get(mode, 0) + 1
+        elapsed = time.perf_counter() - t0
+        with self.lock:
+            self.setup_sec += elapsed
+            self.builds += 1
+            for mode, n in counts.items():
+                self.files[mode] = self.files.get(mode, 0) + n
+        return elapsed
+
+    def is_private(self, name):
+        return any(fnmatch.fnmatch(name, pat) for pat in self.private)
+
+    def _place(self, src, dst):
+        for mode in list(self.modes):
+            try:
+                _link(mode, src, dst)
+                return mode
+            except OSError as e:
+                if mode == "copy" or e.errno not in UNSUPPORTED:
+                    raise
+                with self.lock:
+                    if mode in self.modes and len(self.modes) > 1:
+                        self.modes.remove(mode)
+        raise OSError(f"cannot place {src}")
+
+    def report(self):
+        with self.lock:
+            modes = ", ".join(f"{m}={n}" for m, n in sorted(self.files.items()))
+            return f"[WORKSPACE] {self.builds} cases in {self.setup_sec:.3f}s ({modes or 'no files'})"
@@ -1,41 +1,599 @@
+import dataclasses
+import hashlib
 import os
+import queue
 import shutil
 import subprocess
-
-def test_file_update():
-
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    print(current_dir)
-    
-
-    source_dir = os.path.join(current_dir, "program_test")
-    print(source_dir)
-    
-
-    target_dir = os.path.join(current_dir, "action_program_test_yosys")
-    print(target_dir)
-    
-
-    if os.path.exists(target_dir):
-        shutil.rmtree(target_dir)
-    
-
-    shutil.copytree(source_dir, target_dir)
-    print("copied")
-
-    return 0
-
-import os
-import shutil
-import subprocess
+import threading
 import time
 
-def diff_check(command_sequence,check_folder,fault_folder,timeout_folder,base_dir,yosys_tb,timeout_sec):
-ber: compare.py 判断有差异的样例数量
+import artifact_store
+import baseline_cache
+import case_scheduler
+import eval_cache
+import miter
+import netlist_fingerprint
+import parallel_eval
+import pipeline
+import racing
+import spans
+import tool_runner
+import trace_compare
+import workspace
+
+
+BASELINE_CACHE_DIR = "baseline_cache_yosys"
+BASELINE_FILES = ["old_syn_yosys.v", "file1.txt"]
+SCRATCH_DIR = "scratch_yosys"
+EVAL_CACHE_PATH = "eval_cache_yosys.sqlite"
+# 故障/超时/差异样例：默认按内容去重压缩存入 ARTIFACT_DIR；MAPTEST_ARCHIVE=copy 时照旧整目录复制
+ARTIFACT_DIR = "artifacts_yosys"
+ARCHIVE_MODE = os.environ.get("MAPTEST_ARCHIVE", "store")
+BATCH_BEGIN = "__MAPTEST_BEGIN_"
+BATCH_END = "__MAPTEST_END_"
+# MAPTEST_MITER=1：候选网表与基线网表在同一次仿真中比较（miter），不再生成 file2.txt
+MITER_MODE = os.environ.get("MAPTEST_MITER", "0") == "1"
+# 各阶段的超时上限（秒）；有基线耗时的阶段按 tool_runner.StageBudget 缩短
+DEFAULT_TIMEOUT_SEC = 600
+# 样例历史统计（决定执行顺序）；奖励变化上限低于 EARLY_EXIT_EPS 时提前结束（0 表示跑完全部样例）
+CASE_STATS_PATH = "case_stats_yosys.json"
+EARLY_EXIT_EPS = float(os.environ.get("MAPTEST_EARLY_EXIT_EPS", "0"))
+# 综合池与仿真池之间队列的长度（0 表示 2 * 仿真池大小）
+PIPELINE_DEPTH = int(os.environ.get("MAPTEST_PIPELINE_DEPTH", "0"))
+PROGRAM_TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "program_test")
+# 流程生成的文件，工作区中私有，其余输入文件以链接方式复用
+CASE_OUTPUTS = ["syn_yosys.v", "syn_yosys_*.v", "old_syn_yosys.v", "wave_1", "wave_2",
+                "file1.txt", "file2.txt", "output.txt", "wave_m", "miter_*.v", "miter_out.txt",
+                "*.vcd", "*.lxt", "*.lxt2", "*.fst", "*.log", "*.log.gz", "*.log.zst"]
+
+
+_CORPUS_FP = {}
+_CASE_ORDER = {}
+_EVAL_CACHE = None
+_SCHEDULER = None
+_ARTIFACTS = None
+_LOCK = threading.Lock()
+_ARCHIVE_LOCKS = {}
+
+
+def tool_ids():
+    return [baseline_cache.tool_identity("yosys", ("-V",)),
+            baseline_cache.tool_identity("iverilog", ("-V",)),
+            baseline_cache.tool_identity("vvp", ("-V",))]
+
+
+def cache_tool():
+    """
+    评估缓存键的 tool 部分：工具版本、比较方式（miter / 波形）与超时策略
+    """
+    return "|".join(tool_ids() + [f"miter={int(MITER_MODE)}", tool_runner.policy(DEFAULT_TIMEOUT_SEC)])
+
+
+def baseline_store():
+    return baseline_cache.BaselineStore(BASELINE_CACHE_DIR, tool_ids(), BASELINE_FILES)
+
+
+def corpus_fingerprint(base_dir=None, yosys_tb="yosys_testbench.v"):
+    """
+    测试集指纹：所有样例 rtl.v 与 testbench 的哈希（每个进程只算一次）
+    """
+    base_dir = os.path.abspath(base_dir or PROGRAM_TEST_DIR)
+    with _LOCK:
+        if base_dir in _CORPUS_FP:
+            return _CORPUS_FP[base_dir]
+    h = hashlib.sha256()
+    for folder in sorted(os.listdir(base_dir)):
+        folder_path = os.path.join(base_dir, folder, "equiv_identity_yosys")
+        for fn in ("rtl.v", yosys_tb):
+            fp = os.path.join(folder_path, fn)
+            if os.path.isfile(fp):
+                h.update(f"{folder}/{fn}:{baseline_cache.file_digest(fp)}\n".encode())
+    with _LOCK:
+        _CORPUS_FP[base_dir] = h.hexdigest()
+    return _CORPUS_FP[base_dir]
+
+
+def get_eval_cache():
+    global _EVAL_CACHE
+    with _LOCK:
+        if _EVAL_CACHE is None:
+            _EVAL_CACHE = eval_cache.EvalCache(EVAL_CACHE_PATH)
+        return _EVAL_CACHE
+
+
+def get_scheduler():
+    global _SCHEDULER
+    with _LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = case_scheduler.CaseScheduler(CASE_STATS_PATH)
+        return _SCHEDULER
+
+
+def get_artifact_store():
+    global _ARTIFACTS
+    with _LOCK:
+        if _ARTIFACTS is None:
+            _ARTIFACTS = artifact_store.ArtifactStore(ARTIFACT_DIR)
+        return _ARTIFACTS
+
+
+def run_baseline(folder_path, yosys_tb, timeout_sec, log=print):
+    """
+    默认综合流程：生成 old_syn_yosys.v 与 file1.txt
+    返回记录了各阶段耗时的 tool_runner.StageBudget
+    """
+    budget = tool_runner.StageBudget(timeout_sec)
+    yosys_cmd_baseline = [
+        "yosys", "-p",
+        'read_verilog rtl.v; synth; write_verilog syn_yosys.v'
+    ]
+    log("  - Yosys baseline:", " ".join(yosys_cmd_baseline))
+    with budget.measure("yosys"):
+        tool_runner.run(yosys_cmd_baseline, folder_path, timeout_sec, stage="yosys")
+    syn_v = os.path.join(folder_path, "syn_yosys.v")
+    if not os.path.exists(syn_v):
+        raise RuntimeError("Baseline syn_yosys.v not generated")
+
+    iverilog_baseline = "iverilog -o wave_1 syn_yosys.v {}".format(yosys_tb)
+    vvp_baseline = "vvp -n wave_1 -lxt2"
+    log("  - iverilog baseline:", iverilog_baseline)
+    log("  - vvp baseline:", vvp_baseline)
+    with budget.measure("iverilog"):
+        tool_runner.run(iverilog_baseline, folder_path, timeout_sec, shell=True, stage="iverilog")
+    with budget.measure("vvp"):
+        tool_runner.run(vvp_baseline, folder_path, timeout_sec, shell=True, stage="vvp", stdout_path="file1.txt")
+
+    f1_path = os.path.join(folder_path, "file1.txt")
+    try:
+        with open(f1_path, "r") as fr:
+            txt = fr.read()
+        txt = txt.replace("wave_1", "wave_2")
+        with open(f1_path, "w") as fw:
+            fw.write(txt)
+    except Exception:
+        pass
+
+    shutil.move(syn_v, os.path.join(folder_path, "old_syn_yosys.v"))
+    return budget
+
+
+def archive_case(case_root, dst_folder, folder, failure, command=None, error=None):
+    """
+    收集失败样例 (failure: "fault" | "timeout" | "diff")
+    默认只记录引用（样例、命令序列、阶段、输出尾部），文件按内容存入 artifact_store，
+    需要时用 artifact_store.py materialize 还原到 dst_folder/folder
+    """
+    if ARCHIVE_MODE != "copy":
+        with spans.span("archive", case=folder, failure=failure):
+            get_artifact_store().add(failure, folder, case_root, collection=dst_folder, command=command, error=error)
+        return
+    dst = os.path.join(dst_folder, folder)
+    # 并行评估可能同时归档同一样例
+    with _LOCK:
+        lock = _ARCHIVE_LOCKS.setdefault(os.path.abspath(dst), threading.Lock())
+    with lock, spans.span("archive", case=folder, failure=failure):
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+        shutil.copytree(case_root, dst)
+
+
+def prepare_baseline(folder, folder_path, yosys_tb, timeout_sec, store, log=print):
+    """
+    从缓存取出或重新生成基线
+    返回 (基线键, 基线波形摘要, 基线网表指纹, 候选各阶段时限 StageBudget)
+    """
+    with spans.span("baseline", case=folder) as sp:
+        key = store.key(os.path.join(folder_path, "rtl.v"), os.path.join(folder_path, yosys_tb))
+        if store.fetch(key, folder_path):
+            log("  - baseline: cached", key[:12])
+            sp.set(cached=True)
+            meta = store.meta(key)
+            netlist_fp = meta.get("netlist_fp") or \
+                netlist_fingerprint.fingerprint(os.path.join(folder_path, "old_syn_yosys.v"))
+            budget = tool_runner.StageBudget(timeout_sec, meta.get("durations", {}))
+            return key, meta.get("trace_digest"), netlist_fp, budget
+        sp.set(cached=False)
+        budget = run_baseline(folder_path, yosys_tb, timeout_sec, log)
+        trace_digest = trace_compare.trace_digest(os.path.join(folder_path, "file1.txt"))
+        netlist_fp = netlist_fingerprint.fingerprint(os.path.join(folder_path, "old_syn_yosys.v"))
+        store.store(key, folder_path, case=folder, trace_digest=trace_digest, netlist_fp=netlist_fp,
+                    durations=budget.durations)
+        return key, trace_digest, netlist_fp, budget
+
+
+def compile_candidate(folder_path, yosys_tb, budget, log=print):
+    """
+    用 iverilog 编译 syn_yosys.v（生成 wave_2），编译失败抛出 CalledProcessError
+    """
+    iverilog_cand = "iverilog -o wave_2 syn_yosys.v {}".format(yosys_tb)
+    log("  - iverilog cand:", iverilog_cand)
+    tool_runner.run(iverilog_cand, folder_path, budget.timeout("iverilog"), shell=True, stage="iverilog")
+
+
+def simulate_candidate(folder_path, yosys_tb, budget, trace_digest, log=print):
+    """
+    仿真 syn_yosys.v 并与基线波形比较，返回 trace_compare.CompareResult
+    """
+    compile_candidate(folder_path, yosys_tb, budget, log)
+    vvp_cand = "vvp -n wave_2 -lxt2"
+    log("  - vvp cand:", vvp_cand)
+    tool_runner.run(vvp_cand, folder_path, budget.timeout("vvp"), shell=True, stage="vvp", stdout_path="file2.txt")
+
+    with spans.span("compare"):
+        result = trace_compare.compare_traces(os.path.join(folder_path, "file1.txt"),
+                                              os.path.join(folder_path, "file2.txt"),
+                                              baseline_digest=trace_digest)
+    with open(os.path.join(folder_path, "output.txt"), "w") as of:
+        of.write(result.report() + "\n")
+    return result
+
+
+def simulate_miter(folder_path, yosys_tb, budget, log=print):
+    """
+    miter 模式：基线与候选网表在同一次仿真中并排运行，首次输出不一致即停止
+    返回 miter.MiterResult；网表无法包装或包装编译失败时返回 None（改用波形比较）
+    """
+    try:
+        files = miter.build_miter(folder_path, "old_syn_yosys.v", "syn_yosys.v", yosys_tb)
+    except (miter.MiterError, OSError) as e:
+        log(f"  - miter unavailable ({e}), falling back to trace comparison")
+        return None
+    iverilog_miter = "iverilog -o wave_m {} {}".format(" ".join(files), yosys_tb)
+    vvp_miter = "vvp -n wave_m -none"
+    log("  - iverilog miter:", iverilog_miter)
+    log("  - vvp miter:", vvp_miter)
+    # miter 同时编译/仿真两份网表，时限按两倍基线计
+    try:
+        tool_runner.run(iverilog_miter, folder_path, budget.timeout("iverilog", 2), shell=True, stage="iverilog")
+    except subprocess.CalledProcessError as e:
+        # 生成的包装编译/展开失败是 MapTest 自身的问题，不算工具故障；
+        # 候选网表本身编译不过时，波形比较会单独编译它并照常报告
+        log(f"  - miter does not compile (exit {e.returncode}), falling back to trace comparison")
+        return None
+    tool_runner.run(vvp_miter, folder_path, budget.timeout("vvp", 2), shell=True, stage="vvp",
+                    stdout_path="miter_out.txt")
+    with open(os.path.join(folder_path, "miter_out.txt")) as f:
+        result = miter.parse_result(f.read())
+    with open(os.path.join(folder_path, "output.txt"), "w") as of:
+        of.write(result.report() + "\n")
+    return result
+
+
+def judge_candidate(folder_path, yosys_tb, baseline, store, stats, log=print):
+    """
+    按网表指纹判定 syn_yosys.v：与基线相同直接通过，见过的沿用记录的结论，否则仿真
+    跳过仿真时仍用 iverilog 编译候选网表，编译不过照常按工具故障处理
+    返回 trace_compare.CompareResult
+    """
+    key, trace_digest, baseline_fp, budget = baseline
+    fp = netlist_fingerprint.fingerprint(os.path.join(folder_path, "syn_yosys.v"))
+    if fp == baseline_fp:
+        compile_candidate(folder_path, yosys_tb, budget, log)
+        stats.add("identical")
+        log("  - netlist identical to baseline, simulation skipped")
+        return trace_compare.CompareResult(True)
+    seen = store.verdict(key, fp)
+    if seen is not None:
+        compile_candidate(folder_path, yosys_tb, budget, log)
+        stats.add("reused")
+        log(f"  - netlist seen before ({fp[:12]}), reusing verdict: {seen['verdict']}")
+        result_type = miter.MiterResult if seen.get("mode") == "miter" else trace_compare.CompareResult
+        result = result_type(**seen["fields"]) if "fields" in seen else \
+            trace_compare.CompareResult(seen["verdict"] == "pass", first_line=seen.get("first_line", -1),
+                                        mismatch_count=seen.get("mismatch_count", 0))
+        with open(os.path.join(folder_path, "output.txt"), "w") as of:
+            of.write(seen.get("report", "") + "\n")
+        return result
+    result = simulate_miter(folder_path, yosys_tb, budget, log) if MITER_MODE else None
+    mode = "miter"
+    if result is None:
+        result = simulate_candidate(folder_path, yosys_tb, budget, trace_digest, log)
+        mode = "trace"
+    stats.add("simulated")
+    store.record_verdict(key, fp, "pass" if result.match else "diff", mode=mode, report=result.report(),
+                         fields=dataclasses.asdict(result))
+    return result
+
+
+def _case_failed(case_root, folder, fault_folder, timeout_folder, e, log, command=None):
+    if isinstance(e, subprocess.TimeoutExpired):
+        archive_case(case_root, timeout_folder, folder, "timeout", command, e)
+        log(f"  - TIMEOUT: {e}")
+        return "timeout", log.text()
+    archive_case(case_root, fault_folder, folder, "fault", command, e)
+    log(f"  - FAULT: {e}")
+    return "fault", log.text()
+
+
+def synth_case(folder, base_dir, scratch_dir, command_sequence, check_folder, fault_folder, timeout_folder,
+               yosys_tb, timeout_sec, store, ws, stats):
+    """
+    流水线第一段：在 scratch_dir 中的私有副本上准备基线并综合候选
+    综合成功返回 pipeline.Next（仿真与比较交给仿真池），
+    否则返回 ("fault" | "timeout" | "skip", 日志)
+    """
+    log = parallel_eval.CaseLog()
+    src_root = os.path.join(base_dir, folder)
+    log(f"[CASE] {os.path.join(src_root, 'equiv_identity_yosys')}")
+
+    if not (os.path.isdir(os.path.join(src_root, "equiv_identity_yosys"))
+            and os.path.exists(os.path.join(src_root, "equiv_identity_yosys", "rtl.v"))):
+        log("  - skipped (no rtl.v)")
+        return "skip", log.text()
+
+    case_root = os.path.join(scratch_dir, folder)
+    folder_path = os.path.join(case_root, "equiv_identity_yosys")
+
+    try:
+        with spans.span("workspace", case=folder):
+            ws.build(src_root, case_root)
+        baseline = prepare_baseline(folder, folder_path, yosys_tb, timeout_sec, store, log)
+
+        
+        yosys_cmd_cand = [
+            "yosys", "-p",
+            f'read_verilog rtl.v; hierarchy; {command_sequence} write_verilog syn_yosys.v'
+        ]
+        budget = baseline[3]
+        log("  - Yosys candidate:", " ".join(yosys_cmd_cand))
+        log(f"  - limits: {budget.describe('yosys', 'iverilog', 'vvp')}")
+        tool_runner.run(yosys_cmd_cand, folder_path, budget.timeout("yosys"),
+                        stall=budget.stall("yosys"), progress=tool_runner.YOSYS_PROGRESS, stage="yosys")
+        if not os.path.exists(os.path.join(folder_path, "syn_yosys.v")):
+            raise RuntimeError("Candidate syn_yosys.v not generated")
+    except Exception as e:
+        try:
+            return _case_failed(case_root, folder, fault_folder, timeout_folder, e, log, command_sequence)
+        finally:
+            shutil.rmtree(case_root, ignore_errors=True)
+
+    def judge():
+        with spans.span("judge_case", case=folder) as sp:
+            outcome, text = judge_case(folder, case_root, yosys_tb, baseline, check_folder, fault_folder,
+                                       timeout_folder, store, stats, log, command_sequence)
+            sp.set(outcome=outcome)
+            return outcome, text
+
+    return pipeline.Next(spans.bind(judge))
+
+
+def judge_case(folder, case_root, yosys_tb, baseline, check_folder, fault_folder, timeout_folder,
+               store, stats, log, command_sequence=None):
+    """
+    流水线第二段：仿真并比较已综合的候选，之后清理样例副本
+    返回 ("pass" | "diff" | "fault" | "timeout", 日志)
+    """
+    folder_path = os.path.join(case_root, "equiv_identity_yosys")
+    try:
+        result = judge_candidate(folder_path, yosys_tb, baseline, store, stats, log)
+
+        if not result.match:
+            archive_case(case_root, check_folder, folder, "diff", command_sequence, result.summary())
+            log(f"  - DIFF: {result.summary()}, collected in check_folder.")
+            return "diff", log.text()
+        log("  - PASS: outputs equivalent.")
+        return "pass", log.text()
+
+    except Exception as e:
+        return _case_failed(case_root, folder, fault_folder, timeout_folder, e, log, command_sequence)
+
+    finally:
+        shutil.rmtree(case_root, ignore_errors=True)
+
+
+def _split_passes(command_sequence):
+    return [p.strip() for p in command_sequence.split(";") if p.strip()]
+
+
+def _run_marked(cmd, cwd, timeout_sec, stall_sec=None):
+    """
+    运行带 BEGIN/END 标记的 Yosys 批处理脚本，逐行读取输出
+    每个候选从 BEGIN 开始计时，超过 timeout_sec 则杀掉进程；
+    stall_sec 秒内没有新的 pass 输出也视为卡死
+    返回 (returncode | "timeout" | "stalled", 已完成候选, 当前候选, 输出尾部)
+    """
+    with spans.span("yosys", kind="tool", batch=True) as sp:
+        # 输出写入 yosys.log(.gz)，内存中只留尾部
+        sink = tool_runner.LogSink(os.path.join(cwd, "yosys.log"))
+        try:
+            sink.write(f"$ {' '.join(cmd)}\n".encode())
+            result = _pump_marked(cmd, cwd, timeout_sec, stall_sec, sp, sink)
+        finally:
+            sink.close()
+        rc = result[0]
+        sp.set(rc=rc if isinstance(rc, int) else None, outcome="ok" if rc == 0 else str(rc))
+        return result
+
+
+def _pump_marked(cmd, cwd, timeout_sec, stall_sec, sp, sink):
+    proc = tool_runner.spawn(cmd, cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    lines = queue.Queue()
+
+    def pump():
+        for ln in proc.stdout:
+            sink.write(ln.encode())
+            lines.put(ln)
+        lines.put(None)
+
+    pumper = threading.Thread(target=pump, daemon=True)
+    pumper.start()
+    finished, current, tail = [], None, []
+    started = progress = launched = time.monotonic()
+
+    def account(usage):
+        usage.wall_sec = time.monotonic() - launched
+        sp.set(cpu_sec=round(usage.cpu_sec, 3), peak_rss_mb=round(usage.peak_rss_mb, 1))
+        tool_runner.USAGE.add("yosys", usage)
+
+    while True:
+        try:
+            ln = lines.get(timeout=0.5)
+        except queue.Empty:
+            ln = ""
+        if ln is None:
+            break
+        if ln:
+            tail = (tail + [ln.rstrip()])[-20:]
+            word = ln.strip()
+            if tool_runner.YOSYS_PROGRESS.search(ln) or word.startswith((BATCH_BEGIN, BATCH_END)):
+                progress = time.monotonic()
+            if word.startswith(BATCH_BEGIN):
+                current, started = int(word[len(BATCH_BEGIN):]), time.monotonic()
+            elif word.startswith(BATCH_END):
+                finished.append(int(word[len(BATCH_END):]))
+                current, started = None, time.monotonic()
+        if time.monotonic() - started > timeout_sec:
+            account(tool_runner.kill(proc))
+            pumper.join(5)
+            return "timeout", finished, current, tail
+        if stall_sec is not None and time.monotonic() - progress > stall_sec:
+            account(tool_runner.kill(proc))
+            pumper.join(5)
+            return "stalled", finished, current, tail
+    account(tool_runner.reap(proc, None))
+    return proc.returncode, finished, current, tail
+
+
+def run_yosys_batch(folder_path, command_sequences, timeout_sec, log=print, stall_sec=None):
+    """
+    一个 Yosys 进程内依次综合多个候选：读入并展开一次（含所有候选共同的前缀 pass），
+    design -save 保存快照，每个候选 design -load 后写出 syn_yosys_<k>.v
+    某个候选崩溃/超时只记在它自己头上，剩余候选在新进程中继续
+    返回每个候选的 (状态, 信息)，状态为 "ok" / "fault" / "timeout"
+    """
+    passes = [_split_passes(c) for c in command_sequences]
+    common = []
+    for group in zip(*passes):
+        if any(p != group[0] for p in group):
+            break
+        common.append(group[0])
+    head = "read_verilog rtl.v; hierarchy; " + "".join(p + "; " for p in common) + "design -save maptest_base; "
+
+    results = [None] * len(command_sequences)
+    todo = list(range(len(command_sequences)))
+    while todo:
+        script = head
+        for k in todo:
+            body = "".join(p + "; " for p in passes[k][len(common):])
+            script += (f"design -load maptest_base; log {BATCH_BEGIN}{k}; {body}"
+                       f"write_verilog syn_yosys_{k}.v; log {BATCH_END}{k}; ")
+        log(f"  - Yosys batch: {len(todo)} candidates, shared prefix {len(common)} passes")
+        rc, finished, current, tail = _run_marked(["yosys", "-p", script], folder_path, timeout_sec, stall_sec)
+
+        for k in finished:
+            if os.path.exists(os.path.join(folder_path, f"syn_yosys_{k}.v")):
+                results[k] = ("ok", "")
+            else:
+                results[k] = ("fault", f"Candidate syn_yosys_{k}.v not generated")
+        status = "timeout" if rc in ("timeout", "stalled") else "fault"
+        how = {"timeout": "timed out", "stalled": f"stalled (no pass for {stall_sec:.0f}s)"}.get(rc, f"exited with {rc}")
+        msg = f"yosys batch {how}: " + " | ".join(tail[-3:])
+        if current is not None:
+            results[current] = (status, msg)
+        elif rc != 0:
+            # 展开阶段失败：剩余候选全部记为同一结果
+            for k in todo:
+                if results[k] is None:
+                    results[k] = (status, msg)
+        for k in todo:
+            if results[k] is None and rc == 0:
+                results[k] = ("fault", "candidate did not finish")
+        todo = [k for k in todo if results[k] is None]
+    return results
+
+
+def check_case_batch(folder, base_dir, scratch_dir, command_sequences, check_folder, fault_folder, timeout_folder,
+                     yosys_tb, timeout_sec, store, ws, stats):
+    """
+    批量版样例评估：一个样例上评估多个候选命令序列
+    返回每个候选的结果 ("pass" | "diff" | "fault" | "timeout" | "skip") 列表与日志
+    """
+    log = parallel_eval.CaseLog()
+    src_root = os.path.join(base_dir, folder)
+    log(f"[CASE] {os.path.join(src_root, 'equiv_identity_yosys')} ({len(command_sequences)} candidates)")
+
+    if not (os.path.isdir(os.path.join(src_root, "equiv_identity_yosys"))
+            and os.path.exists(os.path.join(src_root, "equiv_identity_yosys", "rtl.v"))):
+        log("  - skipped (no rtl.v)")
+        return ["skip"] * len(command_sequences), log.text()
+
+    case_root = os.path.join(scratch_dir, folder)
+    folder_path = os.path.join(case_root, "equiv_identity_yosys")
+
+    outcomes = []
+    try:
+        try:
+            with spans.span("workspace", case=folder):
+                ws.build(src_root, case_root)
+            baseline = prepare_baseline(folder, folder_path, yosys_tb, timeout_sec, store, log)
+        except subprocess.TimeoutExpired as te:
+            archive_case(case_root, timeout_folder, folder, "timeout", error=te)
+            log(f"  - TIMEOUT (baseline): {te}")
+            return ["timeout"] * len(command_sequences), log.text()
+        except Exception as e:
+            archive_case(case_root, fault_folder, folder, "fault", error=e)
+            log(f"  - FAULT (baseline): {e}")
+            return ["fault"] * len(command_sequences), log.text()
+
+        budget = baseline[3]
+        log(f"  - limits: {budget.describe('yosys', 'iverilog', 'vvp')} per candidate")
+        synth = run_yosys_batch(folder_path, command_sequences, budget.timeout("yosys"), log,
+                                stall_sec=budget.stall("yosys"))
+        for k, (status, msg) in enumerate(synth):
+            syn_v = os.path.join(folder_path, "syn_yosys.v")
+            try:
+                if status == "timeout":
+                    raise subprocess.TimeoutExpired(f"yosys candidate {k}", budget.timeout("yosys"), output=msg)
+                if status == "fault":
+                    raise RuntimeError(msg)
+                shutil.copyfile(os.path.join(folder_path, f"syn_yosys_{k}.v"), syn_v)
+                result = judge_candidate(folder_path, yosys_tb, baseline, store, stats, log)
+                if not result.match:
+                    archive_case(case_root, check_folder, folder, "diff", command_sequences[k], result.summary())
+                    log(f"  - [{k}] DIFF: {result.summary()}, collected in check_folder.")
+                    outcomes.append("diff")
+                else:
+                    log(f"  - [{k}] PASS: outputs equivalent.")
+                    outcomes.append("pass")
+            except subprocess.TimeoutExpired as te:
+                archive_case(case_root, timeout_folder, folder, "timeout", command_sequences[k], te)
+                log(f"  - [{k}] TIMEOUT: {te}")
+                outcomes.append("timeout")
+            except Exception as e:
+                archive_case(case_root, fault_folder, folder, "fault", command_sequences[k], e)
+                log(f"  - [{k}] FAULT: {e}")
+                outcomes.append("fault")
+            finally:
+                for fn in ("syn_yosys.v", "wave_2", "file2.txt", "output.txt", "wave_m", "miter_out.txt",
+                           miter.TOP_FILE, miter.BASE_FILE, miter.CAND_FILE):
+                    if os.path.exists(os.path.join(folder_path, fn)):
+                        os.remove(os.path.join(folder_path, fn))
+        return outcomes, log.text()
+
+    finally:
+        shutil.rmtree(case_root, ignore_errors=True)
+
+
+def diff_check(command_sequence,check_folder,fault_folder,timeout_folder,base_dir,yosys_tb,timeout_sec,
+               workers=None,scratch_root=SCRATCH_DIR,cases=None,epsilon=None,sim_workers=None,depth=None):
+    """
+    返回 case_scheduler.Counts (fault_number, timeout_number, diff_number)，提前结束时 complete 为 False
+    diff_number: compare.py 判断有差异的样例数量
+    workers: 并行综合的样例数 (默认 MAPTEST_SYNTH_WORKERS / MAPTEST_WORKERS 或 CPU 核数)
+    sim_workers: 仿真池大小 (默认 MAPTEST_SIM_WORKERS，否则同 workers)
+    depth: 已综合待仿真的样例上限 (默认 MAPTEST_PIPELINE_DEPTH 或 2 * sim_workers)
+    cases: 只评估这些样例目录 (默认 base_dir 下全部)
+    epsilon: 剩余样例对奖励的影响不超过 epsilon 时提前结束 (默认 EARLY_EXIT_EPS)
+    """
 
-    cwd = os.getcwd()
     if base_dir is None:
-        base_dir = os.path.join(cwd, "action_program_test_yosys")
+        base_dir = PROGRAM_TEST_DIR
+    if workers is None:
+        workers = parallel_eval.stage_workers("synth", parallel_eval.default_workers())
+    if sim_workers is None:
+        sim_workers = parallel_eval.stage_workers("sim", workers)
+    if depth is None:
+        depth = PIPELINE_DEPTH or 2 * sim_workers
 
     fault_number = 0
     timeout_number = 0
@@ -44,137 +602,119 @@ ber: compare.py 判断有差异的样例数量
     os.makedirs(check_folder, exist_ok=True)
     os.makedirs(fault_folder, exist_ok=True)
     os.makedirs(timeout_folder, exist_ok=True)
-
-
-    for folder in os.listdir(base_dir):
-        case_root = os.path.join(base_dir, folder)
-        folder_path = os.path.join(case_root, "equiv_identity_yosys")
-        print(f"[CASE] {folder_path}")
-
-        if not (os.path.isdir(folder_path) and os.path.exists(os.path.join(folder_path, "rtl.v"))):
-            print("  - skipped (no rtl.v)")
-            continue
-
+    store = baseline_store()
+    ws = workspace.Workspace(CASE_OUTPUTS)
+    stats = netlist_fingerprint.SkipStats()
+    scratch_dir = parallel_eval.new_scratch(scratch_root, "yosys_")
+
+    sched = get_scheduler()
+    if epsilon is None:
+        epsilon = EARLY_EXIT_EPS
+    folders = sched.order(os.listdir(base_dir) if cases is None else list(cases))
+    remaining = set(folders)
+    print(f"[SCHEDULE] {len(folders)} cases: {sched.describe(folders)}")
+
+    def synth_one(folder):
+        with spans.span("synth_case", case=folder) as sp:
+            result = synth_case(folder, base_dir, scratch_dir, command_sequence, check_folder, fault_folder,
+                                timeout_folder, yosys_tb, timeout_sec, store, ws, stats)
+            if not isinstance(result, pipeline.Next):
+                sp.set(outcome=result[0])
+            return result
+
+    def saturated():
+        return epsilon > 0 and sched.headroom(fault_number, timeout_number, remaining) < epsilon
+
+    flow = pipeline.PipelineStats(workers, sim_workers, depth)
+    with spans.span("diff_check", tool="yosys", cases=len(folders), workers=workers, sim_workers=sim_workers) as sp:
         try:
-     
-            for fn in ["syn_yosys.v", "old_syn_yosys.v", "wave_1", "wave_2",
-                       "file1.txt", "file2.txt", "output.txt"]:
-                fpath = os.path.join(folder_path, fn)
-                if os.path.exists(fpath):
-                    try:
-                        os.remove(fpath)
-                    except IsADirectoryError:
-                        shutil.rmtree(fpath, ignore_errors=True)
-
-           
-            yosys_cmd_baseline = [
-                "yosys", "-p",
-                'read_verilog rtl.v; synth; write_verilog syn_yosys.v'
-            ]
-            print("  - Yosys baseline:", " ".join(yosys_cmd_baseline))
-            subprocess.run(
-                yosys_cmd_baseline, cwd=folder_path, check=True,
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout_sec
-            )
-            syn_v = os.path.join(folder_path, "syn_yosys.v")
-            if not os.path.exists(syn_v):
-                raise RuntimeError("Baseline syn_yosys.v not generated")
-
-            
-            iverilog_baseline = "iverilog -o wave_1 syn_yosys.v {}".format(yosys_tb)
-            vvp_baseline = "vvp -n wave_1 -lxt2"
-            print("  - iverilog baseline:", iverilog_baseline)
-            print("  - vvp baseline:", vvp_baseline)
-            subprocess.run(iverilog_baseline, cwd=folder_path, shell=True, check=True,
-                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout_sec)
-            with open(os.path.join(folder_path, "file1.txt"), "w") as f1:
-                r = subprocess.run(vvp_baseline, cwd=folder_path, shell=True, check=True,
-                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout_sec)
-                f1.write(r.stdout)
-
-            
-            f1_path = os.path.join(folder_path, "file1.txt")
-            try:
-                with open(f1_path, "r") as fr:
-                    txt = fr.read()
-                txt = txt.replace("wave_1", "wave_2")
-                with open(f1_path, "w") as fw:
-                    fw.write(txt)
-            except Exception:
-                pass
-
-        
-            old_syn_v = os.path.join(folder_path, "old_syn_yosys.v")
-            shutil.move(syn_v, old_syn_v)
-
-            
-            yosys_cmd_cand = [
-                "yosys", "-p",
-                f'read_verilog rtl.v; hierarchy; {command_sequence} write_verilog syn_yosys.v'
-            ]
-            print("  - Yosys candidate:", " ".join(yosys_cmd_cand))
-            subprocess.run(
-                yosys_cmd_cand, cwd=folder_path, check=True,
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout_sec
-            )
-            if not os.path.exists(os.path.join(folder_path, "syn_yosys.v")):
-                raise RuntimeError("Candidate syn_yosys.v not generated")
-
-         
-            iverilog_cand = "iverilog -o wave_2 syn_yosys.v {}".format(yosys_tb)
-            vvp_cand = "vvp -n wave_2 -lxt2"
-            print("  - iverilog cand:", iverilog_cand)
-            print("  - vvp cand:", vvp_cand)
-            subprocess.run(iverilog_cand, cwd=folder_path, shell=True, check=True,
-                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout_sec)
-            with open(os.path.join(folder_path, "file2.txt"), "w") as f2:
-                r = subprocess.run(vvp_cand, cwd=folder_path, shell=True, check=True,
-                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout_sec)
-                f2.write(r.stdout)
-
-        
-            output_txt = os.path.join(folder_path, "output.txt")
-            with open(output_txt, "w") as outfp:
-                subprocess.run(["python3", "compare.py"], cwd=folder_path,
-                               stdout=outfp, stderr=subprocess.PIPE, text=True, check=False, timeout=timeout_sec)
-
-            with open(output_txt, "r") as of:
-                out_str = of.read()
-            has_diff = ("error" in out_str.lower()) or ("fail" in out_str.lower()) or ("number different" in out_str.lower())
-
-            if has_diff:
-                diff_number += 1
-                dst = os.path.join(check_folder, folder)
-                if os.path.exists(dst):
-                    shutil.rmtree(dst)
-                shutil.copytree(case_root, dst)
-                print("  - DIFF: outputs mismatch, copied to check_folder.")
-            else:
-                print("  - PASS: outputs equivalent.")
-
-        except subprocess.TimeoutExpired as te:
-            timeout_number += 1
-            dst = os.path.join(timeout_folder, folder)
-            if os.path.exists(dst):
-                shutil.rmtree(dst)
-            shutil.copytree(case_root, dst)
-            print(f"  - TIMEOUT: {te}")
+            for folder, (outcome, text), seconds in pipeline.run(spans.bind(synth_one), folders, workers,
+                                                                 sim_workers, depth, stop=saturated, stats=flow):
+                print(text)
+                sched.record(folder, outcome, seconds)
+                remaining.discard(folder)
+                if outcome == "fault":
+                    fault_number += 1
+                elif outcome == "timeout":
+                    timeout_number += 1
+                elif outcome == "diff":
+                    diff_number += 1
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+            sched.save()
+        sp.set(faults=fault_number, timeouts=timeout_number, diffs=diff_number,
+               evaluated=len(folders) - len(remaining))
+
+    if remaining:
+        print(f"[SCHEDULE] early exit after {len(folders) - len(remaining)}/{len(folders)} cases "
+              f"(reward headroom < {epsilon})")
+    print(ws.report())
+    print(stats.report())
+    print(flow.report())
+    print(tool_runner.USAGE.report())
+    print(f"[SUMMARY] fault={fault_number}, timeout={timeout_number}, diff={diff_number}")
+    return case_scheduler.Counts(fault_number, timeout_number, diff_number, complete=not remaining)
 
-        except Exception as e:
-            fault_number += 1
-            dst = os.path.join(fault_folder, folder)
-            if os.path.exists(dst):
-                shutil.rmtree(dst)
-            shutil.copytree(case_root, dst)
-            print(f"  - FAULT: {e}")
 
-    print(f"[SUMMARY] fault={fault_number}, timeout={timeout_number}, diff={diff_number}")
-    return fault_number, timeout_number, diff_number
 
+def diff_check_batch(command_sequences,check_folder,fault_folder,timeout_folder,base_dir,yosys_tb,timeout_sec,
+                     workers=None,scratch_root=SCRATCH_DIR):
+    """
+    批量版 diff_check：每个样例只启动一个 Yosys 进程评估全部候选
+    返回每个候选的 (fault_number, timeout_number, diff_number) 列表
+    """
+    if base_dir is None:
+        base_dir = PROGRAM_TEST_DIR
+    if workers is None:
+        workers = parallel_eval.default_workers()
 
+    counts = [[0, 0, 0] for _ in command_sequences]
 
-def Evaluate_main(new_episode,command_sequence):
-    test_file_update()
+    os.makedirs(check_folder, exist_ok=True)
+    os.makedirs(fault_folder, exist_ok=True)
+    os.makedirs(timeout_folder, exist_ok=True)
+    store = baseline_store()
+    ws = workspace.Workspace(CASE_OUTPUTS)
+    stats = netlist_fingerprint.SkipStats()
+    scratch_dir = parallel_eval.new_scratch(scratch_root, "yosys_batch_")
+
+    sched = get_scheduler()
+    folders = sched.order(os.listdir(base_dir))
+    print(f"[SCHEDULE] {len(folders)} cases: {sched.describe(folders)}")
+
+    def run_one(folder):
+        t0 = time.perf_counter()
+        outcomes, text = check_case_batch(folder, base_dir, scratch_dir, command_sequences, check_folder,
+                                          fault_folder, timeout_folder, yosys_tb, timeout_sec, store, ws, stats)
+        seconds = (time.perf_counter() - t0) / max(1, len(outcomes))
+        for outcome in outcomes:
+            sched.record(folder, outcome, seconds)
+        return outcomes, text
+
+    try:
+        for folder, (outcomes, text) in parallel_eval.run_cases(run_one, folders, workers):
+            print(text)
+            for k, outcome in enumerate(outcomes):
+                if outcome == "fault":
+                    counts[k][0] += 1
+                elif outcome == "timeout":
+                    counts[k][1] += 1
+                elif outcome == "diff":
+                    counts[k][2] += 1
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        sched.save()
+
+    print(ws.report())
+    print(stats.report())
+    print(tool_runner.USAGE.report())
+    for k, (f, t, d) in enumerate(counts):
+        print(f"[SUMMARY {k}] fault={f}, timeout={t}, diff={d}")
+    return [tuple(c) for c in counts]
+
+
+
+def evaluate_counts(new_episode,command_sequence,cases=None,epsilon=None):
     print(new_episode)
     print(command_sequence)
 
@@ -184,18 +724,149 @@ def Evaluate_main(new_episode,command_sequence):
     os.makedirs(f"timeout_collection_yosys/{new_episode}", exist_ok=True)
     os.makedirs(f"fault_collection_yosys/{new_episode}", exist_ok=True)
 
+    os.makedirs(f"check_collection_yosys/{new_episode}", exist_ok=True)
+
     timeout_folder = f"timeout_collection_yosys/{new_episode}"
     fault_folder = f"fault_collection_yosys/{new_episode}"
+    check_folder = f"check_collection_yosys/{new_episode}"
     print(timeout_folder)
     print(fault_folder)
 
-    base_dir="/absolute/or/relative/path/to/action_program_test_yosys",
-    yosys_tb="yosys_testbench.v",
-    timeout_sec=600
+    base_dir = PROGRAM_TEST_DIR
+    yosys_tb = "yosys_testbench.v"
+    timeout_sec = DEFAULT_TIMEOUT_SEC
     
-    faults, timeouts, diffs = diff_check(command_sequence,check_folder,fault_folder,timeout_folder,base_dir,yosys_tb,timeout_sec)
-    print(f"Fault number: {fault_number}")
-    print(f"Timeout number: {timeout_number}")
+    counts = diff_check(command_sequence,check_folder,fault_folder,timeout_folder,base_dir,yosys_tb,timeout_sec,
+                        cases=cases,epsilon=epsilon)
+    print(f"Fault number: {counts[0]}")
+    print(f"Timeout number: {counts[1]}")
+
+    return counts
 
+
+def Evaluate_main(new_episode,command_sequence):
+    fault_number, timeout_number, _ = evaluate_counts(new_episode, command_sequence)
     return fault_number, timeout_number
 
+
+def Evaluate_cached(new_episode,command_sequence):
+    """
+    先查持久化缓存，未命中再完整评估并写回
+    返回 (fault_number, timeout_number, elapsed, cached)
+    """
+    with spans.span("rollout", episode=new_episode) as sp:
+        cache = get_eval_cache()
+        corpus = corpus_fingerprint()
+        tool = cache_tool()
+        key = cache.key(command_sequence, corpus, tool)
+        sp.set(key=key[:16])
+        hit = cache.get(key)
+        if hit is not None:
+            fault_number, timeout_number, diff_number, elapsed = hit
+            print(f"[CACHE] hit fault={fault_number}, timeout={timeout_number}, diff={diff_number}, elapsed={elapsed:.1f}s")
+            sp.set(cached=True, faults=fault_number, timeouts=timeout_number, diffs=diff_number)
+            return fault_number, timeout_number, elapsed, True
+
+        t0 = time.perf_counter()
+        counts = evaluate_counts(new_episode, command_sequence)
+        elapsed = time.perf_counter() - t0
+        fault_number, timeout_number, diff_number = counts
+        # 提前结束时只跑了部分样例，不能当作全集结果写入缓存
+        if counts.complete:
+            cache.put(key, command_sequence, corpus, tool, fault_number, timeout_number, diff_number, elapsed)
+        sp.set(cached=False, faults=fault_number, timeouts=timeout_number, diffs=diff_number)
+        return fault_number, timeout_number, elapsed, False
+
+
+
+
+def Evaluate_batch(new_episode,command_sequences):
+    """
+    一次评估多个命令序列（缓存命中的直接返回，其余共用一次批量评估）
+    返回每个序列的 (fault_number, timeout_number, elapsed, cached)，批量耗时按候选数平摊
+    """
+    cache = get_eval_cache()
+    corpus = corpus_fingerprint()
+    tool = cache_tool()
+    keys = [cache.key(c, corpus, tool) for c in command_sequences]
+    results = [None] * len(command_sequences)
+    misses = []
+    for k, key in enumerate(keys):
+        hit = cache.get(key)
+        if hit is None:
+            misses.append(k)
+        else:
+            results[k] = (hit[0], hit[1], hit[3], True)
+    if not misses:
+        return results
+
+    os.makedirs(f"timeout_collection_yosys/{new_episode}", exist_ok=True)
+    os.makedirs(f"fault_collection_yosys/{new_episode}", exist_ok=True)
+    os.makedirs(f"check_collection_yosys/{new_episode}", exist_ok=True)
+
+    t0 = time.perf_counter()
+    counts = diff_check_batch([command_sequences[k] for k in misses],
+                              f"check_collection_yosys/{new_episode}",
+                              f"fault_collection_yosys/{new_episode}",
+                              f"timeout_collection_yosys/{new_episode}",
+                              PROGRAM_TEST_DIR, "yosys_testbench.v", DEFAULT_TIMEOUT_SEC)
+    elapsed = (time.perf_counter() - t0) / len(misses)
+    for k, (fault_number, timeout_number, diff_number) in zip(misses, counts):
+        cache.put(keys[k], command_sequences[k], corpus, tool, fault_number, timeout_number, diff_number, elapsed)
+        results[k] = (fault_number, timeout_number, elapsed, False)
+    return results
+
+
+def case_order(base_dir=None):
+    """
+    racing 使用的分层样例顺序（按 rtl.v 大小分层后交错，每个进程只算一次）
+    """
+    base_dir = os.path.abspath(base_dir or PROGRAM_TEST_DIR)
+    with _LOCK:
+        if base_dir not in _CASE_ORDER:
+            _CASE_ORDER[base_dir] = racing.stratified_order(base_dir, "equiv_identity_yosys")
+        return _CASE_ORDER[base_dir]
+
+
+def Evaluate_racing(new_episode,command_sequence,promote=None):
+    """
+    多保真度评估：按 racing.DEFAULT_RUNGS 逐级扩大样例子集，
+    promote(faults_upper, timeouts_lower, elapsed) 为 False 时提前停止
+    返回 (fault_number, timeout_number, elapsed, cached, fidelity)
+    未跑完全部样例时 fault/timeout 为按比例外推到全集的估计值
+    """
+    with spans.span("rollout", episode=new_episode, racing=True) as sp:
+        cache = get_eval_cache()
+        corpus = corpus_fingerprint()
+        tool = cache_tool()
+        full_key = cache.key(command_sequence, corpus, tool)
+        hit = cache.get(full_key)
+        if hit is not None:
+            fault_number, timeout_number, diff_number, elapsed = hit
+            print(f"[CACHE] hit fault={fault_number}, timeout={timeout_number}, diff={diff_number}, elapsed={elapsed:.1f}s")
+            sp.set(cached=True, faults=fault_number, timeouts=timeout_number, fidelity=1.0)
+            return fault_number, timeout_number, elapsed, True, 1.0
+
+        def evaluate_rung(rung, cases):
+            # 每级只评估新增样例，结果按样例集合单独缓存
+            # 各级不提前结束：headroom 只看本级计数，而奖励取决于累计计数；淘汰交给 racing 的 Hoeffding 界
+            subset = corpus + "|cases:" + hashlib.sha256("\n".join(cases).encode()).hexdigest()
+            key = cache.key(command_sequence, subset, tool)
+            hit = cache.get(key)
+            if hit is not None:
+                return hit[0], hit[1], hit[2], hit[3], True
+            t0 = time.perf_counter()
+            counts = evaluate_counts(new_episode, command_sequence, cases=cases, epsilon=0)
+            elapsed = time.perf_counter() - t0
+            cache.put(key, command_sequence, subset, tool, *counts, elapsed)
+            return (*counts, elapsed, False)
+
+        result = racing.race(case_order(), evaluate_rung, promote)
+        fault_number, timeout_number = result.estimate()
+        print(f"[RACE] {result.seen}/{result.total} cases, fault={result.faults}, timeout={result.timeouts}"
+              + ("" if result.seen == result.total else " (dropped)"))
+        if result.seen == result.total:
+            cache.put(full_key, command_sequence, corpus, tool, result.faults, result.timeouts, result.diffs,
+                      result.elapsed)
+        sp.set(cached=result.cached, faults=result.faults, timeouts=result.timeouts, fidelity=result.fidelity)
+        return fault_number, timeout_number, result.elapsed, result.cached, result.fidelity
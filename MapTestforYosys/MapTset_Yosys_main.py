@@ -1,9 +1,16 @@
 
+import argparse
 import random
+import time
 import numpy as np
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import os
- import Evaluate_Yosys  
+import Evaluate_Yosys
+from array_tree import ROOT, ArrayTree
+from canonical import Canonicalizer, TranspositionTable
+from snapshot import DEFAULT_EVERY, DEFAULT_PATH, Snapshotter
+from surrogate import SKIP, Surrogate
 
 
 class YosysOptimizationActions:
@@ -74,42 +81,88 @@ class YosysOptimizationActions:
 
 
 class OptimizationEnvironment:
-    def __init__(self, y_optimization_actions):
+    def __init__(self, y_optimization_actions, evaluator=None):
         self.actions = y_optimization_actions
         self.history = []
+        # evaluator: 提供 Evaluate_cached / Evaluate_batch / Evaluate_racing 的对象（如 replay.Replay），默认 Evaluate_Yosys
+        self.evaluator = evaluator or Evaluate_Yosys
 
     def reset(self):
         self.history = []
         return None
 
-    def evaluate_action(self, actions, episode):
-
-        new_episode = episode + 1
+    def command_for(self, actions):
         command_sequence = "hierarchy; proc; "
         for operation, index in actions:
             command_sequence += self.actions.get_command((operation, index)) + " "
-        command_sequence = command_sequence.strip()
-
-        fault_number, timeout_number = Evaluate_Yosys.Evaluate_main(new_episode, command_sequence)
+        return command_sequence.strip()
 
+    def reward_for(self, fault_number, timeout_number):
         theta = 0.7
-        reward = (theta * (fault_number) / (fault_number + 1)) - ((1 - theta) * (timeout_number) / (timeout_number + 1))
+        return (theta * (fault_number) / (fault_number + 1)) - ((1 - theta) * (timeout_number) / (timeout_number + 1))
+
+    def evaluate_action(self, actions, episode):
+
+        new_episode = episode + 1
+        command_sequence = self.command_for(actions)
 
-        print(f"[Eval] episode={episode+1} faults={fault_number} timeouts={timeout_number} -> reward={reward:.4f}")
+        fault_number, timeout_number, elapsed, cached = self.evaluator.Evaluate_cached(new_episode, command_sequence)
+
+        reward = self.reward_for(fault_number, timeout_number)
+
+        print(f"[Eval] episode={episode+1} faults={fault_number} timeouts={timeout_number} -> reward={reward:.4f}"
+              + (" (cached)" if cached else ""))
         return reward, command_sequence
 
+    def evaluate_actions_batch(self, actions_list, episode):
+        """
+        多个 rollout 共用一次批量评估（每个样例一个 Yosys 进程）
+        """
+        new_episode = episode + 1
+        commands = [self.command_for(actions) for actions in actions_list]
+        results = self.evaluator.Evaluate_batch(new_episode, commands)
+
+        out = []
+        for command_sequence, (fault_number, timeout_number, elapsed, cached) in zip(commands, results):
+            reward = self.reward_for(fault_number, timeout_number)
+            print(f"[Eval] episode={episode+1} faults={fault_number} timeouts={timeout_number} -> reward={reward:.4f}"
+                  + (" (cached)" if cached else " (batch)"))
+            out.append((reward, command_sequence))
+        return out
+
+    def evaluate_racing(self, actions, episode, threshold):
+        """
+        多保真度评估：threshold() 返回当前需要超过的奖励（None 表示全部跑完），
+        乐观估计也达不到时提前停止
+        返回 (reward, command_sequence, fidelity)
+        """
+        new_episode = episode + 1
+        command_sequence = self.command_for(actions)
+
+        def promote(fault_upper, timeout_lower, elapsed):
+            bar = threshold()
+            return bar is None or self.reward_for(fault_upper, timeout_lower) >= bar
+
+        fault_number, timeout_number, elapsed, cached, fidelity = \
+            self.evaluator.Evaluate_racing(new_episode, command_sequence, promote)
+        reward = self.reward_for(fault_number, timeout_number)
+        print(f"[Eval] episode={episode+1} faults={fault_number:.1f} timeouts={timeout_number:.1f} "
+              f"-> reward={reward:.4f} fidelity={fidelity:.2f}" + (" (cached)" if cached else ""))
+        return reward, command_sequence, fidelity
+
 
 
 class MCTSNode:
-    __slots__ = ("parent", "children", "untried_moves", "visits", "value_sum", "partial_actions")
+    __slots__ = ("parent", "children", "untried_moves", "visits", "value_sum", "partial_actions", "key")
 
-    def __init__(self, parent, untried_moves, partial_actions):
+    def __init__(self, parent, untried_moves, partial_actions, key=None):
         self.parent = parent
         self.children = []              
         self.untried_moves = list(untried_moves)  
         self.visits = 0
         self.value_sum = 0.0
         self.partial_actions = list(partial_actions) 
+        self.key = key                  # 规范化前缀（启用置换表时）
 
     def q(self):
         return 0.0 if self.visits == 0 else self.value_sum / self.visits
@@ -117,16 +170,18 @@ class MCTSNode:
     def is_fully_expanded(self):
         return len(self.untried_moves) == 0
 
-    def add_child(self, move, all_moves):
+    def add_child(self, move, all_moves, key=None):
         
         new_partial = self.partial_actions + [move]
-        child = MCTSNode(parent=self, untried_moves=all_moves, partial_actions=new_partial)
+        child = MCTSNode(parent=self, untried_moves=all_moves, partial_actions=new_partial, key=key)
         self.children.append(child)
         return child
 
 
 class MCTS:
-    def __init__(self, all_moves, sequence_len, uct_c=1.414, iteration_budget=1000, rollout_random=True, rng=None):
+    def __init__(self, all_moves, sequence_len, uct_c=1.414, iteration_budget=1000, rollout_random=True, rng=None,
+                 concurrency=1, virtual_loss=1.0, batch_size=1, racing=False, canonicalizer=None, reuse_tree=False,
+                 surrogate=None):
 
         self.all_moves = list(all_moves)
         self.sequence_len = sequence_len
@@ -134,76 +189,378 @@ class MCTS:
         self.iteration_budget = iteration_budget
         self.rollout_random = rollout_random
         self.rng = rng or random.Random()
+        # concurrency > 1: 同时保持多个 rollout 在评估中，选择路径上施加 virtual loss
+        self.concurrency = concurrency
+        self.virtual_loss = virtual_loss
+        # batch_size > 1: 每次评估一批 rollout（Evaluate_batch，每个样例一个 Yosys 进程）
+        self.batch_size = batch_size
+        # racing: 先在分层小子集上评估，只有可能超过当前最优的候选才扩大到更多样例；
+        # 回传时按保真度（已评估样例比例）加权
+        self.racing = racing
+        # canonicalizer: 等价命令序列（幂等 pass 重复等）归为同一规范序列；
+        # 置换表按规范前缀共享节点统计，规范序列相同的 rollout 只评估一次
+        self.canon = canonicalizer
+        self.tt = TranspositionTable() if canonicalizer is not None else None
+        # reuse_tree: 各 episode 沿用同一棵树（默认每个 episode 新建根节点）
+        self.reuse_tree = reuse_tree
+        self.root = None
+        # 检查点：snapshot.Snapshotter，每 every 次迭代原子保存一次完整状态（含未完成 search 的进度）
+        self.snapshot = None
+        self.progress = None
+        # surrogate: 在线代理模型（surrogate.Surrogate；True 用默认参数，dict 为其参数），
+        # 对同一叶节点的多个随机补全打分，只把有希望或不确定的送去真实评估
+        self.move_index = {m: i for i, m in enumerate(self.all_moves)}
+        self.surrogate = None
+        if surrogate:
+            self.surrogate = Surrogate(1 + (sequence_len + 1) * len(self.all_moves), rng=self.rng,
+                                       **(surrogate if isinstance(surrogate, dict) else {}))
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["snapshot"] = None
+        return state
 
     def search(self, env, episode):
 
-        root = MCTSNode(parent=None, untried_moves=self.all_moves, partial_actions=[])
-        best_reward = -1e9
-        best_actions = None
-        best_command = ""
-
-        for _ in range(self.iteration_budget):
-            node = root
-
-           
-            while node.children and node.is_fully_expanded() and len(node.partial_actions) < self.sequence_len:
-                node = self._select_uct(node)
-
-            
-            if len(node.partial_actions) < self.sequence_len and node.untried_moves:
-                move = node.untried_moves.pop(self.rng.randrange(len(node.untried_moves)))
-                node = node.add_child(move, self.all_moves)
-
-           
-            completed = list(node.partial_actions)
-            while len(completed) < self.sequence_len:
-                completed.append(self.all_moves[self.rng.randrange(len(self.all_moves))])
-
-          
-            reward, cmd = env.evaluate_action(completed, episode)
+        if self.concurrency > 1 or self.batch_size > 1:
+            return self._search_parallel(env, episode)
+
+        root, start_it, (best_reward, best_actions, best_command) = self._begin(episode)
+
+        def threshold():
+            return best_reward if best_actions is not None else None
+
+        for it in range(start_it, self.iteration_budget):
+            node, completed = self._descend(root)
+            decision = None
+            if self.surrogate is not None:
+                completed, decision = self._screen(node, completed, threshold())
+
+            key = self._key(completed)
+            hit = self.tt.lookup(key) if self.tt is not None else None
+            if hit is None and decision is not None and decision.verdict == SKIP:
+                # 代理模型判定超不过当前最优：以预测值（降低权重）回传，不做真实评估
+                self._backprop(node, self.surrogate.skip(decision), self.surrogate.weight)
+                self._checkpoint(episode, it + 1, (best_reward, best_actions, best_command))
+                continue
+
+            t0 = time.monotonic()
+            if hit is not None:
+                reward, cmd, fidelity = hit
+            elif self.racing:
+                reward, cmd, fidelity = env.evaluate_racing(list(key), episode, threshold)
+            else:
+                reward, cmd = env.evaluate_action(list(key), episode)
+                fidelity = 1.0
+            if hit is None and self.tt is not None:
+                self.tt.store(key, (reward, cmd, fidelity))
+            if hit is None and self.surrogate is not None and fidelity >= 1.0:
+                self.surrogate.observe(self._features(key), reward, decision, time.monotonic() - t0)
 
             
-            if reward > best_reward:
+            if fidelity >= 1.0 and reward > best_reward:
                 best_reward = reward
                 best_actions = completed
                 best_command = cmd
 
             
-            self._backprop(node, reward)
+            self._backprop(node, reward, fidelity)
+            self._checkpoint(episode, it + 1, (best_reward, best_actions, best_command))
 
         return best_actions, best_reward, best_command
 
+    def _search_parallel(self, env, episode):
+
+        root, launched, (best_reward, best_actions, best_command) = self._begin(episode)
+
+        def threshold():
+            return best_reward if best_actions is not None else None
+
+        pending = {}    # future -> [key, ...]（一批）
+        waiting = {}    # key -> [(leaf, completed), ...], 相同（规范）序列只评估一次
+        screened = {}   # key -> 代理模型的判定
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+            while launched < self.iteration_budget or pending:
+                while launched < self.iteration_budget and len(pending) < max(1, self.concurrency):
+                    batch = []
+                    while launched < self.iteration_budget and len(batch) < self.batch_size:
+                        node, completed = self._descend(root)
+                        launched += 1
+                        decision = None
+                        if self.surrogate is not None:
+                            completed, decision = self._screen(node, completed, threshold())
+                        key = self._key(completed)
+                        hit = self.tt.lookup(key) if self.tt is not None else None
+                        if hit is None and decision is not None and decision.verdict == SKIP:
+                            self._backprop(node, self.surrogate.skip(decision), self.surrogate.weight)
+                            self._checkpoint(episode, launched, (best_reward, best_actions, best_command), waiting)
+                            continue
+                        if hit is not None:
+                            reward, cmd, fidelity = hit
+                            if fidelity >= 1.0 and reward > best_reward:
+                                best_reward = reward
+                                best_actions = completed
+                                best_command = cmd
+                            self._backprop(node, reward, fidelity)
+                            self._checkpoint(episode, launched, (best_reward, best_actions, best_command), waiting)
+                            continue
+                        self._apply_virtual_loss(node)
+                        if key in waiting:
+                            waiting[key].append((node, completed))
+                            continue
+                        waiting[key] = [(node, completed)]
+                        screened[key] = decision
+                        batch.append(key)
+                    if batch:
+                        pending[pool.submit(self._evaluate_batch, env, [list(k) for k in batch], episode,
+                                            threshold)] = batch
+
+                if not pending:
+                    continue
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    batch = pending.pop(fut)
+                    results, seconds = fut.result()
+                    for key, (reward, cmd, fidelity) in zip(batch, results):
+                        if self.tt is not None:
+                            self.tt.store(key, (reward, cmd, fidelity))
+                        decision = screened.pop(key)
+                        if self.surrogate is not None and fidelity >= 1.0:
+                            self.surrogate.observe(self._features(key), reward, decision, seconds / len(batch))
+                        for node, completed in waiting.pop(key):
+                            self._revert_virtual_loss(node)
+                            if fidelity >= 1.0 and reward > best_reward:
+                                best_reward = reward
+                                best_actions = completed
+                                best_command = cmd
+                            self._backprop(node, reward, fidelity)
+                            self._checkpoint(episode, launched, (best_reward, best_actions, best_command), waiting)
+
+        return best_actions, best_reward, best_command
+
+    def _evaluate_batch(self, env, batch, episode, threshold):
+        """([(reward, cmd, fidelity), ...], 评估耗时)"""
+        t0 = time.monotonic()
+        if self.racing:
+            results = [env.evaluate_racing(completed, episode, threshold) for completed in batch]
+        elif len(batch) == 1:
+            results = [env.evaluate_action(batch[0], episode) + (1.0,)]
+        else:
+            results = [r + (1.0,) for r in env.evaluate_actions_batch(batch, episode)]
+        return results, time.monotonic() - t0
+
+    def _begin(self, episode):
+        """(root, 已完成迭代数, (best_reward, best_actions, best_command))：从快照中断处继续，否则开始新的 search"""
+        p, self.progress = self.progress, None
+        if p is not None and p["episode"] == episode:
+            # 快照时仍在评估中的 rollout 未回传，撤销其 virtual loss 后重新计入预算
+            for node in p["inflight"]:
+                self._revert_virtual_loss(node)
+            return self.root, p["it"], p["best"]
+        if not self.reuse_tree or self.root is None:
+            self.root = self._new_root()
+        return self.root, 0, (-1e9, None, "")
+
+    def _checkpoint(self, episode, it, best, waiting=None):
+        if self.snapshot is None or not self.snapshot.tick():
+            return
+        inflight = [node for waiters in (waiting or {}).values() for node, _ in waiters]
+        self.progress = {"episode": episode, "it": it - len(inflight), "best": best, "inflight": inflight}
+        try:
+            self.snapshot.save(self)
+        finally:
+            self.progress = None
+
+    def _prefix_len(self, node):
+        return len(node.partial_actions)
+
+    def _screen(self, node, completed, bar):
+        """代理模型：叶节点的若干随机补全中取上界最高者，并判定是否值得真实评估"""
+        n = self._prefix_len(node)
+        candidates = [completed]
+        for _ in range(self.surrogate.candidates - 1):
+            candidates.append(completed[:n] + [self.all_moves[self.rng.randrange(len(self.all_moves))]
+                                               for _ in range(self.sequence_len - n)])
+        decision = self.surrogate.decide([self._features(self._key(c)) for c in candidates], bar)
+        return candidates[decision.index], decision
+
+    def _features(self, seq):
+        """代理模型特征：偏置 + 各位置走法 one-hot + 走法计数"""
+        m = len(self.all_moves)
+        x = np.zeros(1 + (self.sequence_len + 1) * m)
+        x[0] = 1.0
+        for pos, move in enumerate(seq):
+            j = self.move_index[move]
+            x[1 + pos * m + j] = 1.0
+            x[1 + self.sequence_len * m + j] += 1.0
+        return x
+
+    def _key(self, completed):
+        """评估与去重所用的序列：启用置换表时为规范序列"""
+        if self.canon is None:
+            return tuple(completed)
+        return self.canon.canonical(completed)
+
+    def _new_root(self):
+        if self.tt is not None:
+            self.tt.new_search()
+        return MCTSNode(parent=None, untried_moves=self.all_moves, partial_actions=[], key=())
+
+    def _descend(self, root):
+        node = root
+
+       
+        while node.children and node.is_fully_expanded() and len(node.partial_actions) < self.sequence_len:
+            node = self._select_uct(node)
+
+        
+        if len(node.partial_actions) < self.sequence_len and node.untried_moves:
+            move = node.untried_moves.pop(self.rng.randrange(len(node.untried_moves)))
+            key = self.canon.push(node.key, move) if self.canon is not None else None
+            node = node.add_child(move, self.all_moves, key)
+
+       
+        completed = list(node.partial_actions)
+        while len(completed) < self.sequence_len:
+            completed.append(self.all_moves[self.rng.randrange(len(self.all_moves))])
+        return node, completed
+
+    def _apply_virtual_loss(self, node):
+        cur = node
+        while cur is not None:
+            cur.visits += 1
+            cur.value_sum -= self.virtual_loss
+            cur = cur.parent
+        self._share(node, 1, -self.virtual_loss)
+
+    def _revert_virtual_loss(self, node):
+        cur = node
+        while cur is not None:
+            cur.visits -= 1
+            cur.value_sum += self.virtual_loss
+            cur = cur.parent
+        self._share(node, -1, self.virtual_loss)
+
+    def _share(self, node, dvisits, dvalue):
+        """置换表：路径上每个不同的规范前缀计一次"""
+        if self.tt is None:
+            return
+        seen = set()
+        cur = node
+        while cur is not None:
+            if cur.key not in seen:
+                seen.add(cur.key)
+                self.tt.update(cur.key, dvisits, dvalue)
+            cur = cur.parent
+
+    def _stats(self, node):
+        if self.tt is None:
+            return node.visits, node.value_sum
+        return self.tt.get(node.key)
+
     def _select_uct(self, node):
        
         best_score = -1e18
         best_child = None
+        parent_visits = self._stats(node)[0]
         for ch in node.children:
-            if ch.visits == 0:
+            visits, value_sum = self._stats(ch)
+            if visits == 0:
                 score = float("inf")
             else:
-                score = ch.q() + self.c * np.sqrt(np.log(max(1, node.visits)) / ch.visits)
+                score = value_sum / visits + self.c * np.sqrt(np.log(max(1, parent_visits)) / visits)
             if score > best_score:
                 best_score = score
                 best_child = ch
         return best_child
 
-    def _backprop(self, node, reward):
+    def _backprop(self, node, reward, weight=1.0):
         cur = node
         while cur is not None:
-            cur.visits += 1
-            cur.value_sum += reward
+            cur.visits += weight
+            cur.value_sum += weight * reward
             cur = cur.parent
+        self._share(node, weight, weight * reward)
 
 
 
-def train_with_mcts(num_agents=9, episodes=10, iters_per_episode=300):
-  
-    y_actions = YosysOptimizationActions()
-    env = OptimizationEnvironment(y_actions)
-    all_moves = y_actions.enumerate_all_moves()
-    mcts = MCTS(all_moves=all_moves, sequence_len=num_agents, iteration_budget=iters_per_episode, uct_c=1.414)
+class ArrayMCTS(MCTS):
+    """
+    同一搜索流程，树改用 array_tree.ArrayTree：节点统计存于预分配的定长类型数组（array.array），
+    未尝试的走法按需生成，子节点较多时 UCT 向量化计算
+    置换表在此只用于完整序列去重，节点统计不跨路径共享
+    """
+
+    def _new_root(self):
+        if self.tt is not None:
+            self.tt.new_search()
+        self.tree = ArrayTree([len(self.all_moves)] * self.sequence_len, capacity=self.iteration_budget + 1)
+        return ROOT
+
+    def _descend(self, root):
+        t = self.tree
+        node = root
 
-    for ep in range(episodes):
+        while t.has_children(node) and t.fully_expanded(node) and not t.terminal(node):
+            node = t.select_uct(node, self.c)
+
+        if not t.fully_expanded(node):
+            node = t.expand(node, self.rng)
+
+        completed = [self.all_moves[m] for m in t.path(node)]
+        while len(completed) < self.sequence_len:
+            completed.append(self.all_moves[self.rng.randrange(len(self.all_moves))])
+        return node, completed
+
+    def _apply_virtual_loss(self, node):
+        self.tree.update(node, 1, -self.virtual_loss)
+
+    def _revert_virtual_loss(self, node):
+        self.tree.update(node, -1, self.virtual_loss)
+
+    def _select_uct(self, node):
+        return self.tree.select_uct(node, self.c)
+
+    def _prefix_len(self, node):
+        return int(self.tree.depth[node])
+
+    def _backprop(self, node, reward, weight=1.0):
+        self.tree.update(node, weight, weight * reward)
+
+
+def train_with_mcts(num_agents=9, episodes=10, iters_per_episode=300, concurrency=1, virtual_loss=1.0, batch_size=1,
+                    racing=False, engine="object", transpositions=False, reuse_tree=False,
+                    snapshot_path=None, snapshot_every=DEFAULT_EVERY, resume=False, surrogate=None, evaluator=None):
+    """
+    engine: "object"（MCTSNode 树）或 "array"（ArrayMCTS，数组树）
+    transpositions: 按规范命令序列（canonical.Canonicalizer）合并等价序列，置换表共享统计与评估结果
+    reuse_tree: 各 episode 共用一棵树，继承之前 episode 的统计
+    snapshot_path: 每 snapshot_every 次迭代及每个 episode 结束时原子保存完整搜索状态；
+    resume: 从 snapshot_path 的快照继续（episode、树、RNG、置换表及搜索参数均取自快照），快照不存在时从头开始
+    surrogate: 代理模型预筛 rollout（True 或 surrogate.Surrogate 的参数 dict）
+    evaluator: 替代 Evaluate_Yosys 的评估接口（如 replay.Replay 离线回放）
+    """
+    y_actions = YosysOptimizationActions()
+    env = OptimizationEnvironment(y_actions, evaluator)
+    snap = Snapshotter(snapshot_path, snapshot_every, module="MapTset_Yosys_main") if snapshot_path else None
+    mcts = snap.load() if snap is not None and resume else None
+    if mcts is not None:
+        print(f"[SNAPSHOT] resumed {snapshot_path} at episode {snap.driver['episode'] + 1}")
+    else:
+        if resume:
+            print(f"[SNAPSHOT] no snapshot at {snapshot_path}, starting fresh")
+        all_moves = y_actions.enumerate_all_moves()
+        engine_cls = ArrayMCTS if engine == "array" else MCTS
+        canonicalizer = Canonicalizer(y_actions) if transpositions else None
+        mcts = engine_cls(all_moves=all_moves, sequence_len=num_agents, iteration_budget=iters_per_episode, uct_c=1.414,
+                    concurrency=concurrency, virtual_loss=virtual_loss, batch_size=batch_size, racing=racing,
+                    canonicalizer=canonicalizer, reuse_tree=reuse_tree, surrogate=surrogate)
+        mcts.snapshot = snap
+    driver = snap.driver if snap is not None else {}
+    driver.setdefault("episode", 0)
+
+    for ep in range(driver["episode"], episodes):
+        driver["episode"] = ep
         print("=" * 60)
         print(f"Episode {ep + 1}/{episodes}")
         env.reset()
@@ -211,9 +568,16 @@ def train_with_mcts(num_agents=9, episodes=10, iters_per_episode=300):
         best_actions, best_reward, best_cmd = mcts.search(env, episode=ep)
 
         print(f"[MCTS] best_reward={best_reward:.4f}")
+        if mcts.tt is not None:
+            print(mcts.tt.report())
+        if mcts.surrogate is not None:
+            print(mcts.surrogate.report())
         print("[MCTS] best_actions (op, idx):", best_actions)
         print("[MCTS] Yosys command sequence:")
         print("hierarchy; proc; " + " ".join(y_actions.get_command(a) for a in best_actions))
+        driver["episode"] = ep + 1
+        if snap is not None:
+            snap.save(mcts)
 
     print("=" * 60)
     print("Done.")
@@ -221,4 +585,18 @@ def train_with_mcts(num_agents=9, episodes=10, iters_per_episode=300):
 
 if __name__ == "__main__":
 
-    train_with_mcts(num_agents=9, episodes=10, iters_per_episode=300)
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--episodes", type=int, default=10)
+    ap.add_argument("--iters", type=int, default=300)
+    ap.add_argument("--engine", choices=("object", "array"), default="object")
+    ap.add_argument("--transpositions", action="store_true", help="merge equivalent command sequences")
+    ap.add_argument("--reuse-tree", action="store_true", help="keep the tree across episodes")
+    ap.add_argument("--surrogate", action="store_true", help="pre-screen rollouts with an online reward model")
+    ap.add_argument("--snapshot", default=DEFAULT_PATH, help="snapshot file ('' disables snapshots)")
+    ap.add_argument("--snapshot-every", type=int, default=DEFAULT_EVERY)
+    ap.add_argument("--resume", action="store_true", help="continue from the snapshot")
+    args = ap.parse_args()
+
+    train_with_mcts(num_agents=9, episodes=args.episodes, iters_per_episode=args.iters, engine=args.engine,
+                    transpositions=args.transpositions, reuse_tree=args.reuse_tree, surrogate=args.surrogate,
+                    snapshot_path=args.snapshot or None, snapshot_every=args.snapshot_every, resume=args.resume)
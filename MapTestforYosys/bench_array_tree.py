@@ -0,0 +1,59 @@
+"""
+Benchmark: MCTS (MCTSNode objects) vs ArrayMCTS (array_tree) on a synthetic
+reward, without running any tool.  Reports search time and peak traced
+memory (tracemalloc, separate run so tracing does not skew the timing)
+per iteration budget.
+
+    python bench_array_tree.py --iters 1000 5000 20000
+"""
+import argparse
+import hashlib
+import random
+import time
+import tracemalloc
+
+from MapTset_Yosys_main import MCTS, ArrayMCTS, YosysOptimizationActions
+
+
+class SyntheticEnv:
+    """Deterministic pseudo-reward per action sequence (stands in for Evaluate_cached)."""
+
+    def evaluate_action(self, actions, episode):
+        h = hashlib.blake2b(repr(actions).encode(), digest_size=4).digest()
+        return int.from_bytes(h, "little") / 2 ** 32, ""
+
+
+def run(engine_cls, iters, seq_len, seed):
+    moves = YosysOptimizationActions().enumerate_all_moves()
+
+    def search():
+        mcts = engine_cls(all_moves=moves, sequence_len=seq_len, iteration_budget=iters, rng=random.Random(seed))
+        return mcts.search(SyntheticEnv(), episode=0)[1]
+
+    t0 = time.perf_counter()
+    best = search()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    search()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iters", type=int, nargs="+", default=[1000, 5000, 20000])
+    ap.add_argument("--seq-len", type=int, default=9)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    print(f"{'engine':<8} {'iters':>7} {'seconds':>9} {'us/iter':>9} {'peak MB':>9} {'best':>7}")
+    for iters in args.iters:
+        for name, cls in (("object", MCTS), ("array", ArrayMCTS)):
+            elapsed, peak, best = run(cls, iters, args.seq_len, args.seed)
+            print(f"{name:<8} {iters:>7} {elapsed:>9.2f} {1e6 * elapsed / iters:>9.1f} "
+                  f"{peak / 2 ** 20:>9.2f} {best:>7.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Benchmark: MapTest's own overhead (workspace building, tool launches, log
+handling, scheduling, tree operations) on synthetic corpora, fully offline.
+Fake yosys / iverilog / vvp from stub_tools.py are put first on PATH and
+sleep, write outputs, crash or hang according to a seeded profile.
+
+Per corpus size the phases are: generating the corpus, diff_check with
+empty baseline cache (cold), diff_check of another sequence with cached
+baselines (warm), and MCTS.search / ArrayMCTS.search through the regular
+Evaluate_Yosys path.  Reported per phase are the wall time, the tool
+launches and the time spent inside the fake tools; "harness" is the worker
+slot time (wall * (synth workers + sim workers)) not spent inside a tool,
+i.e. orchestration overhead plus idle slots, per case evaluated.  The fakes
+are Python, so their interpreter start (the "launch" line) is counted as
+harness time.
+
+    python bench_harness.py --cases 10 100 1000 --workers 4
+    python bench_harness.py --cases 10000 --phases cold warm --profile synth=0,sim=0,compile=0
+"""
+import argparse
+import contextlib
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import Counter
+
+# 卡死的假工具在几秒内被看门狗杀掉（须在导入 tool_runner 之前设置）
+os.environ.setdefault("MAPTEST_TIMEOUT_FLOOR", "5")
+os.environ.setdefault("MAPTEST_STALL_FLOOR", "2")
+
+import Evaluate_Yosys
+import stub_tools
+from MapTset_Yosys_main import MCTS, ArrayMCTS, OptimizationEnvironment, YosysOptimizationActions
+
+
+PHASES = ("cold", "warm", "mcts", "array")
+TESTBENCH = "yosys_testbench.v"
+
+
+def make_corpus(root, n, prefix, rng):
+    """n cases <prefix>_<i>/equiv_identity_yosys/{rtl.v, yosys_testbench.v} of random size."""
+    os.makedirs(root, exist_ok=True)
+    for i in range(n):
+        folder = os.path.join(root, f"{prefix}_{i:05d}", "equiv_identity_yosys")
+        os.makedirs(folder, exist_ok=True)
+        width = rng.randint(1, 32)
+        lines = [f"// synthetic case {prefix}_{i:05d}", f"module top(input [{width - 1}:0] a, b, output [{width - 1}:0] y);"]
+        lines += [f"  wire [{width - 1}:0] t{k} = a ^ (b >> {k});" for k in range(rng.randint(1, 40))]
+        lines += ["  assign y = a + b;", "endmodule"]
+        with open(os.path.join(folder, "rtl.v"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        with open(os.path.join(folder, TESTBENCH), "w") as f:
+            f.write("module tb; top dut(); endmodule\n")
+
+
+class ToolLog:
+    """Reads what the fake tools appended to MAPTEST_STUB_LOG since the last call."""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+
+    def take(self):
+        launches, seconds, events = Counter(), Counter(), Counter()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                f.seek(self.offset)
+                for line in f:
+                    tool, sec, what = line.rstrip("\n").split("\t")
+                    launches[tool] += 1
+                    seconds[tool] += float(sec)
+                    if what != "ok":
+                        events[what] += 1
+                self.offset = f.tell()
+        return launches, seconds, events
+
+
+def launch_ms(env, runs=5):
+    """Mean wall time of a no-op fake tool run (`yosys -V`)."""
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        subprocess.run(["yosys", "-V"], env={**os.environ, **env}, stdout=subprocess.DEVNULL, check=True)
+    return 1000 * (time.perf_counter() - t0) / runs
+
+
+class Counting:
+    """Evaluate_Yosys, counting the real (uncached) evaluations and their faults / timeouts."""
+
+    def __init__(self):
+        self.evals = 0
+        self.faults = 0
+        self.timeouts = 0
+
+    def Evaluate_cached(self, new_episode, command_sequence):
+        fault_number, timeout_number, elapsed, cached = Evaluate_Yosys.Evaluate_cached(new_episode, command_sequence)
+        if not cached:
+            self.evals += 1
+            self.faults += fault_number
+            self.timeouts += timeout_number
+        return fault_number, timeout_number, elapsed, cached
+
+
+def run_phase(phase, corpus, n, args, rng):
+    """Returns (cases evaluated, "faults/timeouts/diffs")."""
+    y_actions = YosysOptimizationActions()
+    moves = y_actions.enumerate_all_moves()
+    counting = Counting()
+    env = OptimizationEnvironment(y_actions, counting)
+    if phase in ("cold", "warm"):
+        command = env.command_for([moves[rng.randrange(len(moves))] for _ in range(args.seq_len)])
+        folders = [os.path.join(phase, d) for d in ("check", "fault", "timeout")]
+        counts = Evaluate_Yosys.diff_check(command, *folders, corpus, TESTBENCH, 600,
+                                           workers=args.workers, sim_workers=args.sim_workers)
+        return n, "/".join(map(str, counts))
+    # 搜索走常规的 Evaluate_cached -> evaluate_counts 路径，样例目录换成合成语料
+    Evaluate_Yosys.PROGRAM_TEST_DIR = corpus
+    # 每个搜索阶段用新的评估缓存，否则后一阶段的 rollout 全部命中前一阶段（或上次运行）的结果
+    cache_path = f"eval_cache_{n}_{phase}.sqlite"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(cache_path + suffix):
+            os.remove(cache_path + suffix)
+    Evaluate_Yosys.EVAL_CACHE_PATH = cache_path
+    Evaluate_Yosys._EVAL_CACHE = None
+    engine_cls = ArrayMCTS if phase == "array" else MCTS
+    mcts = engine_cls(all_moves=moves, sequence_len=args.seq_len, iteration_budget=args.iters,
+                      rng=random.Random(args.seed))
+    mcts.search(env, episode=PHASES.index(phase))
+    return counting.evals * n, f"{counting.faults}/{counting.timeouts}/-"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases", type=int, nargs="+", default=[10, 100])
+    ap.add_argument("--phases", nargs="+", default=list(PHASES), choices=PHASES)
+    ap.add_argument("--profile", default="", help="stub_tools profile, e.g. synth=0.05,crash=0.02,seed=3")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--sim-workers", type=int, default=4)
+    ap.add_argument("--iters", type=int, default=4, help="MCTS iterations (one full-corpus evaluation each)")
+    ap.add_argument("--seq-len", type=int, default=9)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workdir", default=None, help="keep corpora, caches and logs here (default: temporary)")
+    ap.add_argument("--verbose", action="store_true", help="show the per-case output of the flows")
+    args = ap.parse_args()
+
+    profile = stub_tools.parse_profile(args.profile)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="maptest_bench_"))
+    os.makedirs(workdir, exist_ok=True)
+    env = stub_tools.install(os.path.join(workdir, "bin"), profile, os.path.join(workdir, "stub_tools.log"))
+    os.environ.update(env)
+    tools = ToolLog(env["MAPTEST_STUB_LOG"])
+    slots = args.workers + args.sim_workers
+    rng = random.Random(args.seed)
+    cwd = os.getcwd()
+
+    print(f"[BENCH] workdir {workdir}, profile {stub_tools.format_profile(profile)}")
+    print(f"[BENCH] launch {launch_ms(env):.1f} ms per fake tool run, {args.workers}+{args.sim_workers} workers")
+    tools.take()
+    print(f"{'cases':>6} {'phase':<6} {'wall s':>8} {'launches':>9} {'tool s':>8} {'harness s':>10} "
+          f"{'ms/case':>8} {'f/t/d':>9} {'crash/hang':>11}")
+    try:
+        os.chdir(workdir)
+        for n in args.cases:
+            corpus = os.path.join(workdir, f"corpus_{n}")
+            t0 = time.perf_counter()
+            make_corpus(corpus, n, f"c{n}", rng)
+            print(f"{n:>6} {'corpus':<6} {time.perf_counter() - t0:>8.2f}")
+            for phase in args.phases:
+                t0 = time.perf_counter()
+                with contextlib.ExitStack() as stack:
+                    if not args.verbose:
+                        stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+                    evaluated, counts = run_phase(phase, corpus, n, args, rng)
+                wall = time.perf_counter() - t0
+                launches, seconds, events = tools.take()
+                tool_sec = sum(seconds.values())
+                harness = max(0.0, wall * slots - tool_sec)
+                crashed = f"{events['crash']}/{events['hang']}"
+                per_case = f"{1000 * harness / evaluated:.1f}" if evaluated else "n/a"
+                print(f"{n:>6} {phase:<6} {wall:>8.2f} {sum(launches.values()):>9} {tool_sec:>8.2f} "
+                      f"{harness:>10.2f} {per_case:>8} {counts:>9} {crashed:>11}")
+                print("       " + ", ".join(f"{t} {launches[t]}x {seconds[t]:.2f}s" for t in sorted(launches)))
+    finally:
+        os.chdir(cwd)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Canonical Yosys command sequences and a transposition table keyed by them.
+
+The search treats every ordered list of (op, idx) moves as its own leaf, but
+many of them produce the same netlist: running an idempotent pass twice in a
+row does nothing the first run did not, and some passes subsume a neighbour
+("opt_clean; opt_clean -purge;" is just "opt_clean -purge;").  Such
+sequences are rewritten left to right with adjacent-pair rules
+
+    (a, b) -> c        a directly followed by b behaves like c alone
+
+where an idempotent pass p is the rule (p, p) -> p.  A move is appended with
+push(), which keeps reducing against the tail, so keys of tree prefixes are
+built incrementally.  Rules must be sound (both sides give the same netlist);
+a missing rule only costs a duplicate evaluation.
+
+The defaults are deliberately conservative and can be replaced through the
+environment (commands without the trailing ';', comma separated):
+
+    MAPTEST_CANON_IDEMPOTENT="opt_clean,opt_clean -purge,memory_map"
+    MAPTEST_CANON_ABSORB="opt_clean+opt_clean -purge=opt_clean -purge"
+
+TranspositionTable holds, per canonical key, the visit / value statistics
+shared by every tree node with that prefix and the evaluation result of
+complete sequences, so equivalent rollouts are evaluated only once.
+"""
+import os
+
+
+DEFAULT_IDEMPOTENT = (
+    "opt_clean", "opt_clean -purge",
+    "opt_merge", "opt_merge -share_all",
+    "memory_collect", "memory_unpack", "memory_map",
+)
+DEFAULT_ABSORB = (
+    ("opt_clean", "opt_clean -purge", "opt_clean -purge"),
+    ("opt_clean -purge", "opt_clean", "opt_clean -purge"),
+)
+
+
+def normalize(command):
+    return command.strip().rstrip(";").strip()
+
+
+def _env_idempotent():
+    env = os.environ.get("MAPTEST_CANON_IDEMPOTENT")
+    if env is None:
+        return DEFAULT_IDEMPOTENT
+    return tuple(normalize(c) for c in env.split(",") if normalize(c))
+
+
+def _env_absorb():
+    env = os.environ.get("MAPTEST_CANON_ABSORB")
+    if env is None:
+        return DEFAULT_ABSORB
+    rules = []
+    for item in env.split(","):
+        if not item.strip():
+            continue
+        pair, _, result = item.partition("=")
+        a, _, b = pair.partition("+")
+        if not (a.strip() and b.strip() and result.strip()):
+            raise ValueError(f"MAPTEST_CANON_ABSORB: expected 'a+b=c', got {item!r}")
+        rules.append((normalize(a), normalize(b), normalize(result)))
+    return tuple(rules)
+
+
+class Canonicalizer:
+
+    def __init__(self, actions, idempotent=None, absorb=None):
+        """actions: YosysOptimizationActions; rules are given as command strings."""
+        by_command = {}
+        for move in actions.enumerate_all_moves():
+            by_command.setdefault(normalize(actions.get_command(move)), []).append(move)
+
+        def moves(command):
+            return by_command.get(normalize(command), [])
+
+        self.rules = {}
+        for command in (_env_idempotent() if idempotent is None else idempotent):
+            for m in moves(command):
+                self.rules[(m, m)] = m
+        for a, b, c in (_env_absorb() if absorb is None else absorb):
+            if not moves(c):
+                continue
+            for ma in moves(a):
+                for mb in moves(b):
+                    self.rules[(ma, mb)] = moves(c)[0]
+
+    def push(self, key, move):
+        """Canonical key of key + [move] (key must already be canonical)."""
+        while key:
+            merged = self.rules.get((key[-1], move))
+            if merged is None:
+                break
+            key, move = key[:-1], merged
+        return key + (move,)
+
+    def canonical(self, actions):
+        key = ()
+        for move in actions:
+            key = self.push(key, move)
+        return key
+
+
+class TranspositionTable:
+
+    def __init__(self):
+        self.stats = {}         # key -> [visits, value_sum]
+        self.results = {}       # key -> (reward, command, fidelity)
+        self.hits = 0
+        self.evals = 0
+
+    def new_search(self):
+        """New tree: drop shared statistics and partial-fidelity results, keep full evaluations."""
+        self.stats.clear()
+        self.results = {k: r for k, r in self.results.items() if r[2] >= 1.0}
+
+    def get(self, key):
+        return self.stats.get(key, (0, 0.0))
+
+    def update(self, key, dvisits, dvalue):
+        s = self.stats.get(key)
+        if s is None:
+            s = self.stats[key] = [0, 0.0]
+        s[0] += dvisits
+        s[1] += dvalue
+
+    def lookup(self, key):
+        r = self.results.get(key)
+        if r is not None:
+            self.hits += 1
+        return r
+
+    def store(self, key, result):
+        self.evals += 1
+        self.results[key] = result
+
+    def report(self):
+        total = self.hits + self.evals
+        saved = self.hits / total if total else 0.0
+        return (f"[TT] {len(self.results)} sequences, {len(self.stats)} prefixes, "
+                f"{self.hits} hits / {total} rollouts ({saved:.0%} not re-evaluated)")
@@ -0,0 +1,142 @@
+"""
+Yield-ordered case scheduling with early exit.
+
+Per-case history (runs, faults, timeouts, diffs, total seconds) is kept in a
+JSON file across evaluations.  Cases are run in order of expected yield per
+second: smoothed (fault + timeout) rate divided by mean runtime, so the
+historically fault-prone and cheap cases come first.
+
+The reward theta*f/(f+1) - (1-theta)*t/(t+1) saturates quickly.  Once the
+cases still outstanding cannot move it by more than epsilon, the evaluation
+stops.  Only cases that could still fault / time out count towards that
+bound; a case counts unless it has run at least min_history times without
+ever doing so.  A reward with an elapsed-time penalty passes its weight per
+second, and the remaining cases are charged their mean runtime back to back.
+
+diff_check returns Counts: stopping early leaves counts for part of the
+corpus only, which callers must not store as a full-corpus result.
+"""
+import json
+import os
+import threading
+import uuid
+
+
+DEFAULT_THETA = 0.7
+DEFAULT_MIN_HISTORY = 5
+_PRIOR_WEIGHT = 2.0
+_FIELDS = ("runs", "faults", "timeouts", "diffs", "seconds")
+
+
+class Counts(tuple):
+    """(faults, timeouts, diffs) of one diff_check; complete is False after an early exit."""
+
+    def __new__(cls, faults, timeouts, diffs, complete=True):
+        self = super().__new__(cls, (faults, timeouts, diffs))
+        self.complete = complete
+        return self
+
+
+def reward(faults, timeouts, theta=DEFAULT_THETA):
+    return theta * faults / (faults + 1.0) - (1 - theta) * timeouts / (timeouts + 1.0)
+
+
+class CaseScheduler:
+
+    def __init__(self, path, theta=DEFAULT_THETA, min_history=DEFAULT_MIN_HISTORY):
+        self.path = os.path.abspath(path)
+        self.theta = theta
+        self.min_history = min_history
+        self._lock = threading.Lock()
+        self._stats = self._load()
+        self._delta = {}
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, case, outcome, seconds):
+        if outcome not in ("pass", "diff", "fault", "timeout"):
+            return
+        with self._lock:
+            for stats in (self._stats, self._delta):
+                s = stats.setdefault(case, dict.fromkeys(_FIELDS, 0))
+                s["runs"] += 1
+                s["seconds"] += seconds
+                if outcome == "fault":
+                    s["faults"] += 1
+                elif outcome == "timeout":
+                    s["timeouts"] += 1
+                elif outcome == "diff":
+                    s["diffs"] += 1
+
+    def save(self):
+        """Merge this process's new records into the file (other runs may have written it)."""
+        with self._lock:
+            if not self._delta:
+                return
+            merged = self._load()
+            for case, d in self._delta.items():
+                s = merged.setdefault(case, dict.fromkeys(_FIELDS, 0))
+                for k in _FIELDS:
+                    s[k] = s.get(k, 0) + d[k]
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.tmp-{uuid.uuid4().hex}"
+            with open(tmp, "w") as f:
+                json.dump(merged, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+            self._stats = merged
+            self._delta = {}
+
+    def _score(self, case, prior_rate, prior_seconds):
+        s = self._stats.get(case)
+        if not s or not s["runs"]:
+            return prior_rate / prior_seconds
+        rate = (s["faults"] + s["timeouts"] + _PRIOR_WEIGHT * prior_rate) / (s["runs"] + _PRIOR_WEIGHT)
+        return rate / max(s["seconds"] / s["runs"], 1e-3)
+
+    def order(self, cases):
+        """Cases sorted by expected faults+timeouts per second, best first."""
+        with self._lock:
+            seen = [self._stats[c] for c in cases if self._stats.get(c, {}).get("runs")]
+            runs = sum(s["runs"] for s in seen)
+            prior_rate = (sum(s["faults"] + s["timeouts"] for s in seen) + 1.0) / (runs + 2.0)
+            prior_seconds = max(sum(s["seconds"] for s in seen) / runs if runs else 1.0, 1e-3)
+            return sorted(cases, key=lambda c: -self._score(c, prior_rate, prior_seconds))
+
+    def _could(self, case, field):
+        s = self._stats.get(case)
+        return not s or s["runs"] < self.min_history or s[field] > 0
+
+    def _seconds(self, cases):
+        """Expected serial runtime of cases: mean per-case seconds, prior mean for unseen ones."""
+        seen = [self._stats[c] for c in cases if self._stats.get(c, {}).get("runs")]
+        runs = sum(s["runs"] for s in seen)
+        prior = sum(s["seconds"] for s in seen) / runs if runs else 1.0
+        return sum(s["seconds"] / s["runs"] for s in seen) + prior * (len(cases) - len(seen))
+
+    def headroom(self, faults, timeouts, remaining, seconds_weight=0.0):
+        """
+        Largest change of the reward the remaining cases can still cause.
+        seconds_weight: reward lost per extra second of evaluation (lam / T_avg for
+        a penalty lam * max(0, T / T_avg - 1)); 0 for a reward without one.
+        """
+        with self._lock:
+            more_f = sum(1 for c in remaining if self._could(c, "faults"))
+            more_t = sum(1 for c in remaining if self._could(c, "timeouts"))
+            slower = seconds_weight * self._seconds(remaining) if seconds_weight and remaining else 0.0
+        now = reward(faults, timeouts, self.theta)
+        return max(reward(faults + more_f, timeouts, self.theta) - now,
+                   now - reward(faults, timeouts + more_t, self.theta) + slower)
+
+    def describe(self, ordered, limit=8):
+        with self._lock:
+            parts = []
+            for c in ordered[:limit]:
+                s = self._stats.get(c)
+                parts.append(f"{c}({s['faults'] + s['timeouts']}/{s['runs']})" if s and s["runs"] else f"{c}(new)")
+        more = f" ... +{len(ordered) - limit}" if len(ordered) > limit else ""
+        return ", ".join(parts) + more
@@ -0,0 +1,268 @@
+"""
+Single-run miter of the baseline and the candidate netlist.
+
+Instead of compiling and simulating both netlists separately and comparing
+the text traces, both are compiled into one simulation:
+
+    miter_base.v   baseline netlist, every module renamed base__<name>
+    miter_cand.v   candidate netlist, every module renamed cand__<name>
+    miter_top.v    wrapper with the ports of the original top module
+
+The wrapper takes the place of the design under test in the existing
+testbench.  The baseline drives the wrapper outputs, so the testbench sees
+exactly the baseline behaviour; the candidate runs on the same inputs.  The
+outputs are compared twice:
+
+    - on every stimulus (any input change, clock edges included) the wrapper
+      first compares the outputs, i.e. the settled response to the previous
+      stimulus (the pre-edge values for a clock edge), and only then passes
+      the new input values on to both netlists (only the first stimulus of a
+      time step samples, later ones in the same step would see outputs still
+      propagating);
+    - whenever an output of either netlist changes, once the time step has
+      settled (#0, after all active events), so the response to the last
+      stimulus before $finish, and output changes with no later stimulus,
+      are checked too.
+
+At the first divergence the simulation prints
+
+    MITER_DIFF t=<time> port=<name> base=<value> cand=<value>
+
+and calls $finish.
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from netlist_fingerprint import strip_comments
+
+
+MARK = "MITER_DIFF"
+BASE_PREFIX = "base__"
+CAND_PREFIX = "cand__"
+IN_PREFIX = "in__"
+BASE_FILE = "miter_base.v"
+CAND_FILE = "miter_cand.v"
+TOP_FILE = "miter_top.v"
+
+BACKSLASH = "\\"
+_ID = r"(?:\\\S+|[A-Za-z_][\w$]*)"
+_MODULE_RE = re.compile(r"\bmodule\s+(" + _ID + r")")
+_HEADER_RE = re.compile(r"\bmodule\s+(" + _ID + r")\s*(?:#\s*\((?:[^()]|\([^()]*\))*\)\s*)?(?:\((.*?)\))?\s*;", re.S)
+_DECL_RE = re.compile(r"\b(input|output|inout)\b([^;]*);")
+_RANGE_RE = re.compile(r"\[[^\]]*\]")
+_TIMESCALE_RE = re.compile(r"`timescale\s+\S+\s*/\s*(\d+\s*\w+)")
+_DIFF_RE = re.compile(MARK + r" t=(\S+) port=(\S+) base=(\S+) cand=(\S+)")
+
+
+class MiterError(ValueError):
+    pass
+
+
+@dataclass
+class MiterResult:
+    match: bool
+    time: str = ""
+    port: str = ""
+    base: str = ""
+    cand: str = ""
+
+    def report(self) -> str:
+        if self.match:
+            return "match: outputs identical (miter)"
+        return f"error: outputs differ at t={self.time}, port {self.port}: base={self.base} cand={self.cand}"
+
+    def summary(self) -> str:
+        return f"outputs mismatch at t={self.time} on {self.port} (base={self.base}, cand={self.cand})"
+
+
+def _modules(text: str) -> List[str]:
+    return _MODULE_RE.findall(text)
+
+
+def find_top(text: str) -> str:
+    """The module no other module of the netlist instantiates ("top" on a tie)."""
+    names = _modules(text)
+    if not names:
+        raise MiterError("no module in netlist")
+    used = {n for n in names if re.search(r"^\s*" + re.escape(n) + r"\s+(?:#|\\|[A-Za-z_])", text, re.M)}
+    roots = [n for n in names if n not in used] or names
+    return "top" if "top" in roots else roots[0]
+
+
+def _renamed(name: str, prefix: str) -> str:
+    return BACKSLASH + prefix + name[1:] if name.startswith(BACKSLASH) else prefix + name
+
+
+def rename_modules(text: str, prefix: str) -> str:
+    """Prefix the declaration and every instantiation of the netlist's own modules."""
+    text = strip_comments(text)
+    for name in _modules(text):
+        pat = re.escape(name) + (r"(?=\s)" if name.startswith(BACKSLASH) else r"\b")
+        new = _renamed(name, prefix).replace(BACKSLASH, BACKSLASH * 2)
+        text = re.sub(r"(\bmodule\s+)" + pat, r"\g<1>" + new, text)
+        text = re.sub(r"^(\s*)" + pat + r"(?=\s+(?:#|\\|[A-Za-z_]))", r"\g<1>" + new, text, flags=re.M)
+    return text
+
+
+def top_ports(text: str, top: str) -> List[Tuple[str, str, str]]:
+    """[(direction, range, name)] of top in header order; ANSI and non-ANSI headers."""
+    # 转义标识符（如 \\y[0]）先换成占位名，避免其中的 [..] 被当作位宽
+    escaped = {}
+
+    def protect(m):
+        return escaped.setdefault(m.group(0), f"__maptest_esc{len(escaped)}")
+
+    text = re.sub(r"\\\S+", protect, strip_comments(text))
+    top = re.sub(r"\\\S+", protect, top)
+    for m in _HEADER_RE.finditer(text):
+        if m.group(1) == top:
+            break
+    else:
+        raise MiterError(f"module {top} not found")
+    header = m.group(2) or ""
+    body = text[m.end():text.find("endmodule", m.end())]
+
+    decls = {}
+    direction, rng = None, ""
+    order = []
+    for item in header.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        dm = re.match(r"(input|output|inout)\b(.*)", item, re.S)
+        if dm:
+            direction, rest = dm.group(1), dm.group(2)
+            r = _RANGE_RE.search(rest)
+            rng = r.group(0) if r else ""
+            item = _RANGE_RE.sub(" ", rest)
+            item = re.sub(r"\b(wire|reg|logic|signed|unsigned)\b", " ", item)
+        elif direction is not None:
+            r = _RANGE_RE.search(item)
+            if r:
+                rng = r.group(0)
+                item = _RANGE_RE.sub(" ", item)
+        name = item.split()[-1] if item.split() else ""
+        if not name:
+            continue
+        order.append(name)
+        if direction is not None:
+            decls[name] = (direction, rng)
+    for dm in _DECL_RE.finditer(body):
+        rest = dm.group(2)
+        r = _RANGE_RE.search(rest)
+        rest = re.sub(r"\b(wire|reg|logic|signed|unsigned)\b", " ", _RANGE_RE.sub(" ", rest))
+        for name in rest.split(","):
+            name = name.strip()
+            if name:
+                decls[name] = (dm.group(1), r.group(0) if r else "")
+    original = {v: k for k, v in escaped.items()}
+    ports = []
+    for name in order:
+        if name not in decls:
+            raise MiterError(f"no direction for port {name} of {top}")
+        ports.append((decls[name][0], decls[name][1], original.get(name, name)))
+    if not any(d == "output" for d, _, _ in ports):
+        raise MiterError(f"module {top} has no outputs")
+    return ports
+
+
+def _ref(name: str) -> str:
+    # 转义标识符必须以空白结束
+    return name + " " if name.startswith(BACKSLASH) else name
+
+
+def wrapper(top: str, ports: List[Tuple[str, str, str]], timescale: Optional[str]) -> str:
+    outputs = [(rng, n) for d, rng, n in ports if d == "output"]
+    inputs = [(rng, n) for d, rng, n in ports if d == "input"]
+    if not inputs:
+        raise MiterError(f"module {top} has no inputs to sample on")
+    cand = {n: _ref(_renamed(n, CAND_PREFIX)) for _, n in outputs}
+    held = {n: _ref(_renamed(n, IN_PREFIX)) for _, n in inputs}
+    # 输入经 held 寄存器转发给两份网表；inout 仍直接相连
+    conn = {**cand, **held}
+
+    compare = []
+    for _, n in outputs:
+        compare.append(f"      if ({_ref(n)} !== {cand[n]}) begin")
+        compare.append(f'        $display("{MARK} t=%0t port={n.lstrip(BACKSLASH)} base=%h cand=%h", '
+                       f"$time, {_ref(n)}, {cand[n]});")
+        compare.append("        $finish;")
+        compare.append("      end")
+
+    lines = [f"`timescale {timescale}/{timescale}"] if timescale else []
+    lines.append(f"module {top}(" + ", ".join(_ref(n) for _, _, n in ports) + ");")
+    for d, rng, n in ports:
+        lines.append(" ".join(w for w in ("  " + d, rng, _ref(n)) if w) + ";")
+    for rng, n in outputs:
+        lines.append(" ".join(w for w in ("  wire", rng, cand[n]) if w) + ";")
+    for rng, n in inputs:
+        lines.append(" ".join(w for w in ("  reg", rng, held[n]) if w) + ";")
+    lines.append("  reg maptest_started = 1'b0;")
+    lines.append("  time maptest_t = 0;")
+    lines.append(f"  {_ref(_renamed(top, BASE_PREFIX))} base ("
+                 + ", ".join(f".{_ref(n)}({held.get(n, _ref(n))})" for _, _, n in ports) + ");")
+    lines.append(f"  {_ref(_renamed(top, CAND_PREFIX))} cand ("
+                 + ", ".join(f".{_ref(n)}({conn.get(n, _ref(n))})" for _, _, n in ports) + ");")
+    # 每个时间步的第一个激励先比较上一激励稳定后的输出（时钟沿即沿前的值），再把新输入交给两份网表；
+    # 同一时间步内的后续激励不比较（输出可能仍在传播），第一次激励之前输入尚未驱动，也不比较
+    lines.append("  always @(" + " or ".join(_ref(n) for _, n in inputs) + ") begin")
+    lines.append("    if (maptest_started && $time != maptest_t) begin")
+    lines.extend(compare)
+    lines.append("    end")
+    lines.append("    maptest_started = 1'b1;")
+    lines.append("    maptest_t = $time;")
+    for _, n in inputs:
+        lines.append(f"    {held[n]} = {_ref(n)};")
+    lines.append("  end")
+    # 输出变化后等本时间步的活动事件执行完（#0）再比较：覆盖最后一个激励的响应，以及之后没有激励的输出变化
+    lines.append("  always @(" + " or ".join(f"{_ref(n)} or {cand[n]}" for _, n in outputs) + ") begin")
+    lines.append("    #0;")
+    lines.append("    if (maptest_started) begin")
+    lines.extend(compare)
+    lines.append("    end")
+    lines.append("  end")
+    lines.append("endmodule")
+    return "\n".join(lines) + "\n"
+
+
+def build_miter(folder_path: str, base_netlist: str, cand_netlist: str, testbench: str,
+                top: Optional[str] = None) -> List[str]:
+    """
+    Write miter_base.v / miter_cand.v / miter_top.v into folder_path and
+    return the files to compile (before the testbench).  Raises MiterError
+    when the netlists cannot be wrapped.
+    """
+    with open(os.path.join(folder_path, base_netlist), errors="replace") as f:
+        base = f.read()
+    with open(os.path.join(folder_path, cand_netlist), errors="replace") as f:
+        cand = f.read()
+    top = top or find_top(base)
+    ports = top_ports(base, top)
+    if top not in _modules(strip_comments(cand)):
+        raise MiterError(f"candidate netlist has no module {top}")
+
+    timescale = None
+    tb_path = os.path.join(folder_path, testbench)
+    if os.path.isfile(tb_path):
+        with open(tb_path, errors="replace") as f:
+            m = _TIMESCALE_RE.search(f.read())
+        if m:
+            # 与 testbench 的精度一致，MITER_DIFF 的时间以其为单位
+            timescale = m.group(1).replace(" ", "")
+
+    with open(os.path.join(folder_path, BASE_FILE), "w") as f:
+        f.write(rename_modules(base, BASE_PREFIX))
+    with open(os.path.join(folder_path, CAND_FILE), "w") as f:
+        f.write(rename_modules(cand, CAND_PREFIX))
+    with open(os.path.join(folder_path, TOP_FILE), "w") as f:
+        f.write(wrapper(top, ports, timescale))
+    return [TOP_FILE, BASE_FILE, CAND_FILE]
+
+
+def parse_result(stdout: str) -> MiterResult:
+    m = _DIFF_RE.search(stdout)
+    if m is None:
+        return MiterResult(True)
+    return MiterResult(False, *m.groups())
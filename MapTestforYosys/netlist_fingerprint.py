@@ -0,0 +1,90 @@
+"""
+Structural fingerprint of a synthesized netlist (syn_yosys.v / syn_vivado.v).
+
+The netlist is canonicalized before hashing:
+
+    - comments (tool banners, source locations) are removed
+    - (* ... *) attributes are removed
+    - auto-generated names (Yosys $auto$/$abc$ escaped names and _123_ wires,
+      Vivado n_0_0 nets) are renamed in order of first appearance; for Vivado
+      names derived from a user name (x_i_1, x_i_1__0, x_n_2, x_reg__0) only
+      the generated number is renamed, so different cells never merge
+    - whitespace is collapsed
+
+so two runs that only differ in those respects get the same fingerprint.
+A candidate whose fingerprint equals the baseline's passes without being
+simulated; one seen before for the same baseline reuses its recorded verdict.
+"""
+import hashlib
+import re
+import threading
+
+
+_COMMENT_RE = re.compile(r'"(?:\\.|[^"\\])*"|//[^\n]*|/\*.*?\*/', re.S)
+_ATTR_RE = re.compile(r"\(\*.*?\*\)", re.S)
+_AUTO_NAME_RE = re.compile(
+    r"\\\$\S+"                                                       # Yosys escaped $auto$ / $abc$ / $procdff$ names
+    r"|\b_\d+_\b"                                                    # Yosys renamed internal wires
+    r"|\bn_\d+_\d+\b"                                                # Vivado unnamed nets
+    r"|(?P<stem>\b\w+?(?:\[\d+\])?)(?P<kind>_[in]_)\d+(?:__\d+)?\b"  # Vivado cell instances / their output nets
+    r"|(?P<reg>\b\w+_reg(?:\[\d+\])?)__\d+\b"                        # Vivado replicated registers
+)
+
+
+def _strip_comment(m):
+    s = m.group(0)
+    return s if s.startswith('"') else " "
+
+
+def strip_comments(text):
+    """Remove comments and (* ... *) attributes, keeping string literals."""
+    return _ATTR_RE.sub(" ", _COMMENT_RE.sub(_strip_comment, text))
+
+
+def canonicalize(text):
+    text = strip_comments(text)
+    names = {}
+
+    def rename(m):
+        name = m.group(0)
+        if name not in names:
+            # 由用户名派生的名字只替换生成的编号；前缀本身可能含生成的名字（x_i_1_n_0）
+            if m.group("stem") is not None:
+                prefix = _AUTO_NAME_RE.sub(rename, m.group("stem")) + m.group("kind")
+            elif m.group("reg") is not None:
+                prefix = _AUTO_NAME_RE.sub(rename, m.group("reg")) + "__"
+            else:
+                prefix = ""
+            names[name] = f"{prefix}__auto{len(names)}"
+        return names[name]
+
+    text = _AUTO_NAME_RE.sub(rename, text)
+    lines = (" ".join(ln.split()) for ln in text.splitlines())
+    return "\n".join(ln for ln in lines if ln)
+
+
+def fingerprint(path):
+    with open(path, errors="replace") as f:
+        return hashlib.sha256(canonicalize(f.read()).encode()).hexdigest()
+
+
+class SkipStats:
+    """Per-run counters of how each candidate netlist was decided."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.identical = 0      # same as the baseline netlist
+        self.reused = 0         # verdict of an earlier identical candidate
+        self.simulated = 0
+
+    def add(self, how):
+        with self._lock:
+            setattr(self, how, getattr(self, how) + 1)
+
+    def report(self):
+        with self._lock:
+            total = self.identical + self.reused + self.simulated
+            skipped = self.identical + self.reused
+            ratio = skipped / total if total else 0.0
+            return (f"[NETLIST] {total} candidates: identical={self.identical}, reused={self.reused}, "
+                    f"simulated={self.simulated} (skip {ratio:.0%})")
@@ -0,0 +1,214 @@
+"""
+Offline replay of recorded evaluations, for benchmarking search policies.
+
+Tuning uct_c, the iteration budget, the sequence length or the Rewarder
+with real Yosys / Vivado campaigns takes days.  Replay serves recorded
+(command sequence -> faults, timeouts, elapsed) outcomes through the same
+interface as the Evaluate modules (Evaluate_main / Evaluate_cached /
+Evaluate_batch / Evaluate_racing), so the MCTS variants and baselines such
+as random search run against it unchanged, thousands of times per minute.
+
+Records come from the persistent evaluation cache (eval_cache SQLite file,
+full-corpus entries only) or from a JSONL file with one object per line:
+
+    {"command": "...", "faults": 2, "timeouts": 0, "elapsed": 812.5, "fault_ids": ["case17", "case90"]}
+
+fault_ids (optional) name the faults a sequence exposes, e.g. the faulting
+cases; without them every faulting sequence counts as one fault of its own.
+Commands are matched whitespace-insensitively (eval_cache.normalize_command).
+
+A sequence without a record gets the fallback outcome:
+
+    "nearest"   outcome of the recorded sequence sharing the most steps (default)
+    "sample"    outcome of a recorded sequence picked by a hash of the command
+    "zero"      no faults, no timeouts, median recorded elapsed
+    callable    fallback(command) -> (faults, timeouts, elapsed[, fault_ids])
+
+Like the real evaluation cache, only the first evaluation of a sequence costs
+its recorded elapsed time; repeats are returned as cached.  Every real
+evaluation appends (evaluations, simulated seconds, distinct faults) to the
+trajectory, which report() turns into the sample-efficiency summary.
+"""
+import bisect
+import hashlib
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Tuple
+
+import numpy as np
+
+from eval_cache import normalize_command
+
+
+def _steps(command):
+    """Set of commands of a Yosys script (';'-separated) or Tcl snippet (one per line)."""
+    return frozenset(s.strip() for s in re.split(r"[;\n]", command) if s.strip())
+
+
+@dataclass
+class Outcome:
+    faults: int
+    timeouts: int
+    elapsed: float
+    fault_ids: Tuple[str, ...] = field(default=())
+
+
+class Replay:
+
+    def __init__(self, records, fallback="nearest"):
+        """records: {command: Outcome}"""
+        self.records = {}
+        for command, outcome in records.items():
+            command = normalize_command(command)
+            if outcome.faults and not outcome.fault_ids:
+                outcome = Outcome(outcome.faults, outcome.timeouts, outcome.elapsed, (command,))
+            self.records[command] = outcome
+        if not self.records:
+            raise ValueError("replay: no recorded evaluations")
+        self.fallback = fallback
+        self._keys = sorted(self.records)
+        # 最近邻回退用的倒排索引：步骤 -> 含该步骤的记录下标
+        postings = {}
+        for i, c in enumerate(self._keys):
+            for step in _steps(c):
+                postings.setdefault(step, []).append(i)
+        self._postings = {step: np.asarray(ids) for step, ids in postings.items()}
+        self._sizes = np.asarray([len(_steps(c)) for c in self._keys])
+        elapsed = sorted(o.elapsed for o in self.records.values())
+        self._median_elapsed = elapsed[len(elapsed) // 2]
+        self._fallbacks = {}
+        self._lock = threading.Lock()     # 并行搜索从多个线程调用
+        self.reset()
+
+    # ---- 加载 ----
+    @classmethod
+    def from_cache(cls, path, corpus=None, tool=None, fallback="nearest"):
+        """Full-corpus entries of an eval_cache database; by default of its most common (corpus, tool)."""
+        conn = sqlite3.connect(path)
+        try:
+            rows = conn.execute("SELECT command, corpus, tool, faults, timeouts, elapsed FROM evals "
+                                "WHERE corpus NOT LIKE '%|cases:%'").fetchall()
+        finally:
+            conn.close()
+        if corpus is None or tool is None:
+            common = Counter((r[1], r[2]) for r in rows if (corpus is None or r[1] == corpus)
+                             and (tool is None or r[2] == tool)).most_common(1)
+            if common:
+                corpus, tool = common[0][0]
+        return cls({r[0]: Outcome(r[3], r[4], r[5]) for r in rows if r[1] == corpus and r[2] == tool}, fallback)
+
+    @classmethod
+    def from_jsonl(cls, path, fallback="nearest"):
+        records = {}
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                r = json.loads(line)
+                records[r["command"]] = Outcome(int(r["faults"]), int(r["timeouts"]), float(r["elapsed"]),
+                                                tuple(r.get("fault_ids") or ()))
+        return cls(records, fallback)
+
+    @classmethod
+    def load(cls, path, fallback="nearest"):
+        if path.endswith(".jsonl"):
+            return cls.from_jsonl(path, fallback)
+        return cls.from_cache(path, fallback=fallback)
+
+    # ---- 查表 ----
+    def lookup(self, command):
+        """(Outcome, recorded)"""
+        command = normalize_command(command)
+        outcome = self.records.get(command)
+        if outcome is not None:
+            return outcome, True
+        outcome = self._fallbacks.get(command)
+        if outcome is None:
+            outcome = self._fallbacks[command] = self._fallback(command)
+        return outcome, False
+
+    def _fallback(self, command):
+        if callable(self.fallback):
+            r = self.fallback(command)
+            return Outcome(int(r[0]), int(r[1]), float(r[2]), tuple(r[3]) if len(r) > 3 else ())
+        if self.fallback == "zero":
+            return Outcome(0, 0, self._median_elapsed)
+        if self.fallback == "sample":
+            h = int.from_bytes(hashlib.sha256(command.encode()).digest()[:8], "little")
+            return self.records[self._keys[h % len(self._keys)]]
+        if self.fallback == "nearest":
+            # 共同步骤最多者；并列时取多余步骤最少的
+            overlap = np.zeros(len(self._keys), dtype=np.int64)
+            for step in _steps(command):
+                ids = self._postings.get(step)
+                if ids is not None:
+                    overlap[ids] += 1
+            tied = np.flatnonzero(overlap == overlap.max())
+            return self.records[self._keys[tied[self._sizes[tied].argmin()]]]
+        raise ValueError(f"replay: unknown fallback {self.fallback!r}")
+
+    # ---- 回放状态 ----
+    def reset(self):
+        """Start a new replayed campaign (the evaluation cache is empty again)."""
+        self.seen = set()
+        self.found = set()
+        self.evals = 0
+        self.fallback_evals = 0
+        self.wall = 0.0
+        self.trajectory = []        # (evals, simulated seconds, distinct faults)
+
+    def _evaluate(self, command):
+        with self._lock:
+            outcome, recorded = self.lookup(command)
+            key = normalize_command(command)
+            if key in self.seen:
+                return outcome, True
+            self.seen.add(key)
+            self.evals += 1
+            self.fallback_evals += not recorded
+            self.wall += outcome.elapsed
+            self.found.update(outcome.fault_ids)
+            self.trajectory.append((self.evals, self.wall, len(self.found)))
+            return outcome, False
+
+    # ---- 与 Evaluate 模块相同的接口 ----
+    def Evaluate_main(self, new_episode, command_sequence):
+        outcome, _ = self._evaluate(command_sequence)
+        return outcome.faults, outcome.timeouts
+
+    def Evaluate_cached(self, new_episode, command_sequence, elapsed_weight=0.0):
+        # 记录都是完整评估，不会提前结束，elapsed_weight 无影响
+        outcome, cached = self._evaluate(command_sequence)
+        return outcome.faults, outcome.timeouts, outcome.elapsed, cached
+
+    def Evaluate_batch(self, new_episode, command_sequences):
+        return [self.Evaluate_cached(new_episode, c) for c in command_sequences]
+
+    def Evaluate_racing(self, new_episode, command_sequence, promote=None):
+        # 记录只有全集结果，总是完整评估
+        return self.Evaluate_cached(new_episode, command_sequence) + (1.0,)
+
+    # ---- 报告 ----
+    def at(self, evals):
+        """(simulated seconds, distinct faults) after the first `evals` real evaluations."""
+        i = bisect.bisect_right(self.trajectory, (evals, math.inf, math.inf))
+        if i == 0:
+            return 0.0, 0
+        _, wall, found = self.trajectory[i - 1]
+        return wall, found
+
+    def report(self, label="", marks=(0.1, 0.25, 0.5, 1.0)):
+        points = []
+        for frac in marks:
+            n = max(1, int(round(frac * self.evals)))
+            wall, found = self.at(n)
+            points.append(f"{n}:{found}@{wall / 3600:.1f}h")
+        share = self.fallback_evals / self.evals if self.evals else 0.0
+        return (f"[REPLAY] {label + ' ' if label else ''}evals {self.evals}, sim wall {self.wall / 3600:.1f}h, "
+                f"distinct faults {len(self.found)}, fallback {share:.0%}; evals:faults@wall "
+                + " ".join(points))
@@ -0,0 +1,76 @@
+"""
+Benchmark search policies offline against recorded evaluations (replay.Replay),
+without running Yosys.  Every combination of policy / uct_c / iterations /
+sequence length is run for several seeds; reported are the mean real
+evaluations, simulated wall time and distinct faults found after 25%, 50%
+and 100% of the real evaluations of the budget.
+
+    python replay_bench.py eval_cache_yosys.sqlite --policy mcts array random --uct-c 0.7 1.414 --seeds 10
+    python replay_bench.py recorded.jsonl --fallback zero --iters 100 300
+"""
+import argparse
+import contextlib
+import os
+import random
+import time
+
+from MapTset_Yosys_main import MCTS, ArrayMCTS, OptimizationEnvironment, YosysOptimizationActions
+from canonical import Canonicalizer
+from replay import Replay
+
+
+def random_search(env, moves, seq_len, iters, rng):
+    for _ in range(iters):
+        env.evaluate_action([moves[rng.randrange(len(moves))] for _ in range(seq_len)], 0)
+
+
+def run(replay, policy, uct_c, iters, seq_len, seed, transpositions):
+    y_actions = YosysOptimizationActions()
+    env = OptimizationEnvironment(y_actions, evaluator=replay)
+    moves = y_actions.enumerate_all_moves()
+    rng = random.Random(seed)
+    replay.reset()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if policy == "random":
+            random_search(env, moves, seq_len, iters, rng)
+        else:
+            engine_cls = ArrayMCTS if policy == "array" else MCTS
+            mcts = engine_cls(all_moves=moves, sequence_len=seq_len, uct_c=uct_c, iteration_budget=iters, rng=rng,
+                              canonicalizer=Canonicalizer(y_actions) if transpositions else None)
+            mcts.search(env, episode=0)
+    return [replay.at(max(1, iters * q // 4)) for q in (1, 2, 4)], replay.evals
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("records", help="eval_cache SQLite file or .jsonl recordings")
+    ap.add_argument("--fallback", default="nearest", choices=("nearest", "sample", "zero"))
+    ap.add_argument("--policy", nargs="+", default=["mcts", "random"], choices=("mcts", "array", "random"))
+    ap.add_argument("--uct-c", type=float, nargs="+", default=[1.414])
+    ap.add_argument("--iters", type=int, nargs="+", default=[300])
+    ap.add_argument("--seq-len", type=int, nargs="+", default=[9])
+    ap.add_argument("--seeds", type=int, default=5)
+    ap.add_argument("--transpositions", action="store_true")
+    args = ap.parse_args()
+
+    replay = Replay.load(args.records, args.fallback)
+    print(f"[REPLAY] {len(replay.records)} recorded sequences from {args.records}, fallback {args.fallback}")
+    print(f"{'policy':<7} {'uct_c':>6} {'iters':>6} {'len':>4} {'evals':>7} {'sim h':>7} "
+          f"{'faults@25%':>10} {'@50%':>6} {'@100%':>6} {'runs/min':>9}")
+    for policy in args.policy:
+        for uct_c in (args.uct_c if policy != "random" else [float("nan")]):
+            for iters in args.iters:
+                for seq_len in args.seq_len:
+                    t0 = time.perf_counter()
+                    runs = [run(replay, policy, uct_c, iters, seq_len, seed, args.transpositions)
+                            for seed in range(args.seeds)]
+                    per_min = 60 * len(runs) / (time.perf_counter() - t0)
+                    evals = sum(n for _, n in runs) / len(runs)
+                    wall = sum(points[-1][0] for points, _ in runs) / len(runs)
+                    found = [sum(points[i][1] for points, _ in runs) / len(runs) for i in range(3)]
+                    print(f"{policy:<7} {uct_c:>6.3f} {iters:>6} {seq_len:>4} {evals:>7.1f} {wall / 3600:>7.1f} "
+                          f"{found[0]:>10.1f} {found[1]:>6.1f} {found[2]:>6.1f} {per_min:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
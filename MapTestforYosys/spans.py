@@ -0,0 +1,234 @@
+"""
+Structured timing spans of every evaluation (JSONL), and their summary.
+
+The flows open a span around each rollout (one evaluation of a command
+sequence), each diff_check, each case (synth_case / judge_case, i.e. one
+worker slot of the synthesis / simulation pool) and each stage inside it:
+workspace setup, baseline, tool runs (yosys / vivado / iverilog / vvp),
+compare and archive copy.  A closed span is appended to the span file as
+one JSON object:
+
+    {"id": "1a2b-17", "parent": "1a2b-12", "name": "vvp", "start": 1718000000.12, "dur": 0.84,
+     "thread": "sim_3", "outcome": "ok", "kind": "tool", "rc": 0, "cpu_sec": 0.8, "peak_rss_mb": 41.0}
+
+outcome is "ok", the name of the exception that left the span (e.g.
+"TimeoutExpired", "Stalled", "CalledProcessError") or what the flow set
+(e.g. "diff" for a case).  Tool spans carry the exit code and rusage;
+jobs on a persistent Vivado session have no rusage of their own and carry
+rc, wall_sec and cpu_sec / peak_rss_mb = null.
+Parents follow the code that opened a span, also into worker threads when
+the work is handed over with bind().
+
+    MAPTEST_SPANS   span file (default empty: no spans are recorded)
+
+Spans are opt-in: every tool run of every case adds a line, so a long
+campaign on a large corpus writes a large file.  Point MAPTEST_SPANS at a
+file per run (e.g. spans_<date>.jsonl) when profiling.
+
+The summary (two streaming passes over the file, only stage durations and
+the non-tool spans are kept in memory) tells where the wall-clock time goes: p50 / p95 / total per
+stage (tool runs are keyed by their enclosing span, e.g. baseline/yosys vs
+synth_case/yosys), the slowest cases and the idle time of the worker slots
+of every diff_check:
+
+    python spans.py spans.jsonl --top 10
+"""
+import argparse
+import array
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+
+DEFAULT_PATH = os.environ.get("MAPTEST_SPANS", "")
+CASE_SPANS = ("synth_case", "judge_case")
+
+_STACK = contextvars.ContextVar("maptest_span_stack", default=())
+
+
+class Span:
+    __slots__ = ("id", "parent", "name", "attrs")
+
+    def __init__(self, span_id, parent, name, attrs):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Recorder:
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._ids = itertools.count(1)
+        self._prefix = f"{os.getpid():x}"
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        stack = _STACK.get()
+        sp = Span(f"{self._prefix}-{next(self._ids)}", stack[-1] if stack else None, name, attrs)
+        if not self.path:
+            yield sp
+            return
+        token = _STACK.set(stack + (sp.id,))
+        start, t0 = time.time(), time.perf_counter()
+        try:
+            yield sp
+        except BaseException as e:
+            sp.attrs.setdefault("outcome", type(e).__name__)
+            raise
+        finally:
+            _STACK.reset(token)
+            record = {"id": sp.id, "parent": sp.parent, "name": name, "start": round(start, 6),
+                      "dur": round(time.perf_counter() - t0, 6), "thread": threading.current_thread().name,
+                      "outcome": "ok"}
+            record.update(sp.attrs)
+            self._write(record)
+
+    def _write(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                d = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(d, exist_ok=True)
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+RECORDER = Recorder()
+
+
+def span(name, **attrs):
+    """Context manager timing a block as span `name`; yields the Span (set() adds attributes)."""
+    return RECORDER.span(name, **attrs)
+
+
+def bind(fn):
+    """fn, called (from any thread) under the spans open where bind() was called."""
+    ctx = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return bound
+
+
+# ---------- 汇总 ----------
+def iter_records(path):
+    """Span records of a span file, one at a time."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load(path):
+    return list(iter_records(path))
+
+
+def _ancestor(span_id, nodes, name):
+    """Id of the nearest span called name at or above span_id (nodes: id -> (name, parent))."""
+    while span_id is not None and span_id in nodes:
+        node_name, parent = nodes[span_id]
+        if node_name == name:
+            return span_id
+        span_id = parent
+    return None
+
+
+def summarize(path, top=10):
+    # 第一遍：只记下非工具 span（数量远少于工具 span）的名字与父节点，子 span 先于父 span 写出
+    nodes = {}
+    checks = {}
+    for r in iter_records(path):
+        if r.get("kind") != "tool":
+            nodes[r["id"]] = (r["name"], r.get("parent"))
+        if r["name"] == "diff_check":
+            checks[r["id"]] = r["dur"] * (r.get("workers", 1) + r.get("sim_workers", 0)), r["dur"]
+
+    # 第二遍：逐条累计
+    count = 0
+    stages = defaultdict(lambda: array.array("d"))
+    failed = defaultdict(int)
+    cases = defaultdict(float)
+    outcome = {}
+    busy = defaultdict(float)
+    rollouts = cached = 0
+    evaluating = on_hits = 0.0
+    for r in iter_records(path):
+        count += 1
+        parent = nodes.get(r.get("parent"))
+        k = f"{parent[0]}/{r['name']}" if r.get("kind") == "tool" and parent else r["name"]
+        stages[k].append(r["dur"])
+        if r.get("outcome") not in ("ok", "pass"):
+            failed[k] += 1
+        if r["name"] in CASE_SPANS:
+            root = _ancestor(r["id"], nodes, "diff_check")
+            busy[root] += r["dur"]
+            if "case" in r:
+                # 样例耗时：同一次 diff_check 中同一样例的综合段 + 仿真段
+                key = (root, r["case"])
+                cases[key] += r["dur"]
+                if r.get("outcome") != "ok" or key not in outcome:
+                    outcome[key] = r.get("outcome")
+        elif r["name"] == "rollout":
+            rollouts += 1
+            if r.get("cached"):
+                cached += 1
+                on_hits += r["dur"]
+            else:
+                evaluating += r["dur"]
+
+    lines = [f"[SPANS] {count} spans"]
+    width = max(len(k) for k in stages) if stages else 5
+    lines.append(f"{'stage':<{width}} {'n':>7} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'total s':>10} {'not ok':>7}")
+    for k, durs in sorted(stages.items(), key=lambda kv: -sum(kv[1])):
+        d = np.frombuffer(durs, dtype=np.float64)
+        lines.append(f"{k:<{width}} {len(d):>7} {np.percentile(d, 50):>8.2f} {np.percentile(d, 95):>8.2f} "
+                     f"{d.max():>8.2f} {d.sum():>10.1f} {failed[k]:>7}")
+
+    if cases:
+        lines.append(f"[SPANS] slowest of {len(cases)} case evaluations:")
+        for (root, case), dur in sorted(cases.items(), key=lambda kv: -kv[1])[:top]:
+            lines.append(f"  {dur:>8.2f}s  {case}  {outcome[(root, case)]}")
+
+    if checks:
+        capacity = sum(c for c, _ in checks.values())
+        used = sum(busy[i] for i in checks)
+        lines.append(f"[SPANS] {len(checks)} diff_checks, {sum(w for _, w in checks.values()):.1f}s wall, "
+                     f"worker slots {capacity:.1f}s, busy {used:.1f}s, idle {capacity - used:.1f}s "
+                     f"({(capacity - used) / capacity if capacity else 0.0:.0%})")
+
+    if rollouts:
+        lines.append(f"[SPANS] {rollouts} rollouts ({cached} cached), {evaluating:.1f}s evaluating, "
+                     f"{on_hits:.2f}s on cache hits")
+    return "\n".join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("path", nargs="?", default=DEFAULT_PATH or "spans.jsonl")
+    ap.add_argument("--top", type=int, default=10, help="slowest cases to list")
+    args = ap.parse_args()
+    print(summarize(args.path, args.top))
+
+
+if __name__ == "__main__":
+    main()
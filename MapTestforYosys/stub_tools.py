@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Fake yosys / iverilog / vvp / vivado driven by a seeded profile, for
+measuring MapTest's own overhead without the real tools.
+
+One script serves all four tools: it is called as
+
+    python stub_tools.py <tool> <args...>
+
+usually through the small wrappers install() writes to a bin directory that
+is put first on PATH.  The profile comes from MAPTEST_STUB_PROFILE, a
+comma-separated list of key=value:
+
+    seed      0       decides everything below, together with the case name
+    synth     0.02    seconds per yosys candidate / vivado script
+    compile   0.005   seconds per iverilog run
+    sim       0.01    seconds per vvp run
+    spread    0.5     sigma of the per-case log-normal factor on those times
+    crash     0.01    probability that a pass crashes the tool on a case
+    hang      0.005   probability that a pass hangs (sleeps hang_sec, no output)
+    bad       0.02    probability that a pass yields a non-equivalent netlist
+    same      0.3     probability that a candidate netlist equals the baseline's
+    trace     50      lines of simulation output
+    hang_sec  3600
+
+Faults are decided per (case, pass): the same pass on the same case always
+crashes, hangs or miscompiles, like a real tool bug, and the search has
+something to find.  Reading, writing and the default flows of the baseline
+(`synth`, `synth_design -top <top>`) never fault.  The case is the parent of
+the working directory (<case>/equiv_identity_<tool>), as in the MapTest flows.
+
+The vivado fake extends stub_vivado.StubVivado (batch mode and the Tcl
+session protocol of vivado_pool.py) and needs stub_vivado.py next to this
+file.  With MAPTEST_STUB_LOG set, every run appends "<tool>\t<seconds>\t<what>"
+to that file, which is how the benchmarks tell tool time from harness time.
+"""
+import hashlib
+import math
+import os
+import re
+import stat
+import sys
+import time
+
+
+TOOLS = ("yosys", "iverilog", "vvp", "vivado")
+DEFAULTS = {"seed": 0, "synth": 0.02, "compile": 0.005, "sim": 0.01, "spread": 0.5, "crash": 0.01,
+            "hang": 0.005, "bad": 0.02, "same": 0.3, "trace": 50, "hang_sec": 3600}
+BAD_MARK = "maptest_stub_bad"
+_SAFE = re.compile(r"^(?:read_verilog|write_verilog|write_checkpoint|open_checkpoint|close_design|hierarchy|design|"
+                   r"log|cd|source|puts|file|exit|flush)\b|^synth$|^synth_design -top \S+$")
+
+
+def parse_profile(text):
+    profile = dict(DEFAULTS)
+    for item in (text or "").split(","):
+        if item.strip():
+            key, value = item.split("=", 1)
+            key = key.strip()
+            if key not in DEFAULTS:
+                raise ValueError(f"stub profile: unknown key {key!r}")
+            profile[key] = type(DEFAULTS[key])(float(value))
+    return profile
+
+
+def format_profile(profile):
+    return ",".join(f"{k}={v}" for k, v in profile.items())
+
+
+def install(bin_dir, profile=None, log_path=None):
+    """Write yosys / iverilog / vvp / vivado wrappers to bin_dir; returns the environment to run with."""
+    os.makedirs(bin_dir, exist_ok=True)
+    me = os.path.abspath(__file__)
+    for tool in TOOLS:
+        path = os.path.join(bin_dir, tool)
+        with open(path, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{me}" {tool} "$@"\n')
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    env = {"PATH": os.path.abspath(bin_dir) + os.pathsep + os.environ.get("PATH", "")}
+    if profile is not None:
+        env["MAPTEST_STUB_PROFILE"] = format_profile(profile)
+    if log_path is not None:
+        env["MAPTEST_STUB_LOG"] = os.path.abspath(log_path)
+    return env
+
+
+class Profile:
+
+    def __init__(self, tool, text=None):
+        self.p = parse_profile(os.environ.get("MAPTEST_STUB_PROFILE") if text is None else text)
+        self.tool = tool
+        self.start = time.monotonic()
+
+    def case(self):
+        cwd = os.getcwd()
+        return os.path.basename(os.path.dirname(cwd)) if os.path.basename(cwd).startswith("equiv_") \
+            else os.path.basename(cwd)
+
+    def uniform(self, *parts):
+        h = hashlib.blake2b("\0".join(map(str, (self.p["seed"],) + parts)).encode(), digest_size=8).digest()
+        return int.from_bytes(h, "little") / 2 ** 64
+
+    def scale(self):
+        """Log-normal slowness of the current case (Box-Muller on two seeded uniforms)."""
+        u1, u2 = self.uniform("scale-a", self.case()), self.uniform("scale-b", self.case())
+        z = math.sqrt(-2 * math.log(max(u1, 1e-12))) * math.cos(2 * math.pi * u2)
+        return math.exp(self.p["spread"] * z)
+
+    def work(self, what):
+        seconds = self.p[what] * self.scale()
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def fault(self, step):
+        """None, "crash", "hang" or "bad" for one pass / Tcl command on the current case."""
+        step = " ".join(step.split())
+        if not step or _SAFE.search(step):
+            return None
+        u = self.uniform("fault", self.tool, self.case(), step)
+        for kind in ("crash", "hang", "bad"):
+            if u < self.p[kind]:
+                return kind
+            u -= self.p[kind]
+        return None
+
+    def same(self, steps):
+        return self.uniform("same", self.tool, self.case(), "\n".join(sorted(steps))) < self.p["same"]
+
+    def hang(self):
+        self.log("hang")
+        time.sleep(self.p["hang_sec"])
+
+    def log(self, what="ok"):
+        path = os.environ.get("MAPTEST_STUB_LOG")
+        if path:
+            line = f"{self.tool}\t{time.monotonic() - self.start:.6f}\t{what}\n"
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode())
+            finally:
+                os.close(fd)
+
+
+def netlist(rtl, profile, steps, bad, banner="/* Generated by Yosys (stub) */\n"):
+    """The RTL plus an empty module naming the flow (left out when `same`) and the miscompile mark."""
+    text = banner + rtl
+    if steps and not profile.same(steps):
+        tag = hashlib.blake2b("\n".join(sorted(steps)).encode(), digest_size=4).hexdigest()
+        text += f"\nmodule maptest_stub_{tag}; endmodule\n"
+    if bad:
+        text += f"\nmodule {BAD_MARK}; endmodule\n"
+    return text
+
+
+def run_yosys(profile, args):
+    if args[:1] == ["-V"]:
+        print("Yosys 0.30+48 (stub)")
+        return 0
+    script = args[args.index("-p") + 1] if "-p" in args else sys.stdin.read()
+    print(f"-- Running command `{script}' --", flush=True)
+    rtl, saved = None, None
+    steps, bad = [], False
+    for n, step in enumerate(s.strip() for s in script.split(";")):
+        if not step:
+            continue
+        word = step.split()[0]
+        print(f"{n + 1}. Executing {word.upper()} pass.", flush=True)
+        if word == "read_verilog":
+            with open(step.split()[-1]) as f:
+                rtl = f.read()
+        elif step.startswith("design -save"):
+            saved = (list(steps), bad)
+        elif step.startswith("design -load"):
+            steps, bad = list(saved[0]), saved[1]
+        elif word == "log":
+            print(step[len("log"):].strip(), flush=True)
+        elif word == "write_verilog":
+            profile.work("synth")
+            if rtl is None:
+                print("ERROR: No design to write.", flush=True)
+                return 1
+            with open(step.split()[-1], "w") as f:
+                f.write(netlist(rtl, profile, steps, bad))
+        else:
+            kind = profile.fault(step)
+            if kind == "crash":
+                print(f"ERROR: Assert failed in {word} (stub)", flush=True)
+                profile.log("crash")
+                return 134
+            if kind == "hang":
+                profile.hang()
+            bad = bad or kind == "bad"
+            if step != "synth":
+                steps.append(step)
+    profile.log()
+    return 0
+
+
+def run_iverilog(profile, args):
+    if args[:1] == ["-V"]:
+        print("Icarus Verilog version 13.0 (stub)")
+        return 0
+    out = args[args.index("-o") + 1]
+    sources = [a for a in args if a.endswith(".v")]
+    profile.work("compile")
+    with open(out, "w") as f:
+        for src in sources:
+            with open(src) as s:
+                f.write(s.read())
+    profile.log()
+    return 0
+
+
+def run_vvp(profile, args):
+    if args[:1] == ["-V"]:
+        print("Icarus Verilog runtime version 13.0 (stub)")
+        return 0
+    image = [a for a in args if not a.startswith("-")][0]
+    with open(image) as f:
+        text = f.read()
+    profile.work("sim")
+    if "module cand__" in text:
+        # miter：基线与候选并排仿真
+        base, cand = text.split("module cand__", 1)
+        if (BAD_MARK in base) != (BAD_MARK in cand):
+            print("MITER_DIFF t=10 port=y base=0 cand=1")
+        profile.log()
+        return 0
+    flip = profile.p["trace"] // 2 if BAD_MARK in text else -1
+    lines = [f"VCD info: dumpfile {image}.lxt opened for output."]
+    for t in range(profile.p["trace"]):
+        value = int(profile.uniform("trace", profile.case(), t) * 256) ^ (t == flip)
+        lines.append(f"{t * 10} {value:08b}")
+    print("\n".join(lines))
+    profile.log()
+    return 0
+
+
+def run_vivado(profile, args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import stub_vivado
+
+    class ProfiledVivado(stub_vivado.StubVivado):
+        """Applies the profile per sourced script (batch run or session job)."""
+
+        depth = 0
+        steps = []
+        bad = False
+
+        def source(self, path):
+            self.depth += 1
+            try:
+                if self.depth == 1:
+                    # 会话模式下每个作业单独计时
+                    profile.start = time.monotonic()
+                    self.steps, self.bad = [], False
+                    profile.work("synth")
+                super().source(path)
+            finally:
+                self.depth -= 1
+            if self.depth == 0:
+                profile.log()
+
+        def command(self, line):
+            if not line or line.startswith("#"):
+                return None
+            kind = profile.fault(line)
+            if kind == "crash":
+                print(f"Abnormal program termination (stub) in: {line}", flush=True)
+                profile.log("crash")
+                os._exit(139)
+            if kind == "hang":
+                profile.hang()
+            self.bad = self.bad or kind == "bad"
+            step = " ".join(line.split())
+            if not _SAFE.search(step):
+                self.steps.append(step)
+            if step.startswith("write_verilog") and self.design is not None:
+                design = self.design
+                self.design = netlist(design, profile, self.steps, self.bad, banner="")
+                try:
+                    return super().command(line)
+                finally:
+                    self.design = design
+            return super().command(line)
+
+    stub = ProfiledVivado()
+    if "-version" in args:
+        print(stub_vivado.VERSION)
+        return 0
+    mode = args[args.index("-mode") + 1] if "-mode" in args else "gui"
+    if mode == "batch":
+        try:
+            stub.source(args[args.index("-source") + 1])
+        except stub_vivado.TclError as e:
+            print(e, flush=True)
+            return 1
+        return 0
+    return stub.repl()
+
+
+def main(argv):
+    if not argv or argv[0] not in TOOLS:
+        print(f"usage: stub_tools.py {{{'|'.join(TOOLS)}}} args...", file=sys.stderr)
+        return 2
+    tool, args = argv[0], argv[1:]
+    runner = {"yosys": run_yosys, "iverilog": run_iverilog, "vvp": run_vvp, "vivado": run_vivado}[tool]
+    return runner(Profile(tool), args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
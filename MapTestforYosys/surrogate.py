@@ -0,0 +1,124 @@
+"""
+Online surrogate of the rollout reward, used to pre-screen rollouts.
+
+Every real evaluation costs a synthesis + simulation of the whole corpus,
+also for configurations that are obviously close to ones already scored.
+The surrogate is a Bayesian linear regression on one-hot features of the
+sequence (the mains build them: per-position move, plus move counts on
+Yosys), with prior precision alpha on the weights.  The posterior is kept as
+A^-1 = (alpha I + X'X)^-1 and updated by Sherman-Morrison per observation, so
+observe() and scoring a handful of candidates are O(d^2).
+
+Per MCTS iteration the caller completes the selected leaf several times at
+random and asks decide() for a verdict:
+
+  - the candidate with the highest upper bound mean + kappa * std is chosen
+    (most promising or most uncertain);
+  - once min_obs rewards have been observed, a candidate whose upper bound
+    is still below the caller's bar (best reward / worst of top-k) is
+    skipped: the caller backpropagates the predicted mean with a reduced
+    weight instead of evaluating it;
+  - a fraction `audit` of those would-be skips is evaluated anyway, and
+    counts as missed if the real reward reaches the bar, which is what
+    tells whether screening hides faults.
+
+report() gives the online accuracy (error of the prediction made before each
+real evaluation), the screening ratio and the audit result:
+
+    [SURROGATE] 120 obs, mae 0.041, screened 37/160 (23%, ~1850s saved), audits 4 missed 0
+"""
+import math
+import random
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+
+EVAL, SKIP, AUDIT = "eval", "skip", "audit"
+
+
+@dataclass
+class Decision:
+    index: int              # 选中的候选
+    verdict: str            # EVAL / SKIP / AUDIT
+    mean: float             # 预测奖励（评估前）
+    upper: float
+    bar: Optional[float]
+
+
+class Surrogate:
+
+    def __init__(self, n_features, candidates=8, kappa=1.0, min_obs=20, audit=0.1, weight=0.5, alpha=1.0,
+                 rng=None):
+        self.d = n_features
+        self.candidates = candidates
+        self.kappa = kappa
+        self.min_obs = min_obs
+        self.audit = audit
+        self.weight = weight        # 跳过时以预测值回传的权重
+        self.rng = rng or random.Random()
+        self.a_inv = np.eye(n_features) / alpha
+        self.b = np.zeros(n_features)
+        self.w = np.zeros(n_features)
+        self.n = 0
+        self._sq_resid = 0.0
+        self.abs_err = 0.0
+        self.scored = 0             # 带预测的真实评估次数
+        self.decided = 0
+        self.skipped = 0
+        self.audited = 0
+        self.missed = 0
+        self.eval_seconds = 0.0
+
+    def noise(self):
+        """Residual variance of the observed rewards (prior 0.1^2 worth one observation)."""
+        return (self._sq_resid + 0.01) / (self.n + 1)
+
+    def predict(self, X):
+        """(mean, std) per row of X; std is the posterior uncertainty of the mean."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        mean = X @ self.w
+        u = np.einsum("ij,jk,ik->i", X, self.a_inv, X)
+        return mean, np.sqrt(self.noise() * np.maximum(u, 0.0))
+
+    def decide(self, X, bar=None):
+        mean, std = self.predict(X)
+        upper = mean + self.kappa * std
+        i = int(upper.argmax())
+        self.decided += 1
+        verdict = EVAL
+        if self.n >= self.min_obs and bar is not None and upper[i] < bar:
+            verdict = AUDIT if self.rng.random() < self.audit else SKIP
+        return Decision(i, verdict, float(mean[i]), float(upper[i]), bar)
+
+    def skip(self, decision):
+        """The caller skips the real evaluation; returns the reward to backpropagate."""
+        self.skipped += 1
+        return decision.mean
+
+    def observe(self, x, reward, decision=None, seconds=0.0):
+        """Add one real evaluation; decision is the verdict it was evaluated under (if any)."""
+        x = np.asarray(x, dtype=np.float64)
+        pred = float(x @ self.w)
+        if decision is not None:
+            self.scored += 1
+            self.abs_err += abs(pred - reward)
+            self.eval_seconds += seconds
+            if decision.verdict == AUDIT:
+                self.audited += 1
+                if reward >= decision.bar:
+                    self.missed += 1
+        ax = self.a_inv @ x
+        self.a_inv -= np.outer(ax, ax) / (1.0 + x @ ax)
+        self.b += reward * x
+        self.w = self.a_inv @ self.b
+        self._sq_resid += (pred - reward) ** 2
+        self.n += 1
+
+    def report(self):
+        mae = self.abs_err / self.scored if self.scored else math.nan
+        saved = self.skipped * (self.eval_seconds / self.scored if self.scored else 0.0)
+        ratio = self.skipped / self.decided if self.decided else 0.0
+        return (f"[SURROGATE] {self.n} obs, mae {mae:.3f}, screened {self.skipped}/{self.decided} "
+                f"({ratio:.0%}, ~{saved:.0f}s saved), audits {self.audited} missed {self.missed}")
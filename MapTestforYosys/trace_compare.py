@@ -0,0 +1,131 @@
+"""
+In-process replacement for `python3 compare.py`.
+
+Both traces are mmap'ed and compared in fixed-size chunks, with the same
+semantics as compare.py (leading/trailing whitespace is ignored, the traces
+are compared position by position).  When the digest of the baseline trace
+is known, a candidate trace is hashed once and a matching digest ends the
+comparison without reading the baseline at all.
+"""
+import hashlib
+import mmap
+from dataclasses import dataclass
+
+import numpy as np
+
+
+CHUNK_SIZE = 1 << 20
+_WS = frozenset(b" \t\n\r\x0b\x0c")
+
+
+@dataclass
+class CompareResult:
+    match: bool
+    first_offset: int = -1      # 0-based, in the stripped traces
+    first_line: int = -1        # 1-based line of the baseline trace
+    mismatch_count: int = 0
+    baseline_len: int = 0
+    candidate_len: int = 0
+    candidate_digest: str = ""
+    fast_path: bool = False
+
+    def report(self) -> str:
+        if self.match:
+            return "match: traces identical" + (" (digest)" if self.fast_path else "")
+        lines = [f"error: traces differ, {self.mismatch_count} positions"]
+        if self.baseline_len != self.candidate_len:
+            lines.append(f"length: baseline={self.baseline_len} candidate={self.candidate_len}")
+        if self.first_offset >= 0:
+            lines.append(f"first divergence: offset {self.first_offset + 1}, line {self.first_line}")
+        return "\n".join(lines)
+
+    def summary(self) -> str:
+        return f"outputs mismatch at line {self.first_line} ({self.mismatch_count} positions)"
+
+
+class _Trace:
+    """Read-only mmap of a trace plus the bounds of its stripped content."""
+
+    def __init__(self, path):
+        self.f = open(path, "rb")
+        try:
+            self.buf = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            self.buf = b""
+        n = len(self.buf)
+        start = 0
+        while start < n and self.buf[start] in _WS:
+            start += 1
+        end = n
+        while end > start and self.buf[end - 1] in _WS:
+            end -= 1
+        self.start, self.end = start, end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def chunk(self, off, size):
+        lo = self.start + off
+        return self.buf[lo:min(lo + size, self.end)]
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self.f.close()
+
+
+def _digest(trace, chunk_size):
+    h = hashlib.sha256()
+    for off in range(0, len(trace), chunk_size):
+        h.update(trace.chunk(off, chunk_size))
+    return h.hexdigest()
+
+
+def trace_digest(path, chunk_size=CHUNK_SIZE):
+    t = _Trace(path)
+    try:
+        return _digest(t, chunk_size)
+    finally:
+        t.close()
+
+
+def compare_traces(baseline_path, candidate_path, baseline_digest=None, chunk_size=CHUNK_SIZE):
+    cand = _Trace(candidate_path)
+    try:
+        cand_digest = ""
+        if baseline_digest:
+            cand_digest = _digest(cand, chunk_size)
+            if cand_digest == baseline_digest:
+                return CompareResult(True, baseline_len=len(cand), candidate_len=len(cand),
+                                     candidate_digest=cand_digest, fast_path=True)
+
+        base = _Trace(baseline_path)
+        try:
+            n_base, n_cand = len(base), len(cand)
+            common = min(n_base, n_cand)
+            first = -1
+            mismatches = abs(n_base - n_cand)
+            for off in range(0, common, chunk_size):
+                a = base.chunk(off, min(chunk_size, common - off))
+                b = cand.chunk(off, len(a))
+                if a == b:
+                    continue
+                diff = np.frombuffer(a, dtype=np.uint8) != np.frombuffer(b, dtype=np.uint8)
+                if first < 0:
+                    first = off + int(np.flatnonzero(diff)[0])
+                mismatches += int(np.count_nonzero(diff))
+            if first < 0 and n_base != n_cand:
+                first = common
+
+            result = CompareResult(mismatches == 0, mismatch_count=mismatches,
+                                   baseline_len=n_base, candidate_len=n_cand, candidate_digest=cand_digest)
+            if first >= 0:
+                result.first_offset = first
+                result.first_line = 1 + sum(base.chunk(off, min(chunk_size, first - off)).count(b"\n")
+                                            for off in range(0, first, chunk_size))
+            return result
+        finally:
+            base.close()
+    finally:
+        cand.close()